@@ -2,21 +2,84 @@
 Authentication Utilities
 ------------------------
 JWT token generation and password hashing.
+
+Tokens carry the user's id (`uid`) and token version (`ver`), so a request
+can be authenticated without touching the database. Bumping a user's
+version revokes every token issued before it. Signing keys are identified
+by `kid`, which allows rotating keys without logging everyone out.
 """
 
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from jose import JWTError, jwt
 import bcrypt
-from dotenv import load_dotenv
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.config import load_env
+from backend.models import UserTokenVersion
 
-load_dotenv()
+load_env()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
+# Token revocations reach other workers within this many seconds
+TOKEN_VERSION_REFRESH_SECONDS = float(os.getenv("TOKEN_VERSION_REFRESH_SECONDS", "30"))
+# Decoded tokens kept in memory (LRU)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Comma-separated usernames allowed to call the /admin endpoints
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+
+def _load_signing_keys() -> Dict[str, str]:
+    """Parse JWT_SIGNING_KEYS ("kid1:secret1,kid2:secret2"); falls back to SECRET_KEY.
+
+    Tokens without a `kid` are only accepted when a key named "default"
+    exists: implicitly with no JWT_SIGNING_KEYS, or when listed explicitly.
+    """
+    keys = {}
+    for item in os.getenv("JWT_SIGNING_KEYS", "").split(","):
+        kid, _, secret = item.strip().partition(":")
+        if kid and secret:
+            keys[kid] = secret
+    if not keys:
+        keys["default"] = SECRET_KEY
+    return keys
+
+
+SIGNING_KEYS = _load_signing_keys()
+# New tokens are signed with this key; the others stay valid for verification
+ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or next(iter(SIGNING_KEYS))
+if ACTIVE_KID not in SIGNING_KEYS:
+    raise ValueError(f"JWT_ACTIVE_KID '{ACTIVE_KID}' is not in JWT_SIGNING_KEYS")
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Identity of an authenticated request, taken from token claims."""
+    id: int
+    username: str
+
+    @property
+    def is_admin(self) -> bool:
+        return self.username in ADMIN_USERNAMES
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    username: str
+    user_id: int
+    version: int
+    expires_at: float
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -37,17 +100,158 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(
+        to_encode, SIGNING_KEYS[ACTIVE_KID], algorithm=ALGORITHM, headers={"kid": ACTIVE_KID}
+    )
     return encoded_jwt
 
 
-def verify_token(token: str):
-    """Verify JWT token."""
+def create_user_token(db: Session, user, expires_delta: Optional[timedelta] = None) -> str:
+    """Create an access token carrying the user's id and current token version."""
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "ver": get_token_version(db, user.id)},
+        expires_delta=expires_delta
+    )
+
+
+class TokenVersionTable:
+    """In-memory copy of `user_token_versions`, refreshed incrementally."""
+
+    def __init__(self, refresh_seconds: float = TOKEN_VERSION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._versions: Dict[int, int] = {}
+        self._refreshed_at = float("-inf")
+        self._watermark: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self._refreshed_at >= self.refresh_seconds
+
+    def refresh_if_stale(self, db: Session):
+        if not self.stale:
+            return
+        with self._lock:
+            if not self.stale:
+                return
+            query = db.query(UserTokenVersion.user_id, UserTokenVersion.version, UserTokenVersion.updated_at)
+            if self._watermark is not None:
+                # >= so rows written in the same clock tick as the last refresh aren't missed
+                query = query.filter(UserTokenVersion.updated_at >= self._watermark)
+            for user_id, version, updated_at in query:
+                self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+                if updated_at and (self._watermark is None or updated_at > self._watermark):
+                    self._watermark = updated_at
+            self._refreshed_at = time.monotonic()
+
+    def current(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int, version: int):
+        with self._lock:
+            self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+
+
+class TokenCache:
+    """Bounded LRU of decoded tokens, keyed by the token's SHA-256."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, TokenClaims]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[TokenClaims]:
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is not None:
+                self._entries.move_to_end(key)
+            return claims
+
+    def put(self, key: bytes, claims: TokenClaims):
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+token_versions = TokenVersionTable()
+token_cache = TokenCache()
+
+
+def _decode(token: str) -> Optional[TokenClaims]:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        # Tokens issued before key rotation have no kid: only the "default" key applies
+        kid = jwt.get_unverified_header(token).get("kid") or "default"
+        key = SIGNING_KEYS.get(kid)
+        if key is None:
             return None
-        return username
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
     except JWTError:
         return None
+    username = payload.get("sub")
+    # Without `uid` the token can't be checked against revocations
+    if username is None or not isinstance(payload.get("uid"), int):
+        return None
+    return TokenClaims(
+        username=username,
+        user_id=payload["uid"],
+        version=int(payload.get("ver", 0)),
+        expires_at=float(payload.get("exp", 0)),
+    )
+
+
+def decode_token(token: str) -> Optional[TokenClaims]:
+    """Verify a JWT and return its claims, or None if invalid, expired or revoked."""
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = token_cache.get(key)
+    if claims is None:
+        claims = _decode(token)
+        if claims is None:
+            return None
+        token_cache.put(key, claims)
+    if claims.expires_at <= time.time():
+        return None
+    if claims.version < token_versions.current(claims.user_id):
+        return None
+    return claims
+
+
+def verify_token(token: str):
+    """Verify JWT token."""
+    claims = decode_token(token)
+    return claims.username if claims else None
+
+
+def get_token_version(db: Session, user_id: int) -> int:
+    """Current token version for a user, read from the database."""
+    row = db.get(UserTokenVersion, user_id)
+    return row.version if row else 0
+
+
+def _increment_token_version(db: Session, user_id: int) -> Optional[int]:
+    # One UPDATE, so concurrent revocations can't overwrite each other's bump
+    return db.execute(
+        update(UserTokenVersion)
+        .where(UserTokenVersion.user_id == user_id)
+        .values(version=UserTokenVersion.version + 1, updated_at=datetime.utcnow())
+        .returning(UserTokenVersion.version)
+    ).scalar()
+
+
+def revoke_user_tokens(db: Session, user_id: int) -> int:
+    """Invalidate every token issued to a user so far; returns the new version."""
+    version = _increment_token_version(db, user_id)
+    if version is None:
+        try:
+            with db.begin_nested():
+                db.execute(insert(UserTokenVersion).values(
+                    user_id=user_id, version=1, updated_at=datetime.utcnow()
+                ))
+            version = 1
+        except IntegrityError:
+            # A concurrent revocation created the row first
+            version = _increment_token_version(db, user_id)
+    db.commit()
+    token_versions.bump(user_id, version)
+    return version
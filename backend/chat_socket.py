@@ -0,0 +1,329 @@
+"""
+WebSocket Chat Channel
+----------------------
+One long-lived connection per browser tab (`/ws`) instead of a POST per
+message. The client authenticates once and the user is kept for the life
+of the connection, so turns skip the per-request token check. Ownership
+of the conversation is still checked on every turn.
+
+Replies of several conversations stream over the same socket at once.
+Frames are JSON objects tagged with "type"; client-chosen ids tie the
+frames of one turn together:
+
+    client                                   server
+    {"type": "auth", "token": ...}       ->
+                                         <-  {"type": "ready", "user": {...}, "window": 32, ...}
+    {"type": "chat", "id": "a1",         ->
+     "message": ..., "conversation_id": 7}
+                                         <-  {"type": "start", "id": "a1", "conversation_id": 7, "user_message": {...}}
+                                         <-  {"type": "chunk", "id": "a1", "text": ...}   (repeated)
+    {"type": "ack", "id": "a1", "chunks": 16} ->
+                                         <-  {"type": "done", "id": "a1", "conversation_id": 7, "assistant_message": {...}}
+                                         <-  {"type": "error", "id": "a1", "status": 429, "detail": ...}
+    {"type": "cancel", "id": "a1"}       ->
+                                         <-  {"type": "ping"}
+    {"type": "pong"}                     ->
+
+Flow control is per turn and credit based: the server sends at most
+WS_STREAM_WINDOW chunk frames beyond what the client has acked. Text that
+arrives while the window is full is merged and sent as one chunk when
+credit returns; "done" always carries the full reply, so clients that
+never ack still get it. This also bounds the frames queued per
+connection, so a slow reader can't grow server memory beyond its replies.
+
+The server pings every WS_HEARTBEAT_SECONDS. A connection that sends
+nothing (pongs included) for WS_HEARTBEAT_TIMEOUT_SECONDS is closed, and
+its in-flight turns are cancelled and saved like an HTTP client that
+disconnected. The token is re-checked on each heartbeat (in memory, after
+reloading revocations when they are stale), so expired or revoked tokens
+end the connection.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Set
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from backend.config import load_env
+from backend.metrics import registry
+from backend.schemas import ChatRequest
+
+load_env()
+
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "15"))
+WS_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("WS_HEARTBEAT_TIMEOUT_SECONDS", "40"))
+# Chunk frames in flight per turn before the server waits for an ack
+WS_STREAM_WINDOW = int(os.getenv("WS_STREAM_WINDOW", "32"))
+# Turns one connection may have in flight
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", "4"))
+
+CLOSE_INTERNAL_ERROR = 1011
+# Application close codes (4000-4999)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_HEARTBEAT_TIMEOUT = 4408
+
+ws_connections = registry.gauge(
+    "chat_ws_connections",
+    "Open /ws chat connections",
+)
+ws_closed = registry.counter(
+    "chat_ws_closed_total",
+    "/ws connections closed, by reason",
+    {"reason": ["client", "heartbeat", "unauthorized", "error"]},
+)
+
+# Follow-up work started from a connection must outlive it; keep the tasks
+# referenced until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _valid_stream_id(value) -> bool:
+    # Ids key the in-flight turns: only strings and integers (not booleans,
+    # which would collide with 0 and 1)
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def spawn_background(func: Callable[..., Awaitable], *args):
+    """Run `func(*args)` as a task that doesn't belong to any connection."""
+    task = asyncio.get_running_loop().create_task(func(*args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class _Stream:
+    """One in-flight turn and its flow-control window."""
+
+    def __init__(self, connection: "ChatConnection", stream_id, window: int):
+        self.connection = connection
+        self.id = stream_id
+        self.credits = window
+        self.pending = []
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+    async def is_cancelled(self) -> bool:
+        return self.cancelled or self.connection.closed
+
+    def on_text(self, text: str):
+        self.pending.append(text)
+        self.flush()
+
+    def grant(self, chunks: int):
+        self.credits += chunks
+        self.flush()
+
+    def flush(self):
+        if self.pending and self.credits > 0:
+            self.credits -= 1
+            self.connection.send({"type": "chunk", "id": self.id, "text": "".join(self.pending)})
+            self.pending.clear()
+
+
+class ChatConnection:
+    """Serves the /ws protocol for one socket.
+
+    `authenticate(token)` returns the user, or None; `await token_valid(token)`
+    re-checks the token (hitting the database at most once per refresh
+    interval). `run_turn(connection, request, on_start,
+    on_text, is_cancelled)` runs one chat turn, calling
+    `on_start(conversation_id, user_message)` once the user message is
+    saved, and returns the ChatResponse-shaped dict (HTTPException on
+    failure).
+    """
+
+    def __init__(self, websocket: WebSocket, authenticate, run_turn, token_valid: Callable[[str], Awaitable[bool]],
+                 heartbeat: float = WS_HEARTBEAT_SECONDS, heartbeat_timeout: float = WS_HEARTBEAT_TIMEOUT_SECONDS,
+                 window: int = WS_STREAM_WINDOW, max_streams: int = WS_MAX_STREAMS):
+        self.websocket = websocket
+        self.authenticate = authenticate
+        self.run_turn = run_turn
+        self.token_valid = token_valid
+        self.heartbeat = heartbeat
+        self.heartbeat_timeout = heartbeat_timeout
+        self.window = window
+        self.max_streams = max_streams
+        self.user = None
+        self.streams: Dict[object, _Stream] = {}
+        self.closed = False
+        self._token: Optional[str] = None
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._last_seen = time.monotonic()
+        self._close_code: Optional[int] = None
+
+    def send(self, frame: dict):
+        """Queue a frame; the writer task sends frames in order."""
+        if not self.closed:
+            self._outbox.put_nowait(frame)
+
+    async def serve(self):
+        await self.websocket.accept()
+        if not await self._authenticate():
+            return
+        ws_connections.inc()
+        writer = asyncio.create_task(self._write())
+        reader = asyncio.create_task(self._read())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        reason = "client"
+        try:
+            # The heartbeat returns after closing a dead or unauthorized
+            # connection; the reader may never hear back from a dead peer
+            await asyncio.wait({reader, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            if reader.done() and not isinstance(reader.exception(), WebSocketDisconnect):
+                print(f"⚠️ WebSocket connection error: {reader.exception()!r}")
+                reason = "error"
+        finally:
+            if self._close_code == CLOSE_HEARTBEAT_TIMEOUT:
+                reason = "heartbeat"
+            elif self._close_code == CLOSE_UNAUTHORIZED:
+                reason = "unauthorized"
+            self.closed = True
+            reader.cancel()
+            heartbeat.cancel()
+            # In-flight turns see the connection closed, stop their LLM call
+            # and save what arrived, as for a disconnected HTTP client
+            turns = [stream.task for stream in self.streams.values() if stream.task is not None]
+            if turns:
+                await asyncio.gather(*turns, return_exceptions=True)
+            writer.cancel()
+            if reason == "error":
+                # The peer is still connected and would otherwise wait forever
+                await self._close(CLOSE_INTERNAL_ERROR, "Internal error")
+            ws_connections.dec()
+            ws_closed.inc(reason=reason)
+
+    async def _authenticate(self) -> bool:
+        try:
+            frame = json.loads(await asyncio.wait_for(self.websocket.receive_text(), WS_AUTH_TIMEOUT_SECONDS))
+            token = frame.get("token") if isinstance(frame, dict) and frame.get("type") == "auth" else None
+            authenticated = await self.authenticate(token) if isinstance(token, str) else None
+        except WebSocketDisconnect:
+            return False
+        except (asyncio.TimeoutError, ValueError, KeyError):
+            authenticated = None
+        if authenticated is None:
+            ws_closed.inc(reason="unauthorized")
+            await self.websocket.close(code=CLOSE_UNAUTHORIZED, reason="Could not validate credentials")
+            return False
+        self.user = authenticated
+        self._token = token
+        await self.websocket.send_text(json.dumps({
+            "type": "ready",
+            "user": {"id": self.user.id, "username": self.user.username},
+            "window": self.window,
+            "max_streams": self.max_streams,
+            "heartbeat_seconds": self.heartbeat,
+        }))
+        return True
+
+    async def _write(self):
+        try:
+            while True:
+                frame = await self._outbox.get()
+                await self.websocket.send_text(json.dumps(frame, default=_json_default))
+        except (WebSocketDisconnect, RuntimeError):
+            # The socket went away; the reader or heartbeat notices and cleans up
+            self.closed = True
+
+    async def _close(self, code: int, reason: str):
+        self._close_code = code
+        self.closed = True
+        with contextlib.suppress(RuntimeError, WebSocketDisconnect):
+            await self.websocket.close(code=code, reason=reason)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if time.monotonic() - self._last_seen > self.heartbeat_timeout:
+                await self._close(CLOSE_HEARTBEAT_TIMEOUT, "Heartbeat timeout")
+                return
+            if not await self.token_valid(self._token):
+                await self._close(CLOSE_UNAUTHORIZED, "Token expired or revoked")
+                return
+            self.send({"type": "ping"})
+
+    async def _read(self):
+        while True:
+            text = await self.websocket.receive_text()
+            self._last_seen = time.monotonic()
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                self.send({"type": "error", "id": None, "status": 400, "detail": "Frames must be JSON"})
+                continue
+            if not isinstance(frame, dict):
+                self.send({"type": "error", "id": None, "status": 400, "detail": "Frames must be JSON objects"})
+                continue
+            kind = frame.get("type")
+            stream_id = frame.get("id")
+            if stream_id is not None and not _valid_stream_id(stream_id):
+                self.send({"type": "error", "id": None, "status": 400, "detail": "Frame ids must be strings or integers"})
+                continue
+            stream = self.streams.get(stream_id)
+            if kind == "chat":
+                self._start_turn(frame)
+            elif kind == "ack":
+                if stream is not None and isinstance(frame.get("chunks"), int) and frame["chunks"] > 0:
+                    stream.grant(frame["chunks"])
+            elif kind == "cancel":
+                if stream is not None:
+                    stream.cancelled = True
+            elif kind == "pong":
+                pass
+            else:
+                self.send({"type": "error", "id": stream_id, "status": 400,
+                           "detail": f"Unknown frame type {kind!r}"})
+
+    def _start_turn(self, frame: dict):
+        stream_id = frame.get("id")
+        if not _valid_stream_id(stream_id) or stream_id in self.streams:
+            self.send({"type": "error", "id": stream_id, "status": 400,
+                       "detail": "Each chat frame needs an id not already in flight"})
+            return
+        if len(self.streams) >= self.max_streams:
+            self.send({"type": "error", "id": stream_id, "status": 429,
+                       "detail": f"At most {self.max_streams} replies in flight per connection"})
+            return
+        try:
+            request = ChatRequest(**{key: value for key, value in frame.items() if key not in ("type", "id")})
+        except (TypeError, ValidationError) as e:
+            self.send({"type": "error", "id": stream_id, "status": 422, "detail": str(e)})
+            return
+        stream = _Stream(self, stream_id, self.window)
+        self.streams[stream_id] = stream
+        stream.task = asyncio.create_task(self._run_turn(stream, request))
+
+    async def _run_turn(self, stream: _Stream, request: ChatRequest):
+        def on_start(conversation_id: int, user_message: dict):
+            self.send({
+                "type": "start", "id": stream.id, "conversation_id": conversation_id,
+                "user_message": user_message,
+            })
+
+        try:
+            response = await self.run_turn(self, request, on_start, stream.on_text, stream.is_cancelled)
+            self.send({
+                "type": "done", "id": stream.id, "conversation_id": response["conversation_id"],
+                "assistant_message": response["assistant_message"],
+            })
+        except HTTPException as e:
+            frame = {"type": "error", "id": stream.id, "status": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                frame["retry_after"] = int(e.headers["Retry-After"])
+            self.send(frame)
+        except Exception as e:
+            print(f"❌ WebSocket chat turn failed: {e!r}")
+            self.send({"type": "error", "id": stream.id, "status": 500, "detail": "Internal error"})
+        finally:
+            del self.streams[stream.id]
+
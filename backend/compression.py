@@ -0,0 +1,73 @@
+"""
+Response Compression
+--------------------
+Brotli when the client takes it (and the `brotli` package is installed),
+gzip otherwise, on top of Starlette's responders so both skip small
+bodies, partial responses and the media types in `exclude_content_types`.
+
+Already-compressed media are excluded: compressing a zip or a JPEG again
+only costs CPU and can make it larger.
+"""
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+from backend.static_assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip covers every browser
+    brotli = None
+
+# Starlette's list (zip, gzip, images, audio, video, fonts) plus the other
+# archive formats clients may upload or download
+COMPRESSED_CONTENT_TYPES = DEFAULT_EXCLUDED_CONTENT_TYPES + (
+    "application/x-7z-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zstd",
+)
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int, exclude_content_types: tuple):
+        super().__init__(app, minimum_size, exclude_content_types=exclude_content_types)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality, mode=brotli.MODE_TEXT)
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        brotli_quality: int = 4,
+        exclude_content_types: tuple = COMPRESSED_CONTENT_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.brotli_quality = brotli_quality
+        self.exclude_content_types = exclude_content_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encodings = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        if brotli is not None and encodings.get("br", 0) > 0:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality, self.exclude_content_types)
+        elif encodings.get("gzip", 0) > 0:
+            responder = GZipResponder(self.app, self.minimum_size, exclude_content_types=self.exclude_content_types)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size, exclude_content_types=self.exclude_content_types)
+        await responder(scope, receive, send)
@@ -0,0 +1,26 @@
+"""
+Environment Configuration
+-------------------------
+Loads the project's .env file once per process.
+"""
+
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+env_path = project_root / ".env"
+
+_loaded = False
+
+
+def load_env():
+    """Load variables from the project-root .env (only the first call does work).
+
+    Variables already set in the real environment take precedence, so
+    deployments (Vercel, containers) can override the file.
+    """
+    global _loaded
+    if _loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=env_path)
+    _loaded = True
@@ -0,0 +1,220 @@
+"""
+Gemini Context Caching
+----------------------
+Registers the stable prefix of a conversation (system prompt plus older
+history) as a cached context, so later turns only send the new messages.
+"""
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from typing import Dict, List, Optional
+from backend.config import load_env
+from backend.shared_state import SharedState, get_shared_state
+
+load_env()
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+CONTEXT_CACHE_PROVIDER = os.getenv("CONTEXT_CACHE_PROVIDER", "gemini")  # 'gemini' or 'fake'
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Gemini rejects cached contents below a model-specific token minimum
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# Re-register the prefix once this many messages have piled up after it
+CONTEXT_CACHE_REFRESH_MESSAGES = int(os.getenv("CONTEXT_CACHE_REFRESH_MESSAGES", "20"))
+# Treat entries this close to expiry as already gone
+EXPIRY_MARGIN_SECONDS = 30
+
+
+def estimate_tokens(system_instruction: str, messages: List[Dict[str, str]]) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    chars = len(system_instruction) + sum(len(m["content"]) for m in messages)
+    return chars // 4
+
+
+@dataclass
+class CachedPrefix:
+    """A registered prefix for one conversation."""
+    name: str              # Provider handle, e.g. "cachedContents/abc123"
+    last_message_id: int   # Newest message included in the prefix
+    message_count: int     # Messages in the conversation when registered
+    expires_at: float      # time.time() when the provider drops it
+
+    def is_live(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now < self.expires_at - EXPIRY_MARGIN_SECONDS
+
+
+class ContextCacheProvider:
+    """Interface for a service that can hold a cached prompt prefix."""
+
+    def create(self, model: str, system_instruction: str,
+               messages: List[Dict[str, str]], ttl_seconds: int) -> str:
+        """Register a prefix and return its handle."""
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        """Drop a previously registered prefix."""
+        raise NotImplementedError
+
+
+class GeminiContextCacheProvider(ContextCacheProvider):
+    """Context caching through the google-generativeai `caching` API."""
+
+    def __init__(self, api_key: str):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+
+    def create(self, model, system_instruction, messages, ttl_seconds):
+        from google.generativeai import caching
+
+        contents = [
+            {"role": "user" if m["role"] == "user" else "model", "parts": [m["content"]]}
+            for m in messages
+        ]
+        cached = caching.CachedContent.create(
+            model=f"models/{model}",
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=timedelta(seconds=ttl_seconds),
+        )
+        return cached.name
+
+    def delete(self, name):
+        from google.generativeai import caching
+        caching.CachedContent.get(name).delete()
+
+
+class FakeContextCacheProvider(ContextCacheProvider):
+    """In-process stand-in for offline runs; records every registered prefix."""
+
+    def __init__(self):
+        self.contexts: Dict[str, dict] = {}
+        self.created = 0
+        self.deleted = 0
+
+    def create(self, model, system_instruction, messages, ttl_seconds):
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        self.contexts[name] = {
+            "model": model,
+            "system_instruction": system_instruction,
+            "messages": list(messages),
+            "ttl_seconds": ttl_seconds,
+        }
+        return name
+
+    def delete(self, name):
+        if self.contexts.pop(name, None) is not None:
+            self.deleted += 1
+
+
+class ContextCacheManager:
+    """Tracks the cached prefix handle and TTL per conversation.
+
+    Entries live in the shared state store so every worker reuses the same
+    cached prefix.
+    """
+
+    def __init__(
+        self,
+        provider: ContextCacheProvider,
+        ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+        min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+        refresh_messages: int = CONTEXT_CACHE_REFRESH_MESSAGES,
+        state: Optional[SharedState] = None,
+    ):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.refresh_messages = refresh_messages
+        self.state = state if state is not None else get_shared_state()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _entry_key(conversation_id: int) -> str:
+        return f"ctxcache:{conversation_id}"
+
+    @staticmethod
+    def _attempt_key(conversation_id: int) -> str:
+        # Message count at the last registration attempt, including too-small prefixes
+        return f"ctxcache:attempt:{conversation_id}"
+
+    def _get_entry(self, conversation_id: int) -> Optional[CachedPrefix]:
+        raw = self.state.get(self._entry_key(conversation_id))
+        if raw is None:
+            return None
+        entry = CachedPrefix(**json.loads(raw))
+        return entry if entry.is_live() else None
+
+    def lookup(self, conversation_id: int) -> Optional[CachedPrefix]:
+        """Return the live prefix for a conversation, or None."""
+        entry = self._get_entry(conversation_id)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def should_refresh(self, conversation_id: int, message_count: int) -> bool:
+        """Whether enough new messages exist to (re-)register the prefix."""
+        entry = self._get_entry(conversation_id)
+        if entry is not None:
+            baseline = entry.message_count
+        else:
+            baseline = int(self.state.get(self._attempt_key(conversation_id)) or 0)
+        return message_count - baseline >= self.refresh_messages
+
+    def register(
+        self,
+        conversation_id: int,
+        model: str,
+        system_instruction: str,
+        messages: List[Dict],
+    ) -> Optional[CachedPrefix]:
+        """Register `messages` (chronological, each with an 'id') as the prefix.
+
+        Returns None when the prefix is too small to be worth caching.
+        """
+        self.state.set(self._attempt_key(conversation_id), str(len(messages)), ttl=self.ttl_seconds)
+        if not messages or estimate_tokens(system_instruction, messages) < self.min_tokens:
+            return None
+
+        previous = self._get_entry(conversation_id)
+        name = self.provider.create(model, system_instruction, messages, self.ttl_seconds)
+        entry = CachedPrefix(
+            name=name,
+            last_message_id=messages[-1]["id"],
+            message_count=len(messages),
+            expires_at=time.time() + self.ttl_seconds,
+        )
+        self.state.set(self._entry_key(conversation_id), json.dumps(asdict(entry)), ttl=self.ttl_seconds)
+        if previous is not None:
+            self._delete_quietly(previous.name)
+        return entry
+
+    def forget(self, conversation_id: int) -> None:
+        """Drop the prefix for a deleted conversation."""
+        entry = self._get_entry(conversation_id)
+        self.state.delete(self._entry_key(conversation_id))
+        self.state.delete(self._attempt_key(conversation_id))
+        if entry is not None:
+            self._delete_quietly(entry.name)
+
+    def _delete_quietly(self, name: str) -> None:
+        # The provider expires it anyway; a failed delete only costs storage until TTL
+        try:
+            self.provider.delete(name)
+        except Exception as e:
+            print(f"⚠️ Failed to delete cached context {name}: {e}")
+
+
+def build_context_cache(api_key: Optional[str]) -> Optional[ContextCacheManager]:
+    """Create the manager configured by environment, or None when disabled."""
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    if CONTEXT_CACHE_PROVIDER == "fake":
+        return ContextCacheManager(FakeContextCacheProvider())
+    return ContextCacheManager(GeminiContextCacheProvider(api_key))
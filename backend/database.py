@@ -1,21 +1,47 @@
 """
 Database Connection and Session Management
 -------------------------------------------
+Writes go to the primary (DATABASE_URL). Read-heavy routes can be served
+by read replicas listed in REPLICA_DATABASE_URLS:
+
+- a user who wrote within the last REPLICA_STICKY_SECONDS reads from the
+  primary, so they always see their own writes;
+- a background check measures each replica's lag and stops routing to
+  replicas that fall more than REPLICA_MAX_LAG_SECONDS behind (or fail);
+- with no healthy replica, reads fall back to the primary.
 """
 
+import itertools
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-from backend.models import Base
+import threading
+import time
+from typing import List, Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from backend.config import load_env
+from backend.metrics import registry
+from backend.shared_state import SharedState, get_shared_state
 
-load_dotenv()
+load_env()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://ferozshaik@localhost:5432/chatbot_db")
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+# Never shorter than the lag we tolerate, or a user could read past their own write
+REPLICA_STICKY_SECONDS = max(float(os.getenv("REPLICA_STICKY_SECONDS", "10")), REPLICA_MAX_LAG_SECONDS)
 
 engine = create_engine(DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_sessions = registry.counter(
+    "db_read_sessions_total",
+    "Sessions opened for read-only routes, by where they were sent",
+    {"target": ["primary", "replica"]},
+)
+
 
 def get_db():
     """Dependency for database session."""
@@ -27,5 +53,153 @@ def get_db():
 
 
 def init_db():
-    """Create all tables."""
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date by applying pending migrations."""
+    from backend.migrations import upgrade
+    upgrade(engine)
+
+
+def is_replica(session: Session) -> bool:
+    """True for sessions bound to a read replica (which must not be written to)."""
+    return "replica" in session.info
+
+
+def measure_lag(replica_engine: Engine) -> float:
+    """Seconds the replica is behind its primary (0 when that can't be measured)."""
+    with replica_engine.connect() as conn:
+        if replica_engine.dialect.name == "postgresql":
+            # Caught up when everything received has been replayed; NULL off a standby
+            lag = conn.execute(text(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )).scalar()
+            return float(lag or 0)
+        # No replication to inspect (e.g. a local SQLite copy): just check it answers
+        conn.execute(text("SELECT 1"))
+        return 0.0
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(url, echo=False)
+        self.sessionmaker = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine, info={"replica": self.name}
+        )
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def check(self, max_lag: float):
+        try:
+            self.lag = measure_lag(self.engine)
+            self.error = None
+            self.healthy = self.lag <= max_lag
+        except Exception as e:
+            self.lag, self.error, self.healthy = None, str(e), False
+
+
+class ReadRouter:
+    """Chooses the database for read-only sessions."""
+
+    def __init__(self, replicas: List[Replica], sticky_seconds: float = REPLICA_STICKY_SECONDS,
+                 max_lag: float = REPLICA_MAX_LAG_SECONDS, check_interval: float = REPLICA_LAG_CHECK_SECONDS,
+                 state: Optional[SharedState] = None):
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._state = state
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.checked_at: Optional[float] = None
+
+    @property
+    def state(self) -> SharedState:
+        if self._state is None:
+            self._state = get_shared_state()
+        return self._state
+
+    @staticmethod
+    def _write_key(user_id: int) -> str:
+        return f"db:recent_write:{user_id}"
+
+    def mark_write(self, user_id: int):
+        """Pin the user's reads to the primary for the sticky window."""
+        if self.replicas:
+            self.state.set(self._write_key(user_id), "1", ttl=self.sticky_seconds)
+
+    def session_for_read(self, user_id: Optional[int] = None) -> Session:
+        healthy = [r for r in self.replicas if r.healthy]
+        if healthy and not (user_id is not None and self.state.get(self._write_key(user_id))):
+            read_sessions.inc(target="replica")
+            return healthy[next(self._next) % len(healthy)].sessionmaker()
+        read_sessions.inc(target="primary")
+        return SessionLocal()
+
+    def check_replicas(self):
+        for replica in self.replicas:
+            was_healthy = replica.healthy
+            replica.check(self.max_lag)
+            if not replica.healthy and (was_healthy or self.checked_at is None):
+                reason = replica.error or f"lag {replica.lag:.1f}s"
+                print(f"⚠️ Replica {replica.name} out of rotation: {reason}")
+        self.checked_at = time.time()
+
+    def start(self):
+        """Check replicas now, then keep checking in a background thread."""
+        if not self.replicas or self._thread is not None:
+            return
+        self.check_replicas()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-lag-check", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check_replicas()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.check_interval)
+            self._thread = None
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {"name": r.name, "healthy": r.healthy, "lag_seconds": r.lag, "error": r.error}
+            for r in self.replicas
+        ]
+
+
+read_router = ReadRouter([Replica(url) for url in REPLICA_DATABASE_URLS])
+
+
+# Primary sessions remember whether they wrote; committing a write on
+# behalf of a user (session.info["user_id"]) starts their sticky window
+@event.listens_for(SessionLocal, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _committed(session):
+    if session.info.pop("wrote", False) and session.info.get("user_id") is not None:
+        read_router.mark_write(session.info["user_id"])
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
+
+
+if __name__ == "__main__":
+    # Run once per deploy (same as `python -m backend.migrations upgrade`)
+    init_db()
+    print("✅ Database initialized")
@@ -0,0 +1,154 @@
+"""
+Google Sign-In Verification
+---------------------------
+Verifies Google ID tokens against a process-wide cache of Google's signing
+certificates, so logins don't re-download them on every call.
+
+The cache honors the `Cache-Control: max-age` of the certs endpoint and
+refreshes in a background thread before the certificates expire.
+"""
+
+import base64
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+from backend.config import load_env
+
+load_env()
+
+GOOGLE_CLIENT_ID = os.getenv(
+    "GOOGLE_CLIENT_ID",
+    "479578758374-vk1v6l46q7tpi6vcobho2ljnrdnh2h3j.apps.googleusercontent.com"
+)
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# Used when the endpoint sends no max-age
+DEFAULT_MAX_AGE_SECONDS = 3600
+# Refresh once this fraction of max-age has passed
+REFRESH_AT_FRACTION = 0.8
+# Background refresh retry delay after a failure
+RETRY_SECONDS = 60
+# Minimum gap between forced refreshes for unknown key ids
+FORCED_REFRESH_INTERVAL_SECONDS = 60
+
+
+def parse_max_age(cache_control: str) -> Optional[int]:
+    """Extract max-age (seconds) from a Cache-Control header."""
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else None
+
+
+def unverified_key_id(token: str) -> Optional[str]:
+    """Read the `kid` from a JWT header without verifying anything."""
+    try:
+        header = token.split(".", 1)[0]
+        header += "=" * (-len(header) % 4)
+        return json.loads(base64.urlsafe_b64decode(header)).get("kid")
+    except (ValueError, IndexError):
+        return None
+
+
+class GoogleCertCache:
+    """Google's token-signing certificates, shared by every request in the process."""
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL, session=None):
+        self.url = url
+        self._session = session
+        self._certs: Optional[Dict[str, str]] = None
+        self._expires_at = 0.0
+        self._last_forced_refresh = float("-inf")
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self.fetches = 0
+
+    @property
+    def session(self):
+        # Pooled keep-alive connections; requests is only imported on first use
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+            self._session = session
+        return self._session
+
+    def get(self) -> Dict[str, str]:
+        """Return current certificates, fetching synchronously only if none are valid."""
+        if self._certs is not None and time.time() < self._expires_at:
+            return self._certs
+        with self._lock:
+            if self._certs is None or time.time() >= self._expires_at:
+                self._fetch()
+            return self._certs
+
+    def refresh_for_unknown_key(self, kid: Optional[str]) -> Dict[str, str]:
+        """Refetch early when a token is signed by a key we haven't seen (rate limited)."""
+        with self._lock:
+            if kid and self._certs is not None and kid in self._certs:
+                return self._certs
+            if time.monotonic() - self._last_forced_refresh >= FORCED_REFRESH_INTERVAL_SECONDS:
+                self._last_forced_refresh = time.monotonic()
+                self._fetch()
+            return self._certs
+
+    def _fetch(self):
+        response = self.session.get(self.url, timeout=10)
+        response.raise_for_status()
+        certs = response.json()
+        max_age = parse_max_age(response.headers.get("Cache-Control", ""))
+        if max_age is None:
+            max_age = DEFAULT_MAX_AGE_SECONDS
+        self._certs = certs
+        self._expires_at = time.time() + max_age
+        self.fetches += 1
+        self._schedule(max_age * REFRESH_AT_FRACTION)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._fetch()
+        except Exception as e:
+            # Keep serving the current certs until they expire
+            print(f"⚠️ Google cert refresh failed, retrying in {RETRY_SECONDS}s: {e}")
+            self._schedule(RETRY_SECONDS)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+cert_cache = GoogleCertCache()
+
+
+def verify_google_id_token(token: str, audience: str = GOOGLE_CLIENT_ID,
+                           cache: GoogleCertCache = cert_cache) -> dict:
+    """Verify a Google ID token and return its claims.
+
+    Raises ValueError for invalid, expired or wrongly-addressed tokens.
+    """
+    from google.auth import jwt as google_jwt
+
+    certs = cache.get()
+    kid = unverified_key_id(token)
+    if kid is None or kid not in certs:
+        # Google may have rotated keys before our copy expired
+        certs = cache.refresh_for_unknown_key(kid)
+
+    idinfo = google_jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=10)
+    if idinfo.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {idinfo.get('iss')}")
+    return idinfo
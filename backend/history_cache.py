@@ -0,0 +1,218 @@
+"""
+Hot History Cache
+-----------------
+Keeps the most recent messages of active conversations in memory, so chat
+turns and history reads don't re-query what this process just wrote.
+
+Each conversation holds a bounded ring of its latest messages; whole
+conversations are evicted least-recently-used once the total count or the
+approximate memory footprint exceeds its limit. A per-conversation version
+counter in shared state lets workers notice writes made by other workers.
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+from backend.config import load_env
+from backend.shared_state import SharedState, get_shared_state
+
+load_env()
+
+HISTORY_CACHE_MESSAGES = int(os.getenv("HISTORY_CACHE_MESSAGES", "50"))
+HISTORY_CACHE_MAX_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_MAX_CONVERSATIONS", "10000"))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rough per-message overhead of the dict, datetime and deque slot
+MESSAGE_OVERHEAD_BYTES = 300
+
+
+def message_size(message: dict) -> int:
+    return MESSAGE_OVERHEAD_BYTES + len(message["content"]) + len(message.get("html") or "")
+
+
+class _Entry:
+    __slots__ = ("user_id", "messages", "whole", "version", "size")
+
+    def __init__(self, user_id: int, whole: bool, version: int):
+        self.user_id = user_id
+        self.messages: Deque[dict] = deque()
+        # True while the ring holds every message of the conversation
+        self.whole = whole
+        self.version = version
+        self.size = 0
+
+
+class HistoryCache:
+    """Per-conversation ring buffers of recent messages with global LRU eviction.
+
+    Messages are dicts with id, role, content and timestamp, in
+    chronological order.
+    """
+
+    def __init__(
+        self,
+        ring_size: int = HISTORY_CACHE_MESSAGES,
+        max_conversations: int = HISTORY_CACHE_MAX_CONVERSATIONS,
+        max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+        state: Optional[SharedState] = None,
+    ):
+        self.ring_size = ring_size
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.state = state if state is not None else get_shared_state()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(conversation_id: int) -> str:
+        return f"history:version:{conversation_id}"
+
+    def _shared_version(self, conversation_id: int) -> int:
+        return int(self.state.get(self._version_key(conversation_id)) or 0)
+
+    def _bump_version(self, conversation_id: int) -> int:
+        return self.state.incr(self._version_key(conversation_id))
+
+    def _current_entry(self, conversation_id: int) -> Optional[_Entry]:
+        """Entry if present and not outdated by another worker's write (lock held)."""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if self.state.is_shared and entry.version != self._shared_version(conversation_id):
+            self._drop(conversation_id)
+            return None
+        self._entries.move_to_end(conversation_id)
+        return entry
+
+    def _drop(self, conversation_id: int):
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _push(self, entry: _Entry, message: dict):
+        if len(entry.messages) >= self.ring_size:
+            entry.size -= message_size(entry.messages.popleft())
+            entry.whole = False
+        entry.messages.append(message)
+        entry.size += message_size(message)
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_conversations or self.size > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+
+    def start(self, conversation_id: int, user_id: int):
+        """Track a conversation that was just created (and is therefore empty)."""
+        with self._lock:
+            self._drop(conversation_id)
+            version = self._shared_version(conversation_id)
+            self._entries[conversation_id] = _Entry(user_id, whole=True, version=version)
+            self._evict()
+
+    def version(self, conversation_id: int) -> int:
+        """Version to pass to `fill`; read it before querying the database."""
+        return self._shared_version(conversation_id)
+
+    def fill(self, conversation_id: int, user_id: int, recent: List[dict], version: int):
+        """Load the cache from the database.
+
+        `recent` must be the newest `ring_size` messages (or all of them, if
+        fewer), in chronological order, read after `version` was taken.
+        """
+        with self._lock:
+            self._drop(conversation_id)
+            entry = _Entry(user_id, whole=len(recent) < self.ring_size, version=version)
+            for message in recent[-self.ring_size:]:
+                entry.messages.append(message)
+                entry.size += message_size(message)
+            self._entries[conversation_id] = entry
+            self.size += entry.size
+            self._evict()
+
+    def append(self, conversation_id: int, message: dict):
+        """Write-through for a message just committed to the database."""
+        with self._lock:
+            version = self._bump_version(conversation_id)
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            if version != entry.version + 1:
+                # Another worker wrote in between; our copy has a gap
+                self._drop(conversation_id)
+                return
+            before = entry.size
+            self._push(entry, message)
+            entry.version = version
+            self.size += entry.size - before
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+
+    def recent(self, conversation_id: int, user_id: int, limit: Optional[int] = None) -> Optional[List[dict]]:
+        """Newest `limit` messages (all of them if None), or None when not cached.
+
+        Returns None as well when the conversation belongs to another user,
+        so callers fall back to the database's ownership check.
+        """
+        with self._lock:
+            entry = self._current_entry(conversation_id)
+            if entry is None or entry.user_id != user_id:
+                self.misses += 1
+                return None
+            if limit is None:
+                if not entry.whole:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return list(entry.messages)
+            if not entry.whole and len(entry.messages) < limit:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return list(entry.messages)[-limit:] if limit else []
+
+    def messages_after(self, conversation_id: int, user_id: int, after_id: int) -> Optional[List[dict]]:
+        """All cached messages with id > after_id, if the ring reaches back that far."""
+        with self._lock:
+            entry = self._current_entry(conversation_id)
+            if entry is None or entry.user_id != user_id:
+                self.misses += 1
+                return None
+            if not entry.whole and (not entry.messages or entry.messages[0]["id"] > after_id):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [m for m in entry.messages if m["id"] > after_id]
+
+    def replace(self, conversation_id: int, messages: List[dict]):
+        """Swap cached messages for updated copies (same ids), e.g. with "html" added.
+
+        The copies count toward the memory limit like any cached message.
+        """
+        updated = {m["id"]: m for m in messages}
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            before = entry.size
+            for index, cached in enumerate(entry.messages):
+                message = updated.get(cached["id"])
+                if message is not None and message is not cached:
+                    entry.size += message_size(message) - message_size(cached)
+                    entry.messages[index] = message
+            self.size += entry.size - before
+            self._evict()
+
+    def invalidate(self, conversation_id: int):
+        """Forget a conversation here and in every other worker (delete/rename)."""
+        with self._lock:
+            self._bump_version(conversation_id)
+            self._drop(conversation_id)
+
+
+history_cache = HistoryCache()
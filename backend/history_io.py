@@ -0,0 +1,277 @@
+"""
+Chat History Export and Import
+------------------------------
+Streams a user's whole chat history as NDJSON (optionally inside a zip)
+and loads such files back in bulk.
+
+Export reads each conversation's messages through a server-side cursor
+(`yield_per`), so memory stays flat however long the history is. Import
+inserts messages in batches: COPY on PostgreSQL (psycopg2), multi-row
+INSERTs elsewhere.
+
+File format, one JSON object per line:
+
+    {"type": "export", "version": 1, "username": ..., "exported_at": ...}
+    {"type": "conversation", "id": 7, "title": ..., "created_at": ..., "updated_at": ...}
+    {"type": "message", "conversation_id": 7, "role": "user", "content": ..., "timestamp": ..., "finish_reason": null}
+
+Messages follow the conversation they belong to; ids only link the two
+and are reassigned on import.
+"""
+
+import csv
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from backend.config import load_env
+from backend.database import SessionLocal
+from backend.models import Conversation, ChatMessage
+
+load_env()
+
+EXPORT_FORMAT_VERSION = 1
+# Rows fetched per round trip while exporting
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Messages per INSERT/COPY while importing
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Bytes collected before a chunk is sent to the client
+STREAM_CHUNK_BYTES = 64 * 1024
+ZIP_MEMBER_NAME = "chat-history.ndjson"
+MESSAGE_ROLES = ("user", "assistant")
+
+
+class ImportFormatError(ValueError):
+    """The uploaded file is not a valid export; nothing was imported."""
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _line(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def export_lines(user_id: int, username: str,
+                 session_factory: Callable[[], Session] = SessionLocal) -> Iterator[bytes]:
+    """NDJSON lines of every conversation of the user, oldest first."""
+    db = session_factory()
+    try:
+        yield _line({
+            "type": "export",
+            "version": EXPORT_FORMAT_VERSION,
+            "username": username,
+            "exported_at": datetime.utcnow().isoformat(),
+        })
+        conversations = db.execute(
+            select(Conversation.id, Conversation.title, Conversation.created_at, Conversation.updated_at)
+            .where(Conversation.user_id == user_id)
+            .order_by(Conversation.id)
+        ).all()
+        for conversation in conversations:
+            yield _line({
+                "type": "conversation",
+                "id": conversation.id,
+                "title": conversation.title,
+                "created_at": _isoformat(conversation.created_at),
+                "updated_at": _isoformat(conversation.updated_at),
+            })
+            messages = db.execute(
+                select(ChatMessage.role, ChatMessage.content, ChatMessage.timestamp, ChatMessage.finish_reason)
+                .where(ChatMessage.conversation_id == conversation.id)
+                .order_by(ChatMessage.timestamp, ChatMessage.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            for message in messages:
+                yield _line({
+                    "type": "message",
+                    "conversation_id": conversation.id,
+                    "role": message.role,
+                    "content": message.content,
+                    "timestamp": _isoformat(message.timestamp),
+                    "finish_reason": message.finish_reason,
+                })
+    finally:
+        db.close()
+
+
+def export_ndjson(user_id: int, username: str,
+                  session_factory: Callable[[], Session] = SessionLocal) -> Iterator[bytes]:
+    """The export as NDJSON, in chunks of roughly STREAM_CHUNK_BYTES."""
+    chunk = bytearray()
+    for line in export_lines(user_id, username, session_factory):
+        chunk += line
+        if len(chunk) >= STREAM_CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file that collects what zipfile writes to it."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def export_zip(user_id: int, username: str,
+               session_factory: Callable[[], Session] = SessionLocal) -> Iterator[bytes]:
+    """The export as a zip holding one NDJSON file, streamed as it is compressed."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ZIP_MEMBER_NAME, "w", force_zip64=True) as member:
+            for line in export_lines(user_id, username, session_factory):
+                member.write(line)
+                if len(sink.buffer) >= STREAM_CHUNK_BYTES:
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def _open_lines(upload: BinaryIO) -> Iterator[str]:
+    """Text lines of an uploaded NDJSON file or zip export."""
+    if upload.read(4) == b"PK\x03\x04":
+        upload.seek(0)
+        try:
+            archive = zipfile.ZipFile(upload)
+        except zipfile.BadZipFile as e:
+            raise ImportFormatError(f"Invalid zip file: {e}")
+        members = [name for name in archive.namelist() if name.endswith(".ndjson")]
+        if not members:
+            raise ImportFormatError("Zip file contains no .ndjson file")
+        with archive.open(members[0]) as member:
+            yield from io.TextIOWrapper(member, encoding="utf-8")
+        return
+    upload.seek(0)
+    yield from io.TextIOWrapper(upload, encoding="utf-8")
+
+
+def _parse_datetime(value, line_number: int) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ImportFormatError(f"Line {line_number}: invalid timestamp {value!r}")
+
+
+def _copy_messages(db: Session, rows: List[dict]):
+    """COPY rows into chat_messages over the session's own connection."""
+    buffer = io.StringIO()
+    # Every string is quoted, so an empty content stays ''; FORCE_NULL turns
+    # the quoted empty finish_reason written for None back into NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([
+            row["conversation_id"], row["role"], row["content"],
+            row["timestamp"].isoformat(), row["finish_reason"]
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY chat_messages (conversation_id, role, content, timestamp, finish_reason) "
+            "FROM STDIN WITH (FORMAT csv, FORCE_NULL (finish_reason))",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_messages(db: Session, rows: List[dict]):
+    if not rows:
+        return
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2":
+        _copy_messages(db, rows)
+    else:
+        # Executed as multi-row INSERT ... VALUES statements
+        db.execute(insert(ChatMessage), rows)
+
+
+def import_history(db: Session, user_id: int, upload: BinaryIO) -> Dict[str, int]:
+    """Load an export into the user's account as new conversations.
+
+    Runs in the caller's transaction and commits once at the end, so a
+    malformed file imports nothing. Raises ImportFormatError.
+    """
+    # Exported conversation id -> new id
+    conversation_ids: Dict[int, int] = {}
+    batch: List[dict] = []
+    conversation_count = 0
+    message_count = 0
+
+    try:
+        for line_number, line in enumerate(_open_lines(upload), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ImportFormatError(f"Line {line_number}: invalid JSON ({e.msg})")
+            if not isinstance(record, dict):
+                raise ImportFormatError(f"Line {line_number}: expected a JSON object")
+
+            kind = record.get("type")
+            if kind == "export":
+                if record.get("version") != EXPORT_FORMAT_VERSION:
+                    raise ImportFormatError(f"Unsupported export version: {record.get('version')!r}")
+            elif kind == "conversation":
+                created_at = _parse_datetime(record.get("created_at"), line_number) or datetime.utcnow()
+                conversation = Conversation(
+                    user_id=user_id,
+                    title=str(record.get("title") or "Imported Chat")[:255],
+                    created_at=created_at,
+                    updated_at=_parse_datetime(record.get("updated_at"), line_number) or created_at,
+                )
+                db.add(conversation)
+                db.flush()
+                conversation_ids[record.get("id")] = conversation.id
+                conversation_count += 1
+            elif kind == "message":
+                conversation_id = conversation_ids.get(record.get("conversation_id"))
+                if conversation_id is None:
+                    raise ImportFormatError(f"Line {line_number}: message before its conversation")
+                if record.get("role") not in MESSAGE_ROLES or not isinstance(record.get("content"), str):
+                    raise ImportFormatError(f"Line {line_number}: invalid message")
+                batch.append({
+                    "conversation_id": conversation_id,
+                    "role": record["role"],
+                    "content": record["content"],
+                    "timestamp": _parse_datetime(record.get("timestamp"), line_number) or datetime.utcnow(),
+                    "finish_reason": record.get("finish_reason"),
+                })
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    _insert_messages(db, batch)
+                    message_count += len(batch)
+                    batch = []
+            else:
+                raise ImportFormatError(f"Line {line_number}: unknown record type {kind!r}")
+        _insert_messages(db, batch)
+        message_count += len(batch)
+        db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise ImportFormatError("File is not UTF-8 text")
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"conversations": conversation_count, "messages": message_count}
@@ -0,0 +1,167 @@
+"""
+LLM Scheduler
+-------------
+Admission control for LLM calls in this process, so enrichment work
+(context caching, summaries, titles, batch jobs) doesn't take concurrency
+away from interactive chat turns.
+
+Calls take a slot in one of three priority classes. When a slot frees up,
+the backlogged class with the least weighted service so far goes next
+(stride scheduling), so every class progresses in proportion to its
+weight. Admission is preemptive: while the interactive queue is at least
+LLM_PREEMPT_QUEUE_DEPTH deep, background and batch calls are not admitted
+at all, and some slots are always held back for interactive calls.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+from backend.config import load_env
+from backend.metrics import registry
+
+load_env()
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BACKGROUND, BATCH)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Slots background and batch calls may never take
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED", str(max(1, LLM_MAX_CONCURRENCY // 4))))
+LLM_PREEMPT_QUEUE_DEPTH = int(os.getenv("LLM_PREEMPT_QUEUE_DEPTH", "1"))
+# Relative share of slots each class gets while all of them are backlogged
+LLM_SCHEDULER_WEIGHTS = os.getenv("LLM_SCHEDULER_WEIGHTS", "interactive:8,background:2,batch:1")
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse 'class:weight,...'; classes left out keep weight 1."""
+    weights = {priority: 1.0 for priority in PRIORITIES}
+    for pair in filter(None, (item.strip() for item in spec.split(","))):
+        priority, _, weight = pair.partition(":")
+        if priority not in weights or float(weight) <= 0:
+            raise ValueError(f"Invalid LLM_SCHEDULER_WEIGHTS entry: {pair!r}")
+        weights[priority] = float(weight)
+    return weights
+
+
+queue_depth = registry.gauge(
+    "chat_llm_queue_depth",
+    "LLM calls waiting for a slot, by priority class",
+    {"priority": PRIORITIES},
+)
+in_flight = registry.gauge(
+    "chat_llm_in_flight",
+    "LLM calls holding a slot, by priority class",
+    {"priority": PRIORITIES},
+)
+queue_wait = registry.histogram(
+    "chat_llm_queue_wait_seconds",
+    "Time LLM calls waited for a slot, by priority class",
+    {"priority": PRIORITIES},
+)
+
+
+class LLMScheduler:
+    """Weighted fair, priority-aware concurrency limit for LLM calls.
+
+    Use `async with scheduler.slot(priority): ...` around the call. Waiting
+    is cancellable; a cancelled waiter never holds a slot.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        weights: Dict[str, float] = None,
+        interactive_reserved: int = LLM_INTERACTIVE_RESERVED,
+        preempt_queue_depth: int = LLM_PREEMPT_QUEUE_DEPTH,
+    ):
+        self.max_concurrency = max_concurrency
+        self.weights = weights or parse_weights(LLM_SCHEDULER_WEIGHTS)
+        self.interactive_reserved = min(interactive_reserved, max_concurrency - 1)
+        self.preempt_queue_depth = preempt_queue_depth
+        self._queues: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self._active: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        # Stride scheduling: each grant advances the class by 1 / weight
+        self._pass: Dict[str, float] = {p: 0.0 for p in PRIORITIES}
+        self._virtual_time = 0.0
+
+    def _eligible(self, priority: str) -> bool:
+        if priority == INTERACTIVE:
+            return True
+        if len(self._queues[INTERACTIVE]) >= self.preempt_queue_depth:
+            return False
+        others = sum(count for p, count in self._active.items() if p != INTERACTIVE)
+        return others < self.max_concurrency - self.interactive_reserved
+
+    def _dispatch(self):
+        while sum(self._active.values()) < self.max_concurrency:
+            candidates = [p for p in PRIORITIES if self._queues[p] and self._eligible(p)]
+            if not candidates:
+                break
+            priority = min(candidates, key=lambda p: self._pass[p])
+            waiter = self._queues[priority].popleft()
+            if waiter.done():
+                continue
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1 / self.weights[priority]
+            self._active[priority] += 1
+            waiter.set_result(None)
+        # Every change of the queues or slots ends here
+        self.export_metrics()
+
+    async def acquire(self, priority: str = INTERACTIVE):
+        if priority not in self._queues:
+            raise ValueError(f"Unknown LLM priority class: {priority}")
+        started = time.monotonic()
+        queue = self._queues[priority]
+        if not queue:
+            # A class returning from idle doesn't get credit for the time it was away
+            self._pass[priority] = max(self._pass[priority], self._virtual_time)
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we were cancelled
+                self.release(priority)
+            elif waiter in queue:
+                queue.remove(waiter)
+                # A shorter interactive queue may let other classes in
+                self._dispatch()
+            raise
+        queue_wait.observe(time.monotonic() - started, priority=priority)
+
+    def release(self, priority: str = INTERACTIVE):
+        self._active[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def export_metrics(self):
+        """Set the queue depth and in-flight gauges from this scheduler's state.
+
+        Cheap (a memory write per gauge), and the gauges stay current in
+        each worker without anything having to poll them.
+        """
+        for priority in PRIORITIES:
+            queue_depth.set(len(self._queues[priority]), priority=priority)
+            in_flight.set(self._active[priority], priority=priority)
+
+    def snapshot(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queued": {p: len(q) for p, q in self._queues.items()},
+            "active": dict(self._active),
+        }
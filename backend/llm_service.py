@@ -2,64 +2,357 @@
 LangChain Gemini Integration
 -----------------------------
 Handles LLM calls using LangChain and Google Gemini.
+
+The client is built lazily on first use (see `get_llm`) so importing the
+app stays cheap and does not require an API key.
 """
 
+import asyncio
+import contextlib
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from typing import List, Dict
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional
+from backend.config import load_env
+from backend.context_cache import ContextCacheManager, build_context_cache, estimate_tokens
+from backend.llm_scheduler import INTERACTIVE, LLMScheduler
+from backend.metrics import registry
+from backend.resilience import (
+    CircuitBreaker, RetryPolicy, classify_error, sleep_within
+)
+
+load_env()
+
+SYSTEM_PROMPT = "You are a helpful AI assistant. Provide clear, accurate, and helpful responses."
+MODEL_NAME = "gemini-2.5-flash-lite"
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")  # 'gemini' or 'fake'
+
+# Per-request deadline for a chat turn; ChatRequest.timeout_seconds may
+# shorten or extend it up to the maximum
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_TIMEOUT_SECONDS = float(os.getenv("LLM_MAX_TIMEOUT_SECONDS", "120"))
+# How often to check whether the client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+llm_requests = registry.counter(
+    "chat_llm_requests_total",
+    "LLM calls for chat turns by outcome",
+    {"outcome": ["completed", "cancelled", "timeout", "error"]},
+)
+llm_retries = registry.counter(
+    "chat_llm_retries_total",
+    "LLM calls retried, by error kind",
+    {"kind": ["rate_limit", "timeout", "server"]},
+)
+
+llm_tokens = registry.counter(
+    "chat_llm_tokens_total",
+    "Tokens used by chat turns",
+    {"kind": ["prompt", "completion"]},
+)
+
+retry_policy = RetryPolicy()
+# Per process: each worker notices an upstream brownout on its own
+circuit_breaker = CircuitBreaker()
+# Every LLM call (chat turns and enrichment alike) takes a slot here
+scheduler = LLMScheduler()
+
+
+@dataclass
+class TokenUsage:
+    """Tokens used by one LLM call."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # False until the provider reports usage; the counts are estimates otherwise
+    reported: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, usage_metadata: Optional[dict]):
+        """Add LangChain `usage_metadata` (per response, or per streamed chunk)."""
+        if usage_metadata:
+            self.prompt_tokens += usage_metadata.get("input_tokens") or 0
+            self.completion_tokens += usage_metadata.get("output_tokens") or 0
+            self.reported = True
+
+    def reset(self):
+        self.prompt_tokens = self.completion_tokens = 0
+        self.reported = False
+
 
-# Force reload environment variables from project root
-project_root = Path(__file__).parent.parent
-env_path = project_root / ".env"
-load_dotenv(dotenv_path=env_path, override=True)
+def build_messages(message: str, conversation_history: List[Dict[str, str]] = None,
+                   cached_content: Optional[str] = None):
+    """LangChain message list for a turn."""
+    from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+    messages = []
+
+    # The cached prefix already carries the system instruction
+    if not cached_content:
+        messages.append(SystemMessage(content=SYSTEM_PROMPT))
+
+    # Add conversation history
+    if conversation_history:
+        for msg in conversation_history:
+            if msg['role'] == 'user':
+                messages.append(HumanMessage(content=msg['content']))
+            elif msg['role'] == 'assistant':
+                messages.append(AIMessage(content=msg['content']))
+
+    # Add current message
+    messages.append(HumanMessage(content=message))
+    return messages
 
 
 class GeminiLLM:
     """Wrapper for Google Gemini LLM using LangChain."""
-    
+
     def __init__(self):
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        
+
+        # Imported here: langchain/google-genai dominate the app's import time
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        self.model_name = MODEL_NAME
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash-lite",
+            model=MODEL_NAME,
             google_api_key=api_key,
             temperature=0.7
         )
-    
-    def get_response(self, message: str, conversation_history: List[Dict[str, str]] = None) -> str:
+
+    def get_response(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        cached_content: Optional[str] = None,
+        usage: Optional[TokenUsage] = None
+    ) -> str:
         """Get response from Gemini with conversation history.
-        
+
         Args:
             message: Current user message
             conversation_history: List of previous messages [{'role': 'user'/'assistant', 'content': '...'}]
+            cached_content: Handle of a cached prefix; the system prompt and the
+                history it covers are then not resent
+            usage: Receives the token counts Gemini reports for the call
         """
         try:
-            messages = []
-            
-            # Add system message
-            messages.append(SystemMessage(content="You are a helpful AI assistant. Provide clear, accurate, and helpful responses."))
-            
-            # Add conversation history
-            if conversation_history:
-                for msg in conversation_history:
-                    if msg['role'] == 'user':
-                        messages.append(HumanMessage(content=msg['content']))
-                    elif msg['role'] == 'assistant':
-                        messages.append(AIMessage(content=msg['content']))
-            
-            # Add current message
-            messages.append(HumanMessage(content=message))
-            
-            response = self.llm.invoke(messages)
+            messages = build_messages(message, conversation_history, cached_content)
+            if cached_content:
+                response = self.llm.invoke(messages, cached_content=cached_content)
+            else:
+                response = self.llm.invoke(messages)
+            if usage is not None:
+                usage.add(getattr(response, "usage_metadata", None))
             return response.content
         except Exception as e:
-            raise Exception(f"Error getting LLM response: {str(e)}")
+            raise classify_error(e) from e
+
+    async def astream_response(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        cached_content: Optional[str] = None,
+        usage: Optional[TokenUsage] = None
+    ) -> AsyncIterator[str]:
+        """Stream the response as text chunks.
+
+        Cancelling the consuming task aborts the upstream request. Token
+        counts arrive on the chunks and are summed into `usage`.
+        """
+        messages = build_messages(message, conversation_history, cached_content)
+        kwargs = {"cached_content": cached_content} if cached_content else {}
+        try:
+            async for chunk in self.llm.astream(messages, **kwargs):
+                if usage is not None:
+                    usage.add(getattr(chunk, "usage_metadata", None))
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            raise classify_error(e) from e
+
+
+class FakeLLM:
+    """Offline stand-in for GeminiLLM (LLM_PROVIDER=fake); echoes the prompt.
+
+    FAKE_LLM_DELAY_SECONDS adds latency per streamed word, to exercise
+    deadlines and cancellation.
+    """
+
+    def __init__(self):
+        self.model_name = "fake"
+        self.calls = 0
+        self.delay = float(os.getenv("FAKE_LLM_DELAY_SECONDS", "0"))
+
+    def get_response(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        cached_content: Optional[str] = None,
+        usage: Optional[TokenUsage] = None
+    ) -> str:
+        self.calls += 1
+        history_size = len(conversation_history or [])
+        text = f"Echo ({history_size} previous messages): {message}"
+        if usage is not None:
+            # Estimated the way Gemini would count them, reported like Gemini does
+            history = (conversation_history or []) + [{"content": message}]
+            usage.add({
+                "input_tokens": estimate_tokens("" if cached_content else SYSTEM_PROMPT, history),
+                "output_tokens": max(1, len(text) // 4),
+            })
+        return text
+
+    async def astream_response(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        cached_content: Optional[str] = None,
+        usage: Optional[TokenUsage] = None
+    ) -> AsyncIterator[str]:
+        # Usage is added up front; a cancelled stream is billed in full upstream too
+        text = self.get_response(message, conversation_history, cached_content, usage)
+        for i, word in enumerate(text.split(" ")):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield word if i == 0 else " " + word
+
+
+@dataclass
+class LLMResult:
+    text: str
+    # 'stop' (complete), 'timeout' (deadline hit) or 'cancelled' (client left)
+    finish_reason: str
+    usage: TokenUsage
+
+
+async def generate_with_deadline(
+    llm,
+    message: str,
+    conversation_history: List[Dict[str, str]],
+    cached_content: Optional[str],
+    timeout: float,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    priority: str = INTERACTIVE,
+    on_text: Optional[Callable[[str], None]] = None,
+) -> LLMResult:
+    """Stream a reply, stopping at the deadline or when the client goes away.
+
+    On timeout or cancellation the upstream call is cancelled and whatever
+    text arrived so far is returned. Retryable errors are retried (only
+    before any text has arrived, and only within the deadline); the rest
+    propagate as LLMError. CircuitOpenError is raised without calling
+    Gemini while the breaker is open.
+
+    The call waits for a scheduler slot of the given priority; time spent
+    queued counts against the deadline.
+
+    `on_text`, when given, is called with each chunk as it arrives.
+
+    `LLMResult.usage` holds the tokens Gemini reported for the attempt that
+    produced the text, or an estimate when the stream ended before the
+    usage arrived.
+    """
+    chunks: List[str] = []
+    usage = TokenUsage()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    async def consume():
+        async with scheduler.slot(priority):
+            await stream_with_retries()
+
+    async def stream_with_retries():
+        delay = None
+        for attempt in range(1, retry_policy.attempts + 1):
+            circuit_breaker.before_call()
+            usage.reset()
+            try:
+                async for text in llm.astream_response(message, conversation_history, cached_content, usage):
+                    chunks.append(text)
+                    if on_text is not None:
+                        on_text(text)
+            except asyncio.CancelledError:
+                circuit_breaker.release_probe()
+                raise
+            except Exception as e:
+                error = classify_error(e)
+                circuit_breaker.record_failure(error)
+                if chunks or not error.retryable or attempt == retry_policy.attempts:
+                    raise error from e
+                delay = retry_policy.next_delay(delay)
+                if not await sleep_within(delay, deadline):
+                    raise error from e
+                llm_retries.inc(kind=error.kind)
+                continue
+            circuit_breaker.record_success()
+            return
+
+    task = asyncio.create_task(consume())
+    finish_reason = None
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                finish_reason = "timeout"
+                break
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_SECONDS, remaining))
+            if done:
+                task.result()
+                finish_reason = "stop"
+                break
+            if await is_disconnected():
+                finish_reason = "cancelled"
+                break
+    except Exception:
+        llm_requests.inc(outcome="error")
+        raise
+    finally:
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+
+    llm_requests.inc(outcome="completed" if finish_reason == "stop" else finish_reason)
+    text = "".join(chunks)
+    if not usage.reported:
+        history = conversation_history + [{"content": message}]
+        usage.prompt_tokens = estimate_tokens("" if cached_content else SYSTEM_PROMPT, history)
+        usage.completion_tokens = len(text) // 4
+    llm_tokens.inc(usage.prompt_tokens, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens, kind="completion")
+    return LLMResult(text=text, finish_reason=finish_reason, usage=usage)
+
+
+_llm_instance = None
+_context_cache: Optional[ContextCacheManager] = None
+_context_cache_built = False
+_init_lock = threading.Lock()
+
+
+def get_llm():
+    """Return the process-wide LLM client, creating it on first call.
+
+    Usable directly or as a FastAPI dependency.
+    """
+    global _llm_instance
+    if _llm_instance is None:
+        with _init_lock:
+            if _llm_instance is None:
+                _llm_instance = FakeLLM() if LLM_PROVIDER == "fake" else GeminiLLM()
+    return _llm_instance
 
 
-# Singleton instance
-llm_instance = GeminiLLM()
+def get_context_cache() -> Optional[ContextCacheManager]:
+    """Return the context-cache manager, or None when caching is disabled."""
+    global _context_cache, _context_cache_built
+    if not _context_cache_built:
+        with _init_lock:
+            if not _context_cache_built:
+                _context_cache = build_context_cache(os.getenv("GOOGLE_API_KEY"))
+                _context_cache_built = True
+    return _context_cache
@@ -4,33 +4,108 @@ FastAPI Main Application
 Backend API with authentication and chat endpoints.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import (
+    FastAPI, Depends, HTTPException, status, BackgroundTasks, Request, Query, UploadFile, File, WebSocket
+)
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import timedelta, datetime
-from typing import List
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+import functools
+import math
 import os
 
-from backend.database import get_db, init_db
-from backend.models import User, Conversation, ChatMessage
+from backend.database import get_db, init_db, SessionLocal, read_router
+from backend.models import UsageDaily, UsageHourly
+from backend import repository
 from backend.schemas import (
     UserLogin, UserResponse, Token, TokenData,
     UserCreate, GoogleAuthRequest,
     ConversationCreate, ConversationResponse,
-    ChatRequest, ChatMessageResponse, ChatResponse
+    ChatRequest, ChatMessageResponse, ChatResponse, ImportResponse,
+    UsageRollupResponse
 )
 from backend.auth import (
-    verify_password, get_password_hash, create_access_token,
-    verify_token, ACCESS_TOKEN_EXPIRE_MINUTES
+    verify_password, get_password_hash, create_user_token,
+    decode_token, revoke_user_tokens, token_versions, CurrentUser,
+    ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from backend.llm_service import (
+    get_llm, get_context_cache, generate_with_deadline, circuit_breaker, scheduler,
+    TokenUsage, SYSTEM_PROMPT, LLM_TIMEOUT_SECONDS, LLM_MAX_TIMEOUT_SECONDS
+)
+from backend.llm_scheduler import BACKGROUND
+from backend.resilience import (
+    LLMError, CircuitOpenError, LLMRateLimitError, LLMTimeoutError,
+    LLMServerError, LLMInvalidRequestError
+)
+from backend.context_cache import CachedPrefix
+from backend.metrics import registry as metrics_registry
+from backend.static_assets import PrecompressedAsset
+from backend.compression import CompressionMiddleware, COMPRESSED_CONTENT_TYPES
+from backend.request_limits import BodySizeLimitMiddleware
+from backend.google_auth import verify_google_id_token, cert_cache
+from backend.history_cache import history_cache
+from backend.markdown_render import get_render_cache
+from backend.history_io import export_ndjson, export_zip, import_history, ImportFormatError
+from backend.chat_socket import ChatConnection, spawn_background
+from backend.usage import (
+    quota_tracker, usage_roller, record_usage, QuotaExceededError, day_start, hour_start
 )
-from backend.llm_service import llm_instance
+from backend.profiling import (
+    profiler, ProfilingMiddleware, PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_SLOW_REQUEST_MS
+)
+
+# Migrations are a deploy step (`python -m backend.migrations upgrade`); set
+# this only for local development where the app should apply them itself
+AUTO_CREATE_SCHEMA = os.getenv("AUTO_CREATE_SCHEMA", "false").lower() == "true"
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Largest /import upload accepted, in bytes (0 = no limit)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Serve static files (frontend)
+frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+
+_index_asset = None
+
+
+def get_index_asset() -> PrecompressedAsset:
+    """The frontend shell, compressed once per process."""
+    global _index_asset
+    if _index_asset is None:
+        _index_asset = PrecompressedAsset(os.path.join(frontend_path, "index.html"), "text/html; charset=utf-8")
+    return _index_asset
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AUTO_CREATE_SCHEMA:
+        init_db()
+        print("✅ Database initialized")
+    # Compress up front so the first visitor doesn't pay for it
+    get_index_asset()
+    read_router.start()
+    usage_roller.start()
+    profiler.start_sync()
+    yield
+    profiler.close()
+    usage_roller.close()
+    read_router.close()
+    cert_cache.close()
+    metrics_registry.close()
+
 
 # Initialize FastAPI app
-app = FastAPI(title="Amzur Chatbot API", version="2.0.0")
+app = FastAPI(title="Amzur Chatbot API", version="2.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -41,64 +116,90 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress API payloads (message lists grow large); brotli when available.
+# Already-compressed media, like zip exports, are sent as they are
+app.add_middleware(
+    CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, exclude_content_types=COMPRESSED_CONTENT_TYPES
+)
+
+app.add_middleware(BodySizeLimitMiddleware, limits={"/import": IMPORT_MAX_BYTES})
+
+# Outermost, so profiled timings cover the whole request; idle unless an admin starts a session
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-# Initialize database on startup
-@app.on_event("startup")
-def startup_event():
-    init_db()
-    print("✅ Database initialized")
+def resolve_user(db: Session, token: str) -> Optional[CurrentUser]:
+    """User a bearer token belongs to, or None if it isn't valid.
+    
+    Identity comes from the token claims, without a database lookup.
+    """
+    token_versions.refresh_if_stale(db)
+    claims = decode_token(token)
+    if claims is None:
+        return None
+    return CurrentUser(id=claims.user_id, username=claims.username)
 
 
 # Dependency: Get current user
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> User:
+) -> CurrentUser:
     """Get current authenticated user."""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    username = verify_token(token)
-    if username is None:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
+    current_user = resolve_user(db, token)
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
-    return user
+    # Writes committed on this session pin the user's reads to the primary
+    db.info["user_id"] = current_user.id
+    return current_user
 
 
-# Serve static files (frontend)
-frontend_path = os.path.join(os.path.dirname(__file__), "..", "frontend")
+def get_admin_user(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    """Dependency for /admin routes: users listed in ADMIN_USERNAMES only."""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+
+def get_read_db(current_user: CurrentUser = Depends(get_current_user)):
+    """Dependency for read-only routes: a replica session unless the user just wrote."""
+    db = read_router.session_for_read(current_user.id)
+    try:
+        yield db
+    finally:
+        db.close()
+
 
-# Check if running on Vercel (serverless environment)
-IS_VERCEL = os.getenv('VERCEL', '') != ''
+# Static assets get ETag/Last-Modified handling from StaticFiles
+app.mount("/static", StaticFiles(directory=frontend_path), name="static")
 
 
 # Routes
 
 @app.get("/")
-def root():
-    """Serve the frontend HTML."""
-    if IS_VERCEL:
-        # On Vercel, serve from the correct path
-        html_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", "index.html")
-    else:
-        html_path = os.path.join(frontend_path, "index.html")
-    return FileResponse(html_path)
+def root(request: Request):
+    """Serve the frontend HTML (precompressed, ETag-validated)."""
+    return get_index_asset().response(request)
 
 
 @app.get("/health")
 def health():
-    """Health check endpoint."""
-    return {"status": "healthy", "message": "Amzur Chatbot API v2.0"}
+    """Health check endpoint; includes the Gemini circuit breaker and LLM queues."""
+    return {
+        "status": "healthy",
+        "message": "Amzur Chatbot API v2.0",
+        "llm_circuit": circuit_breaker.snapshot(),
+        "llm_scheduler": scheduler.snapshot(),
+        "database_replicas": read_router.snapshot()
+    }
 
 
 @app.post("/login", response_model=Token)
@@ -113,9 +214,7 @@ def login(
     - **password**: User's password
     """
     # Find user by username or email
-    user = db.query(User).filter(
-        (User.username == form_data.username) | (User.email == form_data.username)
-    ).first()
+    user = repository.get_user_by_login(db, form_data.username)
     
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
@@ -126,13 +225,21 @@ def login(
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    access_token = create_user_token(db, user, expires_delta=access_token_expires)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@app.post("/logout-all")
+def logout_all(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Revoke every token issued to the current user, including this one."""
+    revoke_user_tokens(db, current_user.id)
+    return {"message": "All sessions signed out"}
+
+
 @app.post("/signup", response_model=UserResponse)
 def signup(
     user_data: UserCreate,
@@ -147,39 +254,34 @@ def signup(
     - **full_name**: Optional full name
     """
     # Check if email already exists
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
-    if existing_email:
+    if repository.get_user_by_email(db, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Check if username already exists
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
-    if existing_username:
+    if repository.get_user_by_username(db, user_data.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
     
     # Create new user
-    new_user = User(
+    new_user = repository.create_user(
+        db,
         email=user_data.email,
         username=user_data.username,
         hashed_password=get_password_hash(user_data.password),
-        full_name=user_data.full_name,
-        is_active=True
+        full_name=user_data.full_name
     )
-    
-    db.add(new_user)
     db.commit()
-    db.refresh(new_user)
     
-    return new_user
+    return new_user._asdict()
 
 
 @app.post("/auth/google", response_model=Token)
-async def google_auth(
+def google_auth(
     auth_data: GoogleAuthRequest,
     db: Session = Depends(get_db)
 ):
@@ -187,15 +289,8 @@ async def google_auth(
     Authenticate or create user using Google OAuth.
     """
     try:
-        from google.oauth2 import id_token
-        from google.auth.transport import requests
-        
-        # Verify the Google token
-        idinfo = id_token.verify_oauth2_token(
-            auth_data.credential,
-            requests.Request(),
-            "479578758374-vk1v6l46q7tpi6vcobho2ljnrdnh2h3j.apps.googleusercontent.com"
-        )
+        # Verify the Google token against the cached signing certs
+        idinfo = verify_google_id_token(auth_data.credential)
         
         # Get user info from Google
         email = idinfo['email']
@@ -203,27 +298,23 @@ async def google_auth(
         google_id = idinfo['sub']
         
         # Check if user exists
-        user = db.query(User).filter(User.email == email).first()
+        user = repository.get_user_by_email(db, email)
         
         if not user:
             # Create new user
             username = email.split('@')[0] + '_' + google_id[:6]
-            user = User(
+            user = repository.create_user(
+                db,
                 email=email,
                 username=username,
                 hashed_password=get_password_hash(google_id),  # Use Google ID as password hash
-                full_name=name,
-                is_active=True
+                full_name=name
             )
-            db.add(user)
             db.commit()
-            db.refresh(user)
         
         # Create access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
-        )
+        access_token = create_user_token(db, user, expires_delta=access_token_expires)
         
         return {"access_token": access_token, "token_type": "bearer"}
         
@@ -240,54 +331,40 @@ async def google_auth(
 
 
 @app.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+def get_current_user_info(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
     """Get current user information."""
-    return current_user
+    user = repository.get_user_profile(db, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
 
 # Conversation Endpoints
 
 @app.get("/conversations", response_model=List[ConversationResponse])
 def get_conversations(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get all conversations for the current user.
     Returns conversations in reverse chronological order (newest first).
     """
-    conversations = db.query(
-        Conversation,
-        func.count(ChatMessage.id).label('message_count')
-    ).outerjoin(
-        ChatMessage
-    ).filter(
-        Conversation.user_id == current_user.id
-    ).group_by(
-        Conversation.id
-    ).order_by(
-        Conversation.updated_at.desc()
-    ).all()
-    
-    result = []
-    for conv, msg_count in conversations:
-        conv_dict = {
-            "id": conv.id,
-            "title": conv.title,
-            "created_at": conv.created_at,
-            "updated_at": conv.updated_at,
-            "message_count": msg_count
-        }
-        result.append(conv_dict)
-    
-    return result
+    return repository.list_conversations(db, current_user.id)
 
 
 # Alias for backwards compatibility
 @app.get("/chats", response_model=List[ConversationResponse])
 def get_chats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Alias for /conversations endpoint."""
     return get_conversations(current_user, db)
@@ -296,67 +373,86 @@ def get_chats(
 @app.post("/conversations", response_model=ConversationResponse)
 def create_conversation(
     conversation: ConversationCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new conversation."""
-    new_conversation = Conversation(
-        user_id=current_user.id,
-        title=conversation.title
-    )
-    db.add(new_conversation)
+    new_conversation = repository.create_conversation(db, current_user.id, conversation.title)
     db.commit()
-    db.refresh(new_conversation)
+    history_cache.start(new_conversation["id"], current_user.id)
     
-    return {
-        "id": new_conversation.id,
-        "title": new_conversation.title,
-        "created_at": new_conversation.created_at,
-        "updated_at": new_conversation.updated_at,
-        "message_count": 0
-    }
+    return new_conversation
+
+
+def attach_html(db: Session, messages: List[dict]) -> List[dict]:
+    """Add pre-rendered HTML to assistant messages when server-side rendering is on."""
+    render_cache = get_render_cache()
+    return render_cache.attach(db, messages) if render_cache else messages
+
+
+def attach_cached_html(db: Session, conversation_id: int, messages: List[dict]) -> List[dict]:
+    """attach_html for messages read from the history cache, keeping the HTML there."""
+    rendered = attach_html(db, messages)
+    if rendered is not messages:
+        history_cache.replace(conversation_id, rendered)
+    return rendered
+
+
+def fill_history_cache(db: Session, conversation_id: int, user_id: int) -> List[dict]:
+    """Load the newest messages of an owned conversation into the hot cache."""
+    version = history_cache.version(conversation_id)
+    recent = repository.recent_messages(db, conversation_id, history_cache.ring_size)
+    history_cache.fill(conversation_id, user_id, recent, version)
+    return recent
 
 
 @app.get("/conversations/{conversation_id}/messages", response_model=List[ChatMessageResponse])
 def get_conversation_messages(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Only the newest N messages"),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
-    """Get all messages for a specific conversation."""
-    # Verify conversation belongs to user
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    """Get all messages (or the newest `limit`) for a specific conversation.
+    
+    Assistant messages carry pre-rendered `html` when server-side markdown
+    rendering is available.
+    """
+    # Recent conversations are served from memory; entries only exist for
+    # conversations whose ownership was verified when they were cached
+    cached = history_cache.recent(conversation_id, current_user.id, limit)
+    if cached is not None:
+        return attach_cached_html(db, conversation_id, cached)
     
-    if not conversation:
+    # Verify conversation belongs to user
+    if not repository.owns_conversation(db, conversation_id, current_user.id):
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.conversation_id == conversation_id
-    ).order_by(ChatMessage.timestamp).all()
+    if limit is not None and limit <= history_cache.ring_size:
+        return attach_cached_html(db, conversation_id, fill_history_cache(db, conversation_id, current_user.id)[-limit:])
     
-    return messages
+    if limit is not None:
+        messages = repository.recent_messages(db, conversation_id, limit)
+    else:
+        messages = repository.conversation_messages(db, conversation_id)
+    return attach_html(db, messages)
 
 
 @app.delete("/conversations/{conversation_id}")
 def delete_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a conversation and all its messages."""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
-    
-    if not conversation:
+    if not repository.delete_conversation(db, conversation_id, current_user.id):
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    db.delete(conversation)
     db.commit()
+    history_cache.invalidate(conversation_id)
+    
+    context_cache = get_context_cache()
+    if context_cache:
+        context_cache.forget(conversation_id)
     
     return {"message": "Conversation deleted"}
 
@@ -365,108 +461,219 @@ def delete_conversation(
 def update_conversation_title(
     conversation_id: int,
     title: str,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update conversation title."""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
-    
-    if not conversation:
+    if not repository.rename_conversation(db, conversation_id, title, current_user.id):
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    conversation.title = title
     db.commit()
+    history_cache.invalidate(conversation_id)
     
     return {"message": "Title updated", "title": title}
 
 
 # Chat Endpoints
 
-@app.post("/chat", response_model=ChatResponse)
-def send_message(
-    chat_request: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Send a message and get LLM response.
-    
-    - Creates new conversation if conversation_id is None
-    - Saves user message to database
-    - Gets response from Gemini LLM
-    - Saves assistant response to database
-    - Returns both messages with conversation_id
+def load_cache_prefix(conversation_id: int) -> List[dict]:
+    db = SessionLocal()
+    try:
+        return repository.conversation_turns(db, conversation_id)
+    finally:
+        db.close()
+
+
+async def refresh_context_cache(conversation_id: int):
+    """Register the conversation so far as a cached prefix (runs after the response).
+
+    Takes a background scheduler slot, so it yields to waiting chat turns.
     """
+    try:
+        prefix = await run_in_threadpool(load_cache_prefix, conversation_id)
+        async with scheduler.slot(BACKGROUND):
+            await run_in_threadpool(
+                get_context_cache().register,
+                conversation_id, get_llm().model_name, SYSTEM_PROMPT, prefix
+            )
+    except Exception as e:
+        print(f"⚠️ Context cache refresh failed for conversation {conversation_id}: {e}")
+
+
+@dataclass
+class ChatTurn:
+    """State of a chat turn between saving the user message and the reply."""
+    conversation_id: int
+    user_message: dict
+    message_count: int
+    conversation_history: List[dict]
+    cached_prefix: Optional[CachedPrefix]
+
+
+def start_chat_turn(db: Session, current_user: CurrentUser, chat_request: ChatRequest) -> ChatTurn:
+    """Resolve the conversation, save the user message and gather context."""
     conversation_id = chat_request.conversation_id
     
     # Create new conversation if not provided
     if not conversation_id:
-        new_conversation = Conversation(
-            user_id=current_user.id,
-            title="New Chat"
-        )
-        db.add(new_conversation)
+        conversation_id = repository.create_conversation(db, current_user.id)["id"]
         db.commit()
-        db.refresh(new_conversation)
-        conversation_id = new_conversation.id
+        history_cache.start(conversation_id, current_user.id)
     else:
-        # Verify conversation belongs to user
-        conversation = db.query(Conversation).filter(
-            Conversation.id == conversation_id,
-            Conversation.user_id == current_user.id
-        ).first()
-        
-        if not conversation:
+        # Update conversation timestamp; this also checks it belongs to the user,
+        # on every turn: ids of deleted conversations can be reissued (SQLite)
+        if not repository.touch_conversation(db, conversation_id, current_user.id):
             raise HTTPException(status_code=404, detail="Conversation not found")
-        
-        # Update conversation timestamp
-        conversation.updated_at = datetime.utcnow()
     
     # Save user message
-    user_message = ChatMessage(
-        conversation_id=conversation_id,
-        role="user",
-        content=chat_request.message
-    )
-    db.add(user_message)
+    user_message = repository.add_message(db, conversation_id, "user", chat_request.message)
     db.commit()
-    db.refresh(user_message)
+    history_cache.append(conversation_id, user_message)
     
     # Auto-generate title from first message
-    message_count = db.query(ChatMessage).filter(
-        ChatMessage.conversation_id == conversation_id
-    ).count()
+    message_count = repository.count_messages(db, conversation_id)
     
     if message_count == 1:  # First message in conversation
-        conversation = db.query(Conversation).filter(
-            Conversation.id == conversation_id
-        ).first()
         # Generate title from first few words
         title_words = chat_request.message.split()[:6]
-        conversation.title = " ".join(title_words) + ("..." if len(chat_request.message.split()) > 6 else "")
+        title = " ".join(title_words) + ("..." if len(chat_request.message.split()) > 6 else "")
+        repository.rename_conversation(db, conversation_id, title)
         db.commit()
     
-    # Fetch last 5 exchanges (10 messages) for conversation context
-    previous_messages = db.query(ChatMessage).filter(
-        ChatMessage.conversation_id == conversation_id,
-        ChatMessage.id != user_message.id  # Exclude the current message
-    ).order_by(ChatMessage.timestamp.desc()).limit(10).all()
-    
-    # Reverse to get chronological order
-    previous_messages = list(reversed(previous_messages))
+    # With a live cached prefix only the turns after it are sent;
+    # otherwise send the last 5 exchanges (10 messages) for conversation context.
+    # Both come from the hot history cache, loaded from the database on a miss.
+    context_cache = get_context_cache()
+    cached_prefix = context_cache.lookup(conversation_id) if context_cache else None
+    if cached_prefix:
+        previous_messages = history_cache.messages_after(
+            conversation_id, current_user.id, cached_prefix.last_message_id
+        )
+        if previous_messages is None:
+            previous_messages = [
+                msg for msg in fill_history_cache(db, conversation_id, current_user.id)
+                if msg["id"] > cached_prefix.last_message_id
+            ]
+        previous_messages = [msg for msg in previous_messages if msg["id"] != user_message["id"]]
+        if len(previous_messages) > context_cache.refresh_messages:
+            # The prefix refresh is behind (or failed); sending only part of
+            # what follows the prefix would leave a gap in the context
+            cached_prefix = None
+    if not cached_prefix:
+        history_limit = 10
+        # +1 for the current message, which is excluded below
+        previous_messages = history_cache.recent(conversation_id, current_user.id, history_limit + 1)
+        if previous_messages is None:
+            previous_messages = fill_history_cache(db, conversation_id, current_user.id)
+        previous_messages = [
+            msg for msg in previous_messages if msg["id"] != user_message["id"]  # Exclude the current message
+        ][-history_limit:]
     
     # Format conversation history
     conversation_history = [
-        {"role": msg.role, "content": msg.content}
+        {"role": msg["role"], "content": msg["content"]}
         for msg in previous_messages
     ]
     
+    # End the read transaction so no pooled connection is held during the LLM call
+    db.commit()
+    
+    return ChatTurn(conversation_id, user_message, message_count, conversation_history, cached_prefix)
+
+
+def save_assistant_message(db: Session, user_id: int, conversation_id: int, content: str, finish_reason: str,
+                           usage: TokenUsage) -> dict:
+    """Persist the reply (possibly truncated) with its rendered HTML and token usage, and write it through to the cache."""
+    # Render before inserting, so the write transaction stays short
+    render_cache = get_render_cache()
+    html = render_cache.renderer.render(content) if render_cache else None
+    message = repository.add_message(
+        db, conversation_id, "assistant", content,
+        finish_reason=finish_reason,
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens
+    )
+    if render_cache:
+        render_cache.store(db, message["id"], content, html)
+    # Same transaction: usage is on record exactly when the reply is
+    record_usage(db, user_id, usage.prompt_tokens, usage.completion_tokens, message["timestamp"])
+    db.commit()
+    if render_cache:
+        message["html"] = html
+    history_cache.append(conversation_id, message)
+    return message
+
+
+# HTTP status for each kind of LLM failure, after retries
+LLM_ERROR_STATUS = [
+    (CircuitOpenError, status.HTTP_503_SERVICE_UNAVAILABLE),
+    (LLMRateLimitError, status.HTTP_429_TOO_MANY_REQUESTS),
+    (LLMTimeoutError, status.HTTP_504_GATEWAY_TIMEOUT),
+    (LLMServerError, status.HTTP_502_BAD_GATEWAY),
+    (LLMInvalidRequestError, status.HTTP_400_BAD_REQUEST),
+]
+
+
+def llm_error_response(error: LLMError) -> HTTPException:
+    """HTTPException for a classified LLM error, with Retry-After when known."""
+    status_code = next(
+        (code for cls, code in LLM_ERROR_STATUS if isinstance(error, cls)),
+        status.HTTP_500_INTERNAL_SERVER_ERROR
+    )
+    if status_code == status.HTTP_500_INTERNAL_SERVER_ERROR:
+        print(f"❌ LLM error: {error!r}")
+    headers = None
+    if status_code in (status.HTTP_503_SERVICE_UNAVAILABLE, status.HTTP_429_TOO_MANY_REQUESTS):
+        retry_after = error.retry_after or circuit_breaker.retry_after() or 1
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+    return HTTPException(status_code=status_code, detail=f"LLM Error: {error}", headers=headers)
+
+
+async def run_chat_turn(
+    db: Session,
+    current_user: CurrentUser,
+    chat_request: ChatRequest,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    schedule: Callable,
+    on_start: Optional[Callable[[ChatTurn], None]] = None,
+    on_text: Optional[Callable[[str], None]] = None
+) -> dict:
+    """One chat turn, shared by POST /chat and the /ws channel.
+    
+    Checks the quota, saves the user message, streams the reply within the
+    deadline (each chunk goes to `on_text`) and saves it. Failures raise
+    HTTPException; `schedule(func, *args)` runs follow-up work after the
+    reply has been delivered.
+    """
+    # Database work stays off the event loop
+    if quota_tracker.enabled:
+        try:
+            await run_in_threadpool(quota_tracker.check, db, current_user.id)
+        except QuotaExceededError as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e),
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+            )
+    
+    turn = await run_in_threadpool(start_chat_turn, db, current_user, chat_request)
+    if on_start is not None:
+        on_start(turn)
+    
+    timeout = min(chat_request.timeout_seconds or LLM_TIMEOUT_SECONDS, LLM_MAX_TIMEOUT_SECONDS)
+    
     # Get LLM response with conversation history
     try:
-        llm_response = llm_instance.get_response(chat_request.message, conversation_history)
+        result = await generate_with_deadline(
+            get_llm(),
+            chat_request.message,
+            turn.conversation_history,
+            turn.cached_prefix.name if turn.cached_prefix else None,
+            timeout,
+            is_disconnected,
+            on_text=on_text
+        )
+    except LLMError as e:
+        raise llm_error_response(e)
     except Exception as e:
         import traceback
         traceback.print_exc()  # Print full traceback to console
@@ -475,23 +682,278 @@ def send_message(
             detail=f"LLM Error: {str(e)}"
         )
     
+    quota_tracker.record(current_user.id, result.usage.total_tokens)
+    
+    if not result.text:
+        if result.finish_reason == "timeout":
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail=f"LLM did not respond within {timeout:g} seconds"
+            )
+        # Client left before anything arrived; there is nobody to answer
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    
     # Save assistant message
-    assistant_message = ChatMessage(
-        conversation_id=conversation_id,
-        role="assistant",
-        content=llm_response
+    assistant_message = await run_in_threadpool(
+        save_assistant_message, db, current_user.id, turn.conversation_id, result.text, result.finish_reason,
+        result.usage
     )
-    db.add(assistant_message)
-    db.commit()
-    db.refresh(assistant_message)
+    
+    # Grow the cached prefix once enough uncached turns have accumulated
+    context_cache = get_context_cache()
+    if context_cache and context_cache.should_refresh(turn.conversation_id, turn.message_count + 1):
+        schedule(refresh_context_cache, turn.conversation_id)
     
     return {
-        "conversation_id": conversation_id,
-        "user_message": user_message,
+        "conversation_id": turn.conversation_id,
+        "user_message": turn.user_message,
         "assistant_message": assistant_message
     }
 
 
+@app.post("/chat", response_model=ChatResponse)
+async def send_message(
+    chat_request: ChatRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Send a message and get LLM response.
+    
+    - Creates new conversation if conversation_id is None
+    - Saves user message to database
+    - Gets response from Gemini LLM, within the request deadline
+    - Saves assistant response to database
+    - Returns both messages with conversation_id
+    
+    If the client disconnects or the deadline passes, the Gemini call is
+    cancelled and any partial reply is saved with finish_reason
+    'cancelled' or 'timeout'.
+    
+    Users past their daily token quota get 429 before anything is saved
+    or sent to Gemini.
+    """
+    return await run_chat_turn(db, current_user, chat_request, request.is_disconnected, background_tasks.add_task)
+
+
+# WebSocket Chat
+
+def load_socket_user(token: str) -> Optional[CurrentUser]:
+    """User for a new /ws connection, or None."""
+    db = SessionLocal()
+    try:
+        return resolve_user(db, token)
+    finally:
+        db.close()
+
+
+async def authenticate_socket(token: str):
+    return await run_in_threadpool(load_socket_user, token)
+
+
+def refresh_token_versions():
+    db = SessionLocal()
+    try:
+        token_versions.refresh_if_stale(db)
+    finally:
+        db.close()
+
+
+async def socket_token_valid(token: str) -> bool:
+    # Reload revocations when they are older than TOKEN_VERSION_REFRESH_SECONDS,
+    # as resolve_user does, so an idle worker still sees /logout-all
+    if token_versions.stale:
+        await run_in_threadpool(refresh_token_versions)
+    return decode_token(token) is not None
+
+
+async def socket_chat_turn(connection: ChatConnection, chat_request: ChatRequest,
+                           on_start, on_text, is_cancelled) -> dict:
+    """A chat turn for a /ws connection, as the user it authenticated as."""
+    current_user = connection.user
+    
+    def started(turn: ChatTurn):
+        on_start(turn.conversation_id, turn.user_message)
+    
+    db = SessionLocal()
+    db.info["user_id"] = current_user.id
+    try:
+        return await run_chat_turn(
+            db, current_user, chat_request, is_cancelled, spawn_background,
+            on_start=started, on_text=on_text
+        )
+    finally:
+        db.close()
+
+
+async def profiled_socket_chat_turn(*args) -> dict:
+    # The middleware sees the connection, not its turns: profile each turn as a request
+    return await profiler.profile_call("WS", "/ws", socket_chat_turn, *args)
+
+
+@app.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat over one persistent connection (protocol: backend/chat_socket.py).
+    
+    Authenticates once with the first frame, then streams replies of
+    several conversations at once, with per-reply flow control and
+    heartbeats.
+    """
+    await ChatConnection(websocket, authenticate_socket, profiled_socket_chat_turn, socket_token_valid).serve()
+
+
+@app.get("/export")
+def export_history(
+    format: str = Query("ndjson", pattern="^(ndjson|zip)$"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Download all of the user's conversations and messages.
+    
+    Streams NDJSON (or a zip holding it) straight from the database, so
+    memory use doesn't grow with the size of the history.
+    """
+    # Long-running read: a replica when one is in rotation
+    session_factory = functools.partial(read_router.session_for_read, current_user.id)
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    filename = f"chat-history-{current_user.username}-{stamp}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "zip":
+        # Already deflated; application/zip is excluded from response compression
+        body, media_type = export_zip(current_user.id, current_user.username, session_factory), "application/zip"
+    else:
+        body, media_type = export_ndjson(current_user.id, current_user.username, session_factory), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@app.post("/import", response_model=ImportResponse)
+def import_history_file(
+    file: UploadFile = File(...),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Import conversations from an /export file (NDJSON or zip).
+    
+    Conversations are added as new ones; nothing existing is changed. An
+    invalid file imports nothing.
+    """
+    try:
+        counts = import_history(db, current_user.id, file.file)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return counts
+
+
+# Admin Endpoints
+
+# Rollup table, bucket of a moment, and how far back the report goes by default
+USAGE_PERIODS = {
+    "hourly": (UsageHourly, hour_start, timedelta(hours=24)),
+    "daily": (UsageDaily, day_start, timedelta(days=6)),
+}
+
+
+@app.get("/admin/usage", response_model=List[UsageRollupResponse])
+def get_usage(
+    period: str = Query("daily", pattern="^(hourly|daily)$"),
+    start: Optional[datetime] = Query(None, description="UTC; default: the last 7 days (daily) or 24 hours (hourly)"),
+    end: Optional[datetime] = Query(None, description="UTC, exclusive"),
+    user_id: Optional[int] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    admin: CurrentUser = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Token usage per user and hour/day, newest first.
+    
+    Read from the rollup tables, which trail new messages by up to
+    USAGE_ROLLUP_SECONDS.
+    """
+    table, bucket_of, default_span = USAGE_PERIODS[period]
+    since = start or bucket_of(datetime.utcnow() - default_span)
+    return repository.usage_report(db, table, since, end, user_id, limit)
+
+
+@app.post("/admin/profile")
+def start_profile(
+    requests: Optional[int] = Query(None, ge=1, description="Stop after this many requests"),
+    seconds: float = Query(60, gt=0, le=PROFILE_MAX_SECONDS, description="Stop after this long"),
+    slow_ms: float = Query(PROFILE_SLOW_REQUEST_MS, ge=0, description="Keep full captures of slower requests"),
+    interval_ms: float = Query(PROFILE_SAMPLE_INTERVAL_MS, ge=1, le=1000),
+    admin: CurrentUser = Depends(get_admin_user)
+):
+    """
+    Profile the next `requests` requests or `seconds`, whichever comes first.
+    
+    With shared state every worker joins the session within
+    PROFILE_SYNC_SECONDS and `requests` counts across workers. Starting a
+    session discards the previous one's results.
+    """
+    session = profiler.start(requests, seconds, slow_ms, interval_ms)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profiling session is already running")
+    return session.summary()
+
+
+@app.delete("/admin/profile")
+def stop_profile(admin: CurrentUser = Depends(get_admin_user)):
+    """Stop the running session early (in every worker); its results stay available."""
+    profiler.stop()
+    return _profile_session().summary()
+
+
+def _profile_session():
+    # Merged over the workers, so any worker can answer
+    session = profiler.results()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session")
+    return session
+
+
+@app.get("/admin/profile")
+def get_profile(admin: CurrentUser = Depends(get_admin_user)):
+    """Per-route latency, SQL and sample counts, and the slow requests kept."""
+    return _profile_session().summary()
+
+
+@app.get("/admin/profile/stacks", response_class=PlainTextResponse)
+def get_profile_stacks(
+    route: Optional[str] = Query(None, description='One route, e.g. "POST /chat"'),
+    slow_id: Optional[int] = Query(None, description="One slow request"),
+    admin: CurrentUser = Depends(get_admin_user)
+):
+    """Collapsed stacks for flamegraph.pl or speedscope; all routes are rooted at their name."""
+    stacks = _profile_session().collapsed(route=route, capture_id=slow_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="No such route or slow request")
+    return PlainTextResponse(stacks)
+
+
+@app.get("/admin/profile/slow/{capture_id}")
+def get_slow_request(capture_id: int, admin: CurrentUser = Depends(get_admin_user)):
+    """A slow request with the SQL it ran, in order."""
+    capture = _profile_session().slow_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="No such slow request")
+    return {
+        **capture.summary(),
+        "sql_log": [
+            {"statement": statement, "ms": round(seconds * 1000, 3)}
+            for statement, seconds in capture.sql
+        ],
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from backend.serve import main
+    main()
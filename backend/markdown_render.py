@@ -0,0 +1,217 @@
+"""
+Markdown Rendering
+------------------
+Renders assistant messages to sanitized HTML on the server, so opening a
+conversation only inserts ready-made HTML instead of running marked and
+highlight.js over every message in the browser.
+
+Renders are stored in `message_renders`, keyed by message id and renderer
+version (plus a hash of the content they were made from): once at write
+time for new replies, lazily on first read for older ones. Changing the
+renderer or its libraries changes the version, and messages re-render as
+they are read.
+
+Optional: needs `markdown` and `bleach` (and `pygments` for server-side
+code highlighting). Without them, or with MARKDOWN_RENDER_ENABLED=false,
+messages carry no HTML and the frontend renders markdown itself. Math
+($...$, $$...$$, \\(...\\), \\[...\\]) is passed through untouched for KaTeX.
+"""
+
+import hashlib
+import html
+import importlib.util
+import os
+import re
+import threading
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.config import load_env
+from backend.database import SessionLocal, is_replica
+from backend.models import MessageRender
+
+load_env()
+
+MARKDOWN_RENDER_ENABLED = os.getenv("MARKDOWN_RENDER_ENABLED", "true").lower() == "true"
+
+# Bump when the markdown extensions or the sanitizer allowlist change
+RENDER_FORMAT = 2
+
+ALLOWED_TAGS = {
+    "p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "strong", "em", "del",
+    "code", "pre", "blockquote", "ul", "ol", "li", "a", "table", "thead", "tbody",
+    "tr", "th", "td", "span", "div",
+}
+ALLOWED_ATTRIBUTES = {
+    "a": ["href", "title"],
+    "code": ["class"],
+    "pre": ["class"],
+    "span": ["class"],
+    "div": ["class"],
+    "th": ["align"],
+    "td": ["align"],
+    "ol": ["start"],
+}
+ALLOWED_PROTOCOLS = {"http", "https", "mailto"}
+
+# Code is matched first so math-like text inside it is left alone
+_PROTECTED = re.compile(
+    r"(?P<code>```.*?```|`[^`\n]+`)"
+    r"|(?P<math>\$\$.+?\$\$|\\\[.+?\\\]|\\\(.+?\\\)|(?<![\\$\w])\$(?=\S)[^$\n]+?(?<=\S)\$(?![\w$]))",
+    re.DOTALL,
+)
+_PLACEHOLDER = "MATHPLACEHOLDER{}X"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+class MarkdownRenderer:
+    """Markdown to sanitized HTML with Python-Markdown and bleach."""
+
+    def __init__(self):
+        import bleach
+        import markdown
+
+        self._markdown = markdown
+        self._bleach = bleach
+        self._local = threading.local()
+        pygments_version = "none"
+        if importlib.util.find_spec("pygments") is not None:
+            import pygments
+            pygments_version = pygments.__version__
+        self.version = f"{RENDER_FORMAT}:md{markdown.__version__}:bleach{bleach.__version__}:pyg{pygments_version}"
+
+    def _converter(self):
+        # Markdown instances keep per-document state; one per thread
+        converter = getattr(self._local, "converter", None)
+        if converter is None:
+            converter = self._markdown.Markdown(
+                extensions=["fenced_code", "codehilite", "tables", "nl2br", "sane_lists"],
+                extension_configs={
+                    "codehilite": {"guess_lang": False, "css_class": "codehilite"},
+                    "tables": {"use_align_attribute": True},
+                },
+            )
+            self._local.converter = converter
+        return converter
+
+    def render(self, text: str) -> str:
+        math = []
+
+        def protect(match):
+            if match.group("code"):
+                return match.group("code")
+            math.append(match.group("math"))
+            return _PLACEHOLDER.format(len(math) - 1)
+
+        converter = self._converter()
+        converter.reset()
+        rendered = converter.convert(_PROTECTED.sub(protect, text))
+        # Math goes back before sanitizing: a placeholder can end up inside an
+        # attribute (e.g. a link target), where the original must not escape it
+        for index, original in enumerate(math):
+            rendered = rendered.replace(_PLACEHOLDER.format(index), html.escape(original))
+        return self._bleach.clean(
+            rendered, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+            protocols=ALLOWED_PROTOCOLS, strip=True,
+        )
+
+
+class MessageRenderCache:
+    """Stored renders of assistant messages, per renderer version."""
+
+    def __init__(self, renderer: MarkdownRenderer):
+        self.renderer = renderer
+
+    def store(self, db: Session, message_id: int, content: str, rendered: Optional[str] = None) -> str:
+        """Render a new message (unless `rendered` is given) and add it to the session (the caller commits)."""
+        if rendered is None:
+            rendered = self.renderer.render(content)
+        db.add(MessageRender(
+            message_id=message_id,
+            renderer_version=self.renderer.version,
+            content_hash=content_hash(content),
+            html=rendered,
+            rendered_at=datetime.utcnow(),
+        ))
+        return rendered
+
+    def attach(self, db: Session, messages: List[dict]) -> List[dict]:
+        """The messages with "html" on assistant messages, rendering what isn't stored yet.
+
+        The given dicts are left alone: those missing "html" are returned as
+        copies. Dicts that already have "html" are returned as they are, so
+        callers can put the copies back into the history cache
+        (`HistoryCache.replace`) and render a hot conversation once per
+        process.
+        """
+        pending = {m["id"]: m for m in messages if m["role"] == "assistant" and "html" not in m}
+        if not pending:
+            return messages
+
+        stored = {
+            row.message_id: row
+            for row in db.execute(
+                select(MessageRender.message_id, MessageRender.renderer_version, MessageRender.content_hash,
+                       MessageRender.html)
+                .where(MessageRender.message_id.in_(list(pending)))
+            )
+        }
+        html = {}
+        renders = []
+        for message_id, message in pending.items():
+            digest = content_hash(message["content"])
+            row = stored.get(message_id)
+            if row is not None and row.renderer_version == self.renderer.version and row.content_hash == digest:
+                html[message_id] = row.html
+                continue
+            html[message_id] = self.renderer.render(message["content"])
+            renders.append(MessageRender(
+                message_id=message_id,
+                renderer_version=self.renderer.version,
+                content_hash=digest,
+                html=html[message_id],
+                rendered_at=datetime.utcnow(),
+            ))
+        if renders:
+            self._save(db, renders)
+        return [{**m, "html": html[m["id"]]} if m["id"] in html else m for m in messages]
+
+    @staticmethod
+    def _save(db: Session, renders: List[MessageRender]):
+        # Reads may come from a replica; renders are always written to the primary
+        writer = SessionLocal() if is_replica(db) else db
+        try:
+            for render in renders:
+                writer.merge(render)
+            writer.commit()
+        except IntegrityError:
+            # A concurrent read stored the same renders first
+            writer.rollback()
+        finally:
+            if writer is not db:
+                writer.close()
+
+
+_render_cache: Optional[MessageRenderCache] = None
+_render_cache_built = False
+_init_lock = threading.Lock()
+
+
+def get_render_cache() -> Optional[MessageRenderCache]:
+    """Return the render cache, or None when rendering is off or unavailable."""
+    global _render_cache, _render_cache_built
+    if not _render_cache_built:
+        with _init_lock:
+            if not _render_cache_built:
+                if MARKDOWN_RENDER_ENABLED:
+                    try:
+                        _render_cache = MessageRenderCache(MarkdownRenderer())
+                    except ImportError as e:
+                        print(f"⚠️ Server-side markdown rendering disabled ({e}); pip install markdown bleach")
+                _render_cache_built = True
+    return _render_cache
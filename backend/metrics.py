@@ -0,0 +1,134 @@
+"""
+Metrics
+-------
+Counters, gauges and histograms exported in Prometheus text format at
+GET /metrics, kept by the official client library (prometheus_client).
+
+With several workers (backend/serve.py), PROMETHEUS_MULTIPROC_DIR names a
+directory the workers of one node share: the client keeps each worker's
+values in memory-mapped files there, and the worker that answers the
+scrape merges them (the client's multiprocess mode). Counters and
+histograms include workers that have exited, so totals never go
+backwards. Gauges sum only live workers; a worker marks itself dead when
+it shuts down. Without the directory (one worker) the process's own
+values are exported.
+
+Each node exports its own series; Prometheus aggregates across nodes.
+Label values are declared up front, so every series is listed even before
+its first update.
+"""
+
+import glob
+import itertools
+import os
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from backend.config import load_env
+
+# prometheus_client picks its value storage from PROMETHEUS_MULTIPROC_DIR
+# when it is imported, so the .env file has to be loaded first
+load_env()
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)  # set but empty would mean the cwd
+
+import prometheus_client  # noqa: E402
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess  # noqa: E402
+
+# Shared by the workers of one node; empty means a single worker
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Only the totals; *_created series would double the exposition for nothing
+prometheus_client.disable_created_metrics()
+
+
+class _Metric:
+    """A prometheus_client metric whose label values are declared up front."""
+
+    def __init__(self, metric, name: str, labels: Optional[Dict[str, Iterable[str]]]):
+        self._metric = metric
+        self.name = name
+        self.label_names: Tuple[str, ...] = tuple((labels or {}).keys())
+        self._children = {}
+        if labels:
+            for values in itertools.product(*labels.values()):
+                values = tuple(str(value) for value in values)
+                self._children[values] = metric.labels(*values)
+
+    def _child(self, labels: Dict[str, str]):
+        if not self.label_names:
+            if labels:
+                raise ValueError(f"Undeclared labels for {self.name}: {labels}")
+            return self._metric
+        try:
+            return self._children[tuple(str(labels[name]) for name in self.label_names)]
+        except KeyError:
+            raise ValueError(f"Undeclared labels for {self.name}: {labels}")
+
+
+class Counter(_Metric):
+    def inc(self, amount: float = 1, **labels):
+        self._child(labels).inc(amount)
+
+
+class Gauge(Counter):
+    """A value that goes up and down (e.g. queue depth), summed across live workers."""
+
+    def dec(self, amount: float = 1, **labels):
+        self._child(labels).dec(amount)
+
+    def set(self, value: float, **labels):
+        self._child(labels).set(value)
+
+
+class Histogram(_Metric):
+    def observe(self, value: float, **labels):
+        self._child(labels).observe(value)
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        # Our own registry rather than the client's global one, so importing
+        # the app doesn't also export the client's process/platform metrics
+        self._registry = CollectorRegistry(auto_describe=True)
+
+    def counter(self, name: str, documentation: str, labels=None) -> Counter:
+        return Counter(prometheus_client.Counter(
+            name, documentation, tuple((labels or {}).keys()), registry=self._registry,
+        ), name, labels)
+
+    def gauge(self, name: str, documentation: str, labels=None) -> Gauge:
+        return Gauge(prometheus_client.Gauge(
+            name, documentation, tuple((labels or {}).keys()), registry=self._registry,
+            multiprocess_mode="livesum",
+        ), name, labels)
+
+    def histogram(self, name: str, documentation: str, labels=None,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return Histogram(prometheus_client.Histogram(
+            name, documentation, tuple((labels or {}).keys()), registry=self._registry, buckets=buckets,
+        ), name, labels)
+
+    def render(self) -> bytes:
+        """All metrics of the node's workers in Prometheus text exposition format."""
+        if not self.directory:
+            return generate_latest(self._registry)
+        merged = CollectorRegistry()
+        multiprocess.MultiProcessCollector(merged, path=self.directory)
+        return generate_latest(merged)
+
+    def close(self):
+        """Drop this worker's gauges from the node's totals (call on shutdown)."""
+        if self.directory:
+            multiprocess.mark_process_dead(os.getpid(), self.directory)
+
+
+def reset_metrics_dir(directory: str):
+    """Remove the values of a previous run (call before starting the workers)."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,203 @@
+"""
+Schema Migrations
+-----------------
+Versioned, forward-only migrations recorded in the `schema_migrations` table.
+
+    python -m backend.migrations upgrade    # apply pending migrations
+    python -m backend.migrations status     # list applied/pending versions
+
+Adding a migration: write a `_NNNN_description(conn)` function below and
+append it to MIGRATIONS, and update backend/models.py to match. The schema
+only ever comes from these migrations (`init_db` runs them too).
+"""
+
+import sys
+from datetime import datetime
+from sqlalchemy import (
+    MetaData, Table, Column, Index, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean,
+    text
+)
+from sqlalchemy.engine import Connection, Engine
+
+
+def _add_column(conn: Connection, table: str, name: str, ddl_type: str):
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+
+def _0001_baseline(conn: Connection):
+    """Tables as they existed before migrations; adopts databases from before migrations existed."""
+    metadata = MetaData()
+    Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("email", String(255), unique=True, index=True, nullable=False),
+        Column("username", String(100), unique=True, index=True, nullable=False),
+        Column("hashed_password", String(255), nullable=False),
+        Column("full_name", String(255)),
+        Column("is_active", Boolean),
+        Column("created_at", DateTime),
+    )
+    Table(
+        "conversations", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("title", String(255)),
+        Column("created_at", DateTime, index=True),
+        Column("updated_at", DateTime),
+    )
+    Table(
+        "chat_messages", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("conversation_id", Integer, ForeignKey("conversations.id"), nullable=False),
+        Column("role", String(20), nullable=False),
+        Column("content", Text, nullable=False),
+        Column("timestamp", DateTime, index=True),
+    )
+    metadata.create_all(conn, checkfirst=True)
+
+
+def _0002_user_token_versions(conn: Connection):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "user_token_versions", metadata,
+        Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        Column("version", Integer, nullable=False),
+        Column("updated_at", DateTime, index=True),
+    )
+    metadata.tables["user_token_versions"].create(conn, checkfirst=True)
+
+
+def _0003_chat_history_indexes(conn: Connection):
+    """Index the foreign keys used by history loads, message counts and cascades."""
+    # Plain CREATE INDEX locks writes on Postgres while it builds; for large
+    # existing tables, run it CONCURRENTLY by hand first (IF NOT EXISTS then skips)
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_conversation_id_timestamp "
+        "ON chat_messages (conversation_id, timestamp)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user_id_updated_at "
+        "ON conversations (user_id, updated_at)"
+    ))
+
+
+def _0004_message_finish_reason(conn: Connection):
+    _add_column(conn, "chat_messages", "finish_reason", "VARCHAR(20)")
+
+
+def _0005_message_renders(conn: Connection):
+    metadata = MetaData()
+    Table("chat_messages", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "message_renders", metadata,
+        Column("message_id", Integer, ForeignKey("chat_messages.id", ondelete="CASCADE"), primary_key=True),
+        Column("renderer_version", String(64), nullable=False),
+        Column("content_hash", String(32), nullable=False),
+        Column("html", Text, nullable=False),
+        Column("rendered_at", DateTime),
+    )
+    metadata.tables["message_renders"].create(conn, checkfirst=True)
+
+
+def _0006_token_usage(conn: Connection):
+    """Per-message token counts, the per-user usage ledger and its hourly/daily rollups."""
+    _add_column(conn, "chat_messages", "prompt_tokens", "INTEGER")
+    _add_column(conn, "chat_messages", "completion_tokens", "INTEGER")
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "usage_ledger", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        Column("timestamp", DateTime, nullable=False),
+        Column("prompt_tokens", Integer, nullable=False),
+        Column("completion_tokens", Integer, nullable=False),
+        Index("ix_usage_ledger_user_id_timestamp", "user_id", "timestamp"),
+    )
+    for name in ("usage_hourly", "usage_daily"):
+        Table(
+            name, metadata,
+            Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+            Column("bucket_start", DateTime, primary_key=True, index=True),
+            Column("prompt_tokens", BigInteger, nullable=False),
+            Column("completion_tokens", BigInteger, nullable=False),
+            Column("message_count", Integer, nullable=False),
+        )
+    Table(
+        "usage_rollup_state", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("last_ledger_id", Integer, nullable=False),
+        Column("updated_at", DateTime),
+    )
+    for name in ("usage_ledger", "usage_hourly", "usage_daily", "usage_rollup_state"):
+        metadata.tables[name].create(conn, checkfirst=True)
+    conn.execute(
+        text("INSERT INTO usage_rollup_state (id, last_ledger_id, updated_at) VALUES (1, 0, :now)"),
+        {"now": datetime.utcnow()}
+    )
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _0001_baseline),
+    (2, "user token versions", _0002_user_token_versions),
+    (3, "chat history indexes", _0003_chat_history_indexes),
+    (4, "message finish reason", _0004_message_finish_reason),
+    (5, "message renders", _0005_message_renders),
+    (6, "token usage", _0006_token_usage),
+]
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def applied_versions(engine: Engine) -> set:
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def upgrade(engine: Engine) -> list:
+    """Apply pending migrations in order, each in its own transaction.
+
+    Returns the versions applied.
+    """
+    done = applied_versions(engine)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        print(f"✅ Applied migration {version:04d}: {name}")
+        applied.append(version)
+    return applied
+
+
+def main(argv=None):
+    from backend.database import engine
+
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "upgrade"
+    if command == "upgrade":
+        if not upgrade(engine):
+            print("✅ Database schema is up to date")
+    elif command == "status":
+        done = applied_versions(engine)
+        for version, name, _ in MIGRATIONS:
+            state = "applied" if version in done else "pending"
+            print(f"{version:04d}  {state:<8} {name}")
+    else:
+        print(f"Unknown command '{command}'. Use 'upgrade' or 'status'.")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
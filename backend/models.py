@@ -4,7 +4,7 @@ Database Models
 SQLAlchemy models for users, chat sessions, and chat messages.
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -43,6 +43,11 @@ class Conversation(Base):
     # Relationships
     user = relationship("User", back_populates="conversations")
     messages = relationship("ChatMessage", back_populates="conversation", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Conversation list: WHERE user_id = ? ORDER BY updated_at DESC
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
 
 
 class ChatMessage(Base):
@@ -55,6 +60,90 @@ class ChatMessage(Base):
     role = Column(String(20), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    # Assistant messages: 'stop', or 'timeout'/'cancelled' when truncated
+    finish_reason = Column(String(20), nullable=True)
+    # Assistant messages: tokens used by the LLM call that produced them
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
     
     # Relationship
     conversation = relationship("Conversation", back_populates="messages")
+    
+    __table_args__ = (
+        # History loads, message counts and cascading deletes by conversation
+        Index("ix_chat_messages_conversation_id_timestamp", "conversation_id", "timestamp"),
+    )
+
+
+class UserTokenVersion(Base):
+    """Per-user token version; bumping it revokes every token issued before."""
+    
+    __tablename__ = "user_token_versions"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+class MessageRender(Base):
+    """Sanitized HTML of an assistant message, from a given renderer version."""
+    
+    __tablename__ = "message_renders"
+    
+    message_id = Column(Integer, ForeignKey("chat_messages.id", ondelete="CASCADE"), primary_key=True)
+    renderer_version = Column(String(64), nullable=False)
+    # Guards against stale renders if a message id is ever reused
+    content_hash = Column(String(32), nullable=False)
+    html = Column(Text, nullable=False)
+    rendered_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UsageHourly(Base):
+    """Tokens used per user per hour (UTC), rolled up from usage_ledger."""
+    
+    __tablename__ = "usage_hourly"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    message_count = Column(Integer, nullable=False, default=0)
+
+
+class UsageDaily(Base):
+    """Tokens used per user per day (UTC), rolled up from usage_ledger."""
+    
+    __tablename__ = "usage_daily"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    message_count = Column(Integer, nullable=False, default=0)
+
+
+class UsageLedgerEntry(Base):
+    """Tokens of one LLM call, keyed by user so deleting conversations doesn't erase usage."""
+    
+    __tablename__ = "usage_ledger"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        # Quota reloads: one user's entries since midnight
+        Index("ix_usage_ledger_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+
+class UsageRollupState(Base):
+    """Single row: the newest ledger entry already counted in the rollups."""
+    
+    __tablename__ = "usage_rollup_state"
+    
+    id = Column(Integer, primary_key=True)
+    last_ledger_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,624 @@
+"""
+On-Demand Profiling
+-------------------
+An admin starts a profiling session (POST /admin/profile) for the next N
+requests or T seconds. While it runs:
+
+- a sampling thread snapshots every thread's stack each
+  PROFILE_SAMPLE_INTERVAL_MS and charges the sample to the request that
+  thread is serving;
+- every SQL statement is timed and logged against its request;
+- requests slower than the session's threshold are kept whole (their
+  stacks plus SQL log) for inspection.
+
+Results are aggregated per route and served as collapsed stacks ("a;b;c 12"
+lines, ready for flamegraph.pl or speedscope). Chat turns on /ws
+connections are profiled as requests too ("WS /ws"), through
+`Profiler.profile_call`.
+
+Outside a session the middleware is a single attribute check per request:
+no sampler thread runs and no SQL listeners are installed.
+
+With shared state (several workers), a session covers every worker: the
+worker that starts it publishes it under `profile:current`, and the others
+join (or stop) within PROFILE_SYNC_SECONDS. Each worker publishes its
+results under its own key, and `Profiler.results()` merges them, so the
+GET endpoints answer the same whichever worker takes the request. The
+request limit counts requests across workers, checked at each sync. With
+memory:// state a session covers only the worker that took the request.
+
+Attribution: a request's coroutine chain runs under the middleware frame,
+so samples of the event-loop thread are matched by walking up to it.
+Threadpool work (sync routes, run_in_threadpool) runs inside a copy of
+the request's context, which the worker thread's stack holds.
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import event
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.engine import Engine
+from backend.config import load_env
+from backend.shared_state import SharedState, get_shared_state
+
+load_env()
+
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# Default threshold for keeping a request's full capture
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "1000"))
+# Longest session an admin can start
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "600"))
+PROFILE_MAX_SLOW_CAPTURES = 50
+# SQL statements logged per request (all are counted)
+PROFILE_MAX_SQL_PER_REQUEST = 200
+# Latencies kept per route for percentiles
+PROFILE_MAX_DURATIONS = 10000
+MAX_STACK_DEPTH = 200
+# The profiler's own endpoints are left out of its results
+PROFILE_ENDPOINTS_PREFIX = "/admin/profile"
+# How often workers follow the shared session and publish their results
+PROFILE_SYNC_SECONDS = float(os.getenv("PROFILE_SYNC_SECONDS", "1"))
+# Published sessions and results stay readable this long
+PROFILE_RESULTS_TTL = 3600
+# Slow request ids are unique across workers: worker n numbers from (n - 1) * this + 1
+CAPTURE_IDS_PER_WORKER = 1_000_000
+
+_current_capture: contextvars.ContextVar = contextvars.ContextVar("profiling_capture", default=None)
+_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_frame_labels: Dict[object, str] = {}
+
+
+def _frame_label(code) -> str:
+    label = _frame_labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_project_root):
+            filename = os.path.relpath(filename, _project_root)
+        elif "site-packages" in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[1]
+        else:
+            filename = os.path.basename(filename)
+        label = f"{getattr(code, 'co_qualname', code.co_name)} ({filename})"
+        _frame_labels[code] = label
+    return label
+
+
+class RequestCapture:
+    """What one request did while a session was running."""
+
+    def __init__(self, capture_id: int, scope: dict):
+        self.id = capture_id
+        self.method = scope.get("method", "")
+        self.path = scope.get("path", "")
+        self.route: Optional[str] = None
+        self.endpoint: Optional[str] = None
+        self.status = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples: Counter = Counter()
+        self.sql: List[tuple] = []
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+    def add_sql(self, statement: str, seconds: float):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.sql) < PROFILE_MAX_SQL_PER_REQUEST:
+            self.sql.append((statement, seconds))
+
+    _FIELDS = ("id", "method", "path", "route", "endpoint", "status", "started_at", "duration",
+               "sql", "sql_count", "sql_seconds")
+
+    def to_dict(self) -> dict:
+        return {**{name: getattr(self, name) for name in self._FIELDS}, "samples": dict(self.samples)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RequestCapture":
+        capture = cls(data["id"], {})
+        for name in cls._FIELDS:
+            setattr(capture, name, data[name])
+        capture.sql = [tuple(item) for item in data["sql"]]
+        capture.samples = Counter(data["samples"])
+        return capture
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "sql_queries": self.sql_count,
+            "sql_ms": round(self.sql_seconds * 1000, 2),
+            "samples": sum(self.samples.values()),
+        }
+
+
+class RouteStats:
+    def __init__(self, endpoint: Optional[str]):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.durations: List[float] = []
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.samples: Counter = Counter()
+
+    def add(self, capture: RequestCapture):
+        self.requests += 1
+        if len(self.durations) < PROFILE_MAX_DURATIONS:
+            self.durations.append(capture.duration)
+        self.sql_count += capture.sql_count
+        self.sql_seconds += capture.sql_seconds
+        self.samples.update(capture.samples)
+
+    def to_dict(self) -> dict:
+        return {
+            "endpoint": self.endpoint, "requests": self.requests, "durations": self.durations,
+            "sql_count": self.sql_count, "sql_seconds": self.sql_seconds, "samples": dict(self.samples),
+        }
+
+    def merge(self, data: dict):
+        """Add another worker's stats for the same route (from `to_dict`)."""
+        self.endpoint = self.endpoint or data["endpoint"]
+        self.requests += data["requests"]
+        room = PROFILE_MAX_DURATIONS - len(self.durations)
+        self.durations.extend(data["durations"][:max(room, 0)])
+        self.sql_count += data["sql_count"]
+        self.sql_seconds += data["sql_seconds"]
+        self.samples.update(data["samples"])
+
+    def summary(self, route: str) -> dict:
+        ordered = sorted(self.durations)
+
+        def percentile(fraction):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 2)
+
+        return {
+            "route": route,
+            "endpoint": self.endpoint,
+            "requests": self.requests,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2),
+            "sql_queries_per_request": round(self.sql_count / self.requests, 2),
+            "sql_ms_per_request": round(self.sql_seconds * 1000 / self.requests, 2),
+            "samples": sum(self.samples.values()),
+        }
+
+
+class ProfileSession:
+    """One profiling run: per-route aggregates and the slow requests it kept."""
+
+    def __init__(self, max_requests: Optional[int], seconds: float, slow_ms: float, interval_ms: float,
+                 session_id: Optional[int] = None, worker: int = 1, started_at: Optional[float] = None):
+        self.max_requests = max_requests
+        self.seconds = seconds
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        # Shared sessions have an id; `worker` is this worker's slot in it
+        self.id = session_id
+        self.worker = worker
+        self.started_at = started_at or time.time()
+        # Workers that join late still stop when the session does
+        self.deadline = time.monotonic() + max(0.0, self.started_at + seconds - time.time())
+        self.stopped_at: Optional[float] = None
+        self.stop_reason: Optional[str] = None
+        self.requests_seen = 0
+        self.sample_passes = 0
+        self.routes: Dict[str, RouteStats] = {}
+        self.slow: deque = deque(maxlen=PROFILE_MAX_SLOW_CAPTURES)
+        self.lock = threading.Lock()
+        self._ids = itertools.count((worker - 1) * CAPTURE_IDS_PER_WORKER + 1)
+
+    @classmethod
+    def from_spec(cls, spec: dict, worker: int = 1) -> "ProfileSession":
+        """A session from its published settings (`Profiler.start`)."""
+        return cls(spec["max_requests"], spec["seconds"], spec["slow_ms"], spec["interval_ms"],
+                   session_id=spec["id"], worker=worker, started_at=spec["started_at"])
+
+    def results(self) -> dict:
+        """What this worker recorded, as published for the others."""
+        with self.lock:
+            return {
+                "requests_seen": self.requests_seen,
+                "sample_passes": self.sample_passes,
+                "routes": {name: stats.to_dict() for name, stats in self.routes.items()},
+                "slow": [capture.to_dict() for capture in self.slow],
+            }
+
+    def merge(self, results: dict):
+        """Add one worker's `results()`."""
+        with self.lock:
+            self.requests_seen += results["requests_seen"]
+            self.sample_passes += results["sample_passes"]
+            for name, data in results["routes"].items():
+                stats = self.routes.get(name)
+                if stats is None:
+                    stats = self.routes[name] = RouteStats(data["endpoint"])
+                stats.merge(data)
+            slow = list(self.slow) + [RequestCapture.from_dict(data) for data in results["slow"]]
+            self.slow = deque(sorted(slow, key=lambda c: c.started_at), maxlen=PROFILE_MAX_SLOW_CAPTURES)
+
+    def new_capture(self, scope: dict) -> RequestCapture:
+        return RequestCapture(next(self._ids), scope)
+
+    def finished(self) -> bool:
+        if self.max_requests is not None and self.requests_seen >= self.max_requests:
+            return True
+        return time.monotonic() >= self.deadline
+
+    def record(self, capture: RequestCapture):
+        with self.lock:
+            key = f"{capture.method} {capture.route or capture.path}"
+            stats = self.routes.get(key)
+            if stats is None:
+                stats = self.routes[key] = RouteStats(capture.endpoint)
+            stats.add(capture)
+            self.requests_seen += 1
+            if capture.duration * 1000 >= self.slow_ms:
+                self.slow.append(capture)
+
+    def slow_capture(self, capture_id: int) -> Optional[RequestCapture]:
+        return next((c for c in self.slow if c.id == capture_id), None)
+
+    def collapsed(self, route: Optional[str] = None, capture_id: Optional[int] = None) -> Optional[str]:
+        """Collapsed stacks; rooted at the route name unless one route or request is picked."""
+        with self.lock:
+            if capture_id is not None:
+                capture = self.slow_capture(capture_id)
+                if capture is None:
+                    return None
+                stacks = capture.samples.items()
+            elif route is not None:
+                if route not in self.routes:
+                    return None
+                stacks = self.routes[route].samples.items()
+            else:
+                stacks = [
+                    (f"{name};{stack}", count)
+                    for name, stats in self.routes.items()
+                    for stack, count in stats.samples.items()
+                ]
+            return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+    def summary(self) -> dict:
+        with self.lock:
+            routes = sorted(
+                (stats.summary(name) for name, stats in self.routes.items()),
+                key=lambda r: r["p50_ms"] * r["requests"], reverse=True
+            )
+            slow = [capture.summary() for capture in self.slow]
+        return {
+            "active": self.stopped_at is None,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "stop_reason": self.stop_reason,
+            "max_requests": self.max_requests,
+            "seconds": self.seconds,
+            "slow_ms": self.slow_ms,
+            "interval_ms": self.interval * 1000,
+            "requests_seen": self.requests_seen,
+            "sample_passes": self.sample_passes,
+            "routes": routes,
+            "slow_requests": slow,
+        }
+
+
+def _request_stack(frame):
+    """(capture, collapsed stack) for a thread's current frame, or (None, None)."""
+    codes = []
+    capture = None
+    while frame is not None:
+        code = frame.f_code
+        if code in _CAPTURE_ROOTS:
+            capture = frame.f_locals.get("capture")
+            break
+        if "context" in code.co_varnames:
+            # Worker threads run requests' sync code via context.run(...)
+            context = frame.f_locals.get("context")
+            if isinstance(context, contextvars.Context):
+                capture = context.get(_current_capture)
+                if capture is not None:
+                    break
+        codes.append(code)
+        frame = frame.f_back
+    if capture is None or not codes:
+        return None, None
+    return capture, ";".join(_frame_label(code) for code in reversed(codes[:MAX_STACK_DEPTH]))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_capture.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _current_capture.get()
+    starts = conn.info.get("profile_query_start")
+    if capture is not None and starts:
+        capture.add_sql(statement, time.perf_counter() - starts.pop())
+
+
+def _running(spec: dict) -> bool:
+    return spec["stopped_at"] is None and time.time() < spec["started_at"] + spec["seconds"]
+
+
+class Profiler:
+    """Starts and stops sessions; at most one runs at a time.
+
+    With shared state, `start` and `stop` act on every worker, and
+    `start_sync` follows sessions started elsewhere.
+    """
+
+    def __init__(self, state: Optional[SharedState] = None, sync_seconds: float = PROFILE_SYNC_SECONDS):
+        self.session: Optional[ProfileSession] = None
+        self.last: Optional[ProfileSession] = None
+        self.sync_seconds = sync_seconds
+        self._state = state
+        self._lock = threading.Lock()
+        # Requests of the running session already added to the shared count
+        self._reported = 0
+        self._stop_sync = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+
+    @property
+    def state(self) -> SharedState:
+        if self._state is None:
+            self._state = get_shared_state()
+        return self._state
+
+    @staticmethod
+    def _results_key(session_id: int, worker: int) -> str:
+        return f"profile:{session_id}:worker:{worker}"
+
+    def _current(self) -> Optional[dict]:
+        """The latest session started in any worker, as published."""
+        spec = self.state.get("profile:current")
+        return json.loads(spec) if spec else None
+
+    def _publish_spec(self, spec: dict):
+        self.state.set("profile:current", json.dumps(spec), ttl=PROFILE_RESULTS_TTL)
+
+    def _publish_results(self, session: ProfileSession):
+        key = self._results_key(session.id, session.worker)
+        self.state.set(key, json.dumps(session.results()), ttl=PROFILE_RESULTS_TTL)
+
+    def start(self, max_requests: Optional[int] = None, seconds: float = 60,
+              slow_ms: float = PROFILE_SLOW_REQUEST_MS,
+              interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS) -> Optional[ProfileSession]:
+        """Start a session (in every worker, with shared state); None if one is already running."""
+        if self.session is not None:
+            return None
+        spec = {
+            "id": None, "max_requests": max_requests, "seconds": min(seconds, PROFILE_MAX_SECONDS),
+            "slow_ms": slow_ms, "interval_ms": interval_ms, "started_at": time.time(),
+            "stopped_at": None, "stop_reason": None,
+        }
+        if self.state.is_shared:
+            current = self._current()
+            if current is not None and _running(current):
+                return None
+            spec["id"] = self.state.incr("profile:sequence")
+            self._publish_spec(spec)
+        return self._join(spec)
+
+    def _join(self, spec: dict) -> Optional[ProfileSession]:
+        with self._lock:
+            if self.session is not None:
+                return None
+            worker = 1
+            if spec["id"] is not None:
+                worker = self.state.incr(f"profile:{spec['id']}:workers", ttl=PROFILE_RESULTS_TTL)
+            session = ProfileSession.from_spec(spec, worker)
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            self.session = self.last = session
+            self._reported = 0
+            threading.Thread(target=self._sample, args=(session,), name="profiler", daemon=True).start()
+        print(f"✅ Profiling started ({spec['max_requests'] or 'any number of'} requests, "
+              f"up to {session.seconds:g}s)")
+        return session
+
+    def stop(self, reason: str = "stopped") -> Optional[ProfileSession]:
+        """Stop the running session, in every worker with shared state; returns this worker's part."""
+        session = self._stop_local(reason)
+        if self.state.is_shared:
+            current = self._current()
+            if current is not None and current["stopped_at"] is None:
+                current.update(stopped_at=time.time(), stop_reason=reason)
+                self._publish_spec(current)
+        return session
+
+    def _stop_local(self, reason: str) -> Optional[ProfileSession]:
+        with self._lock:
+            session = self.session
+            if session is None:
+                return None
+            self.session = None
+            event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+            session.stopped_at = time.time()
+            session.stop_reason = reason
+        print(f"✅ Profiling stopped ({reason}): {session.requests_seen} requests, {len(session.slow)} slow")
+        if session.id is not None:
+            self._publish_results(session)
+        return session
+
+    async def finish(self, session: ProfileSession, capture: RequestCapture):
+        """Record a profiled request; stops the session once it reaches its limits.
+
+        Stopping writes the session's results to shared state (a network
+        round trip, and JSON of every route's stacks), so it runs in the
+        threadpool rather than on the event loop.
+        """
+        session.record(capture)
+        if session.finished():
+            await run_in_threadpool(self.stop, "limit reached")
+
+    def results(self) -> Optional[ProfileSession]:
+        """The current (or last) session with the results of every worker that took part."""
+        current = self._current() if self.state.is_shared else None
+        if current is None:
+            return self.last
+        merged = ProfileSession.from_spec(current)
+        merged.stopped_at, merged.stop_reason = current["stopped_at"], current["stop_reason"]
+        if merged.stopped_at is None and not _running(current):
+            merged.stopped_at, merged.stop_reason = current["started_at"] + current["seconds"], "limit reached"
+        local = self.last if self.last is not None and self.last.id == current["id"] else None
+        workers = int(self.state.get(f"profile:{current['id']}:workers") or 0)
+        for worker in range(1, workers + 1):
+            if local is not None and worker == local.worker:
+                # Our own results are read live rather than as last published
+                merged.merge(local.results())
+                continue
+            results = self.state.get(self._results_key(current["id"], worker))
+            if results is not None:
+                merged.merge(json.loads(results))
+        return merged
+
+    def sync(self):
+        """Join, stop or report on the shared session (one pass of the sync thread)."""
+        current = self._current()
+        session = self.session
+        if session is None:
+            if current is not None and _running(current) and (self.last is None or self.last.id != current["id"]):
+                self._join(current)
+            return
+        if current is None or current["id"] != session.id:
+            self._stop_local("superseded")
+        elif current["stopped_at"] is not None:
+            self._stop_local(current["stop_reason"])
+        else:
+            seen = session.requests_seen
+            total = self.state.incr(f"profile:{session.id}:requests", seen - self._reported, ttl=PROFILE_RESULTS_TTL)
+            self._reported = seen
+            self._publish_results(session)
+            if session.max_requests is not None and total >= session.max_requests:
+                self.stop("limit reached")
+
+    def start_sync(self):
+        """Follow sessions started in other workers (only with shared state)."""
+        if not self.state.is_shared or self._sync_thread is not None:
+            return
+        self._stop_sync.clear()
+        self._sync_thread = threading.Thread(target=self._run_sync, name="profiler-sync", daemon=True)
+        self._sync_thread.start()
+
+    def _run_sync(self):
+        while not self._stop_sync.wait(self.sync_seconds):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"⚠️ Profiler sync failed: {e}")
+
+    def close(self):
+        """Shutdown: stop this worker's part of the session (the other workers carry on)."""
+        self._stop_sync.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join(timeout=self.sync_seconds)
+            self._sync_thread = None
+        self._stop_local("shutdown")
+
+    async def profile_call(self, method: str, path: str, func: Callable[..., Awaitable], *args):
+        """`await func(*args)`, profiled as a request while a session runs.
+
+        For work the middleware doesn't see as requests, such as the chat
+        turns of a /ws connection.
+        """
+        session = self.session
+        if session is None:
+            return await func(*args)
+        return await _profiled_call(self, session, method, path, func, args)
+
+    def _sample(self, session: ProfileSession):
+        me = threading.get_ident()
+        while self.session is session:
+            time.sleep(session.interval)
+            if session.finished():
+                self.stop("limit reached")
+                return
+            frames = sys._current_frames()
+            with session.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == me:
+                        continue
+                    capture, stack = _request_stack(frame)
+                    if capture is not None:
+                        capture.samples[stack] += 1
+                session.sample_passes += 1
+            del frames
+
+
+async def _profiled_call(profiler: Profiler, session: ProfileSession, method: str, path: str,
+                         func: Callable[..., Awaitable], args: tuple):
+    capture = session.new_capture({"method": method, "path": path})
+    capture.route, capture.endpoint = path, func.__name__
+    capture.status = 500
+    token = _current_capture.set(capture)
+    started = time.perf_counter()
+    try:
+        result = await func(*args)
+        capture.status = 200
+        return result
+    except Exception as e:
+        # HTTPException and friends carry the status they would have answered with
+        capture.status = getattr(e, "status_code", 500)
+        raise
+    finally:
+        capture.duration = time.perf_counter() - started
+        _current_capture.reset(token)
+        await profiler.finish(session, capture)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware; outside a session it only forwards the call."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        session = self.profiler.session
+        if session is None or scope["type"] != "http" or scope["path"].startswith(PROFILE_ENDPOINTS_PREFIX):
+            return await self.app(scope, receive, send)
+        await self._profiled(session, scope, receive, send)
+
+    async def _profiled(self, session: ProfileSession, scope, receive, send):
+        capture = session.new_capture(scope)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _current_capture.set(capture)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            capture.duration = time.perf_counter() - started
+            _current_capture.reset(token)
+            capture.status = status
+            route = scope.get("route")
+            capture.route = getattr(route, "path", None)
+            endpoint = scope.get("endpoint")
+            capture.endpoint = getattr(endpoint, "__name__", None)
+            await self.profiler.finish(session, capture)
+
+
+# Frames whose `capture` local is the request a sampled stack belongs to
+_CAPTURE_ROOTS = {ProfilingMiddleware._profiled.__code__, _profiled_call.__code__}
+
+profiler = Profiler()
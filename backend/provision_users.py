@@ -0,0 +1,225 @@
+"""
+Bulk User Provisioning
+----------------------
+Creates user accounts from a CSV or JSON file.
+
+    python -m backend.provision_users employees.csv
+    python -m backend.provision_users employees.json --workers 8 --dry-run
+    python -m backend.provision_users backend/test_users.csv   # local test accounts
+
+CSV files need a header row with username, email and password columns
+(full_name is optional); JSON files hold a list of objects with the same
+keys. Users whose username or email already exists are skipped.
+
+Existing accounts are found with one set-based query before any password
+is hashed. Hashing (bcrypt, deliberately slow) runs in a process pool
+across all cores, and rows are inserted in batches with
+INSERT ... ON CONFLICT DO NOTHING, so a concurrent signup can't fail the run.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+from backend.auth import get_password_hash
+from backend.models import User
+
+REQUIRED_FIELDS = ("username", "email", "password")
+DEFAULT_BATCH_SIZE = 1000
+# Largest IN list sent in one existence query (SQLite caps bound parameters)
+LOOKUP_CHUNK_SIZE = 10000
+
+
+@dataclass
+class ProvisionReport:
+    read: int = 0
+    invalid: List[str] = field(default_factory=list)
+    duplicates_in_file: int = 0
+    already_exist: int = 0
+    inserted: int = 0
+    # Created by someone else between the lookup and the insert
+    conflicts: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def read_users(path: str, file_format: Optional[str] = None) -> List[dict]:
+    """Rows from a CSV (with header) or JSON (list of objects) file."""
+    file_format = file_format or ("json" if path.lower().endswith(".json") else "csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format == "json":
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError("JSON input must be a list of user objects")
+            return rows
+        return list(csv.DictReader(f))
+
+
+def clean_users(rows: List[dict], report: ProvisionReport) -> List[dict]:
+    """Validate rows and drop repeated usernames/emails within the file."""
+    users = []
+    seen_usernames: Set[str] = set()
+    seen_emails: Set[str] = set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            report.invalid.append(f"row {number}: not an object")
+            continue
+        values = {key: str(row.get(key) or "").strip() for key in REQUIRED_FIELDS}
+        missing = [key for key in REQUIRED_FIELDS if not values[key]]
+        if missing:
+            report.invalid.append(f"row {number}: missing {', '.join(missing)}")
+            continue
+        if "@" not in values["email"]:
+            report.invalid.append(f"row {number}: invalid email {values['email']!r}")
+            continue
+        # Passwords are kept verbatim, whitespace included
+        values["password"] = str(row["password"])
+        if values["username"] in seen_usernames or values["email"] in seen_emails:
+            report.duplicates_in_file += 1
+            continue
+        seen_usernames.add(values["username"])
+        seen_emails.add(values["email"])
+        values["full_name"] = str(row.get("full_name") or "").strip() or None
+        users.append(values)
+    return users
+
+
+def existing_accounts(db: Session, users: List[dict]) -> Tuple[Set[str], Set[str]]:
+    """Usernames and emails among `users` that are already taken."""
+    usernames: Set[str] = set()
+    emails: Set[str] = set()
+    for start in range(0, len(users), LOOKUP_CHUNK_SIZE):
+        chunk = users[start:start + LOOKUP_CHUNK_SIZE]
+        rows = db.execute(
+            select(User.username, User.email).where(or_(
+                User.username.in_([u["username"] for u in chunk]),
+                User.email.in_([u["email"] for u in chunk]),
+            ))
+        )
+        for username, email in rows:
+            usernames.add(username)
+            emails.add(email)
+    return usernames, emails
+
+
+def hash_passwords(passwords: List[str], workers: int) -> List[str]:
+    if workers <= 1 or len(passwords) < 2:
+        return [get_password_hash(p) for p in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(get_password_hash, passwords, chunksize=chunksize))
+
+
+def _insert_ignoring_conflicts(db: Session, rows: List[dict]) -> int:
+    """Insert rows, skipping any that hit a unique constraint; returns rows inserted."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        # No ON CONFLICT; rely on the lookup having removed existing users
+        return db.execute(insert(User).values(rows)).rowcount
+    statement = dialect_insert(User).values(rows).on_conflict_do_nothing()
+    return db.execute(statement).rowcount
+
+
+def provision_users(db: Session, rows: List[dict], workers: Optional[int] = None,
+                    batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> ProvisionReport:
+    """Create accounts for `rows`, skipping invalid, repeated and existing users."""
+    report = ProvisionReport(read=len(rows))
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    users = clean_users(rows, report)
+    taken_usernames, taken_emails = existing_accounts(db, users)
+    new_users = [
+        u for u in users
+        if u["username"] not in taken_usernames and u["email"] not in taken_emails
+    ]
+    report.already_exist = len(users) - len(new_users)
+    report.timings["dedupe"] = time.perf_counter() - started
+    if dry_run or not new_users:
+        return report
+
+    started = time.perf_counter()
+    hashes = hash_passwords([u["password"] for u in new_users], workers)
+    report.timings["hash"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    records = [
+        {
+            "username": u["username"],
+            "email": u["email"],
+            "hashed_password": hashed,
+            "full_name": u["full_name"],
+            "is_active": True,
+            "created_at": now,
+        }
+        for u, hashed in zip(new_users, hashes)
+    ]
+    try:
+        for start in range(0, len(records), batch_size):
+            report.inserted += _insert_ignoring_conflicts(db, records[start:start + batch_size])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    report.conflicts = len(records) - report.inserted
+    report.timings["insert"] = time.perf_counter() - started
+    return report
+
+
+def print_report(report: ProvisionReport, dry_run: bool):
+    for problem in report.invalid:
+        print(f"⚠️ Skipped {problem}")
+    print(f"\nRead {report.read} rows")
+    print(f"  invalid:            {len(report.invalid)}")
+    print(f"  repeated in file:   {report.duplicates_in_file}")
+    print(f"  already existing:   {report.already_exist}")
+    if dry_run:
+        print("  (dry run: nothing hashed or inserted)")
+    else:
+        print(f"  created:            {report.inserted}")
+        print(f"  lost to conflicts:  {report.conflicts}")
+
+    total = sum(report.timings.values())
+    for phase, seconds in report.timings.items():
+        print(f"  {phase:<8} {seconds:8.2f}s")
+    hashed = report.inserted + report.conflicts
+    if report.timings.get("hash"):
+        print(f"  hashing: {hashed / report.timings['hash']:,.1f} passwords/s")
+    if total and report.inserted:
+        print(f"✅ {report.inserted / total:,.1f} users/s overall ({total:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create users in bulk from a CSV or JSON file.")
+    parser.add_argument("path", help="CSV (with header) or JSON file of users")
+    parser.add_argument("--format", choices=("csv", "json"), help="Default: from the file extension")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for password hashing (default: CPU cores)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per INSERT")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and dedupe only")
+    args = parser.parse_args()
+
+    from backend.database import SessionLocal
+
+    rows = read_users(args.path, args.format)
+    db = SessionLocal()
+    try:
+        report = provision_users(db, rows, args.workers, args.batch_size, args.dry_run)
+    finally:
+        db.close()
+    print_report(report, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
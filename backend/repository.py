@@ -0,0 +1,257 @@
+"""
+Data Access
+-----------
+The queries the API routes run, in one place. Routes call these functions
+instead of building queries inline; they own the transaction (nothing here
+commits).
+
+Statements are built once, at import, with named bind parameters, so a
+call only binds values: SQLAlchemy's compiled cache is hit without
+rebuilding the statement or recomputing its cache key. Reads return plain
+rows (Rows or dicts) and run on the session's connection, skipping ORM
+hydration and the ORM execute path; writes go through the session so its
+events still see them (backend/database.py uses them to pin a user's reads
+to the primary after a write).
+
+Inserts use RETURNING (PostgreSQL, SQLite 3.35+) instead of a refresh
+SELECT.
+
+`python benchmarks/repository.py` measures the per-call overhead.
+"""
+
+from datetime import datetime
+from typing import List, Optional, Type, Union
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from backend.models import User, Conversation, ChatMessage, MessageRender, UsageDaily, UsageHourly
+
+# Bulk UPDATE/DELETE: nothing is loaded in the session to keep in sync
+_BULK = {"synchronize_session": False}
+
+# Message fields served to clients and kept in the history cache
+MESSAGE_COLUMNS = (
+    ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp,
+    ChatMessage.finish_reason, ChatMessage.prompt_tokens, ChatMessage.completion_tokens,
+)
+
+
+def _read(db: Session, statement, params: dict):
+    return db.connection().execute(statement, params)
+
+
+# Users
+
+_user_by_login = (
+    select(User.id, User.username, User.hashed_password)
+    .where((User.username == bindparam("login")) | (User.email == bindparam("login")))
+    .limit(1)
+)
+_user_by_username = select(User.id, User.username).where(User.username == bindparam("username"))
+_user_by_email = select(User.id, User.username).where(User.email == bindparam("email"))
+_user_profile = select(User.id, User.username, User.email, User.full_name).where(User.id == bindparam("user_id"))
+_insert_user = insert(User).returning(User.id, User.username, User.email, User.full_name)
+
+
+def get_user_by_login(db: Session, login: str) -> Optional[Row]:
+    """(id, username, hashed_password) of the user with this username or email."""
+    return _read(db, _user_by_login, {"login": login}).first()
+
+
+def get_user_by_username(db: Session, username: str) -> Optional[Row]:
+    """(id, username) of the user, or None."""
+    return _read(db, _user_by_username, {"username": username}).first()
+
+
+def get_user_by_email(db: Session, email: str) -> Optional[Row]:
+    """(id, username) of the user, or None."""
+    return _read(db, _user_by_email, {"email": email}).first()
+
+
+def get_user_profile(db: Session, user_id: int) -> Optional[dict]:
+    row = _read(db, _user_profile, {"user_id": user_id}).first()
+    return row._asdict() if row else None
+
+
+def create_user(db: Session, email: str, username: str, hashed_password: str,
+                full_name: Optional[str] = None) -> Row:
+    """Insert an active user; returns (id, username, email, full_name)."""
+    return db.execute(_insert_user, {
+        "email": email, "username": username, "hashed_password": hashed_password,
+        "full_name": full_name, "is_active": True, "created_at": datetime.utcnow(),
+    }).one()
+
+
+# Conversations
+
+_conversation_list = (
+    select(
+        Conversation.id, Conversation.title, Conversation.created_at, Conversation.updated_at,
+        func.count(ChatMessage.id).label("message_count")
+    )
+    .outerjoin(ChatMessage, ChatMessage.conversation_id == Conversation.id)
+    .where(Conversation.user_id == bindparam("user_id"))
+    .group_by(Conversation.id)
+    .order_by(Conversation.updated_at.desc())
+)
+_owned_conversation = select(Conversation.id).where(
+    Conversation.id == bindparam("conversation_id"), Conversation.user_id == bindparam("user_id")
+)
+_conversation_ids = select(Conversation.id).where(Conversation.user_id == bindparam("user_id"))
+_insert_conversation = insert(Conversation).returning(
+    Conversation.id, Conversation.title, Conversation.created_at, Conversation.updated_at
+)
+_touch_conversation = (
+    update(Conversation)
+    .where(Conversation.id == bindparam("conversation_id"))
+    .values(updated_at=bindparam("now"))
+)
+# UPDATE bind parameters can't share a column's name, hence "owner_id"
+_touch_owned_conversation = _touch_conversation.where(Conversation.user_id == bindparam("owner_id"))
+_rename_conversation = (
+    update(Conversation)
+    .where(Conversation.id == bindparam("conversation_id"))
+    .values(title=bindparam("new_title"))
+)
+_rename_owned_conversation = _rename_conversation.where(Conversation.user_id == bindparam("owner_id"))
+# SQLite doesn't enforce the ON DELETE CASCADE, and message ids can be reused
+_delete_conversation_renders = delete(MessageRender).where(MessageRender.message_id.in_(
+    select(ChatMessage.id).where(ChatMessage.conversation_id == bindparam("conversation_id"))
+))
+_delete_conversation_messages = delete(ChatMessage).where(ChatMessage.conversation_id == bindparam("conversation_id"))
+_delete_conversation = delete(Conversation).where(Conversation.id == bindparam("conversation_id"))
+
+
+def list_conversations(db: Session, user_id: int) -> List[dict]:
+    """The user's conversations with their message counts, most recently updated first."""
+    return [row._asdict() for row in _read(db, _conversation_list, {"user_id": user_id})]
+
+
+def owns_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
+    params = {"conversation_id": conversation_id, "user_id": user_id}
+    return _read(db, _owned_conversation, params).first() is not None
+
+
+def conversation_ids(db: Session, user_id: int) -> List[int]:
+    return list(_read(db, _conversation_ids, {"user_id": user_id}).scalars())
+
+
+def create_conversation(db: Session, user_id: int, title: str = "New Chat") -> dict:
+    """Insert a conversation; returns it as served by the API (with message_count 0)."""
+    now = datetime.utcnow()
+    row = db.execute(_insert_conversation, {
+        "user_id": user_id, "title": title, "created_at": now, "updated_at": now,
+    }).one()
+    return {**row._asdict(), "message_count": 0}
+
+
+def touch_conversation(db: Session, conversation_id: int, user_id: Optional[int] = None) -> bool:
+    """Bump updated_at; False when the conversation doesn't exist (or isn't the user's)."""
+    params = {"conversation_id": conversation_id, "now": datetime.utcnow()}
+    statement = _touch_conversation
+    if user_id is not None:
+        statement, params["owner_id"] = _touch_owned_conversation, user_id
+    return db.execute(statement, params, execution_options=_BULK).rowcount > 0
+
+
+def rename_conversation(db: Session, conversation_id: int, title: str, user_id: Optional[int] = None) -> bool:
+    """Set the title; False when the conversation doesn't exist (or isn't the user's)."""
+    params = {"conversation_id": conversation_id, "new_title": title}
+    statement = _rename_conversation
+    if user_id is not None:
+        statement, params["owner_id"] = _rename_owned_conversation, user_id
+    return db.execute(statement, params, execution_options=_BULK).rowcount > 0
+
+
+def delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
+    """Delete an owned conversation and its messages; False if the user has no such conversation."""
+    if not owns_conversation(db, conversation_id, user_id):
+        return False
+    # Messages in bulk, rather than loading each one for the ORM cascade
+    params = {"conversation_id": conversation_id}
+    db.execute(_delete_conversation_renders, params, execution_options=_BULK)
+    db.execute(_delete_conversation_messages, params, execution_options=_BULK)
+    db.execute(_delete_conversation, params, execution_options=_BULK)
+    return True
+
+
+# Messages
+
+_insert_message = insert(ChatMessage).returning(ChatMessage.id)
+_message_count = select(func.count(ChatMessage.id)).where(ChatMessage.conversation_id == bindparam("conversation_id"))
+_recent_messages = (
+    select(*MESSAGE_COLUMNS)
+    .where(ChatMessage.conversation_id == bindparam("conversation_id"))
+    .order_by(ChatMessage.timestamp.desc())
+    .limit(bindparam("limit"))
+)
+_conversation_messages = (
+    select(*MESSAGE_COLUMNS)
+    .where(ChatMessage.conversation_id == bindparam("conversation_id"))
+    .order_by(ChatMessage.timestamp)
+)
+_conversation_turns = (
+    select(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+    .where(ChatMessage.conversation_id == bindparam("conversation_id"))
+    .order_by(ChatMessage.timestamp)
+)
+
+
+def add_message(db: Session, conversation_id: int, role: str, content: str,
+                finish_reason: Optional[str] = None, prompt_tokens: Optional[int] = None,
+                completion_tokens: Optional[int] = None) -> dict:
+    """Insert a message; returns it with the MESSAGE_COLUMNS fields."""
+    message = {
+        "role": role,
+        "content": content,
+        "timestamp": datetime.utcnow(),
+        "finish_reason": finish_reason,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+    }
+    message_id = db.execute(_insert_message, {"conversation_id": conversation_id, **message}).scalar_one()
+    return {"id": message_id, **message}
+
+
+def count_messages(db: Session, conversation_id: int) -> int:
+    return _read(db, _message_count, {"conversation_id": conversation_id}).scalar_one()
+
+
+def recent_messages(db: Session, conversation_id: int, limit: int) -> List[dict]:
+    """The newest `limit` messages, oldest first."""
+    rows = _read(db, _recent_messages, {"conversation_id": conversation_id, "limit": limit}).all()
+    return [row._asdict() for row in reversed(rows)]
+
+
+def conversation_messages(db: Session, conversation_id: int) -> List[dict]:
+    """Every message of the conversation, oldest first."""
+    return [row._asdict() for row in _read(db, _conversation_messages, {"conversation_id": conversation_id})]
+
+
+def conversation_turns(db: Session, conversation_id: int) -> List[dict]:
+    """(id, role, content) of every message, oldest first: the shape the context cache stores."""
+    return [row._asdict() for row in _read(db, _conversation_turns, {"conversation_id": conversation_id})]
+
+
+# Usage
+
+def usage_report(db: Session, table: Union[Type[UsageHourly], Type[UsageDaily]], since: datetime,
+                 until: Optional[datetime] = None, user_id: Optional[int] = None,
+                 limit: int = 1000) -> List[dict]:
+    """Rollup rows from `since` (to `until`, exclusive), newest first, as served by /admin/usage."""
+    # Admin-only and filter-dependent: built per call
+    statement = (
+        select(table.user_id, User.username, table.bucket_start, table.prompt_tokens,
+               table.completion_tokens, table.message_count)
+        .join(User, User.id == table.user_id)
+        .where(table.bucket_start >= since)
+    )
+    if until is not None:
+        statement = statement.where(table.bucket_start < until)
+    if user_id is not None:
+        statement = statement.where(table.user_id == user_id)
+    rows = _read(db, statement.order_by(table.bucket_start.desc(), table.user_id).limit(limit), {})
+    return [
+        {**row._asdict(), "total_tokens": row.prompt_tokens + row.completion_tokens}
+        for row in rows
+    ]
@@ -0,0 +1,50 @@
+"""
+Request Body Limits
+-------------------
+Caps the body size of selected routes before the handler (or FastAPI's
+form parsing) reads it: a declared Content-Length over the limit is
+refused straight away, and a chunked body is cut off with 413 once it
+passes the limit.
+"""
+
+from typing import Dict
+from fastapi import HTTPException, status
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def _too_large(limit: int) -> str:
+    return f"Request body is larger than {limit} bytes"
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        # Path -> maximum body size in bytes; 0 disables a limit
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = self.limits.get(scope["path"], 0) if scope["type"] == "http" else 0
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        declared = Headers(scope=scope).get("content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            response = JSONResponse({"detail": _too_large(limit)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, receive_limited, send)
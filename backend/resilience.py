@@ -0,0 +1,240 @@
+"""
+LLM Error Handling
+------------------
+Classified LLM errors, retries with decorrelated jitter and a circuit
+breaker that fails fast while Gemini is having a bad time.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+from backend.config import load_env
+
+load_env()
+
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_CAP_SECONDS = float(os.getenv("LLM_RETRY_CAP_SECONDS", "8"))
+
+# The breaker opens when, over the window, at least MIN_CALLS calls were
+# made and the share of upstream failures reached the threshold
+BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+
+class LLMError(Exception):
+    """An LLM call failed. `kind` says why; `retryable` whether trying again may help."""
+    kind = "unknown"
+    retryable = False
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMError):
+    kind = "rate_limit"
+    retryable = True
+
+
+class LLMTimeoutError(LLMError):
+    kind = "timeout"
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    kind = "server"
+    retryable = True
+
+
+class LLMInvalidRequestError(LLMError):
+    kind = "invalid"
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling Gemini while the breaker is open."""
+    kind = "circuit_open"
+
+
+# google.api_core exception class names, by the error class they map to
+_ERRORS_BY_NAME = {
+    "ResourceExhausted": LLMRateLimitError,
+    "TooManyRequests": LLMRateLimitError,
+    "DeadlineExceeded": LLMTimeoutError,
+    "TimeoutError": LLMTimeoutError,
+    "ReadTimeout": LLMTimeoutError,
+    "ConnectTimeout": LLMTimeoutError,
+    "ServiceUnavailable": LLMServerError,
+    "InternalServerError": LLMServerError,
+    "BadGateway": LLMServerError,
+    "GatewayTimeout": LLMTimeoutError,
+    "ConnectError": LLMServerError,
+    "InvalidArgument": LLMInvalidRequestError,
+    "BadRequest": LLMInvalidRequestError,
+    "FailedPrecondition": LLMInvalidRequestError,
+    "PermissionDenied": LLMInvalidRequestError,
+    "Unauthenticated": LLMInvalidRequestError,
+    "NotFound": LLMInvalidRequestError,
+}
+
+_ERRORS_BY_STATUS = {
+    429: LLMRateLimitError,
+    408: LLMTimeoutError,
+    504: LLMTimeoutError,
+    500: LLMServerError,
+    502: LLMServerError,
+    503: LLMServerError,
+    400: LLMInvalidRequestError,
+    401: LLMInvalidRequestError,
+    403: LLMInvalidRequestError,
+    404: LLMInvalidRequestError,
+}
+
+
+def classify_error(exc: BaseException) -> LLMError:
+    """Map an exception from the Gemini/LangChain stack onto an LLMError."""
+    if isinstance(exc, LLMError):
+        return exc
+    message = f"Error getting LLM response: {exc}"
+    for cls in type(exc).__mro__:
+        if cls.__name__ in _ERRORS_BY_NAME:
+            return _ERRORS_BY_NAME[cls.__name__](message)
+    status_code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(status_code, int) and status_code in _ERRORS_BY_STATUS:
+        return _ERRORS_BY_STATUS[status_code](message)
+    # LangChain sometimes re-raises with only the upstream text left
+    text = str(exc)
+    if "429" in text or "Resource has been exhausted" in text or "quota" in text.lower():
+        return LLMRateLimitError(message)
+    if "503" in text or "500" in text or "overloaded" in text.lower():
+        return LLMServerError(message)
+    if "Deadline" in text or "timed out" in text:
+        return LLMTimeoutError(message)
+    return LLMError(message)
+
+
+class RetryPolicy:
+    """Bounded retries with "decorrelated jitter" backoff.
+
+    Each delay is drawn from [base, 3 * previous delay] and capped, which
+    spreads retries from many clients instead of synchronizing them.
+    """
+
+    def __init__(self, attempts: int = LLM_RETRY_ATTEMPTS, base: float = LLM_RETRY_BASE_SECONDS,
+                 cap: float = LLM_RETRY_CAP_SECONDS):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+    def next_delay(self, previous: Optional[float]) -> float:
+        upper = max(self.base, (previous or self.base) * 3)
+        return min(self.cap, random.uniform(self.base, upper))
+
+
+class CircuitBreaker:
+    """Closed -> open (fail fast) -> half-open (one probe) -> closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_seconds: float = BREAKER_WINDOW_SECONDS, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._calls: Deque[Tuple[float, bool]] = deque()  # (time, failed)
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe through (0 when closed)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self):
+        """Raise CircuitOpenError instead of calling upstream while open."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    raise CircuitOpenError("LLM temporarily unavailable", retry_after=self.retry_after())
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError("LLM temporarily unavailable", retry_after=1.0)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._calls.clear()
+            self._calls.append((now, False))
+            self._trim(now)
+
+    def record_failure(self, error: LLMError):
+        """Count upstream failures towards opening the breaker."""
+        if not error.retryable:
+            # Invalid requests got an answer from Gemini, so it is healthy
+            if isinstance(error, LLMInvalidRequestError):
+                self.record_success()
+            else:
+                self.release_probe()
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._calls.append((now, True))
+            self._trim(now)
+            failures = sum(1 for _, failed in self._calls if failed)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate:
+                self._open(now)
+
+    def release_probe(self):
+        """A half-open probe ended without a verdict (e.g. it was cancelled)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            calls = len(self._calls)
+            failures = sum(1 for _, failed in self._calls if failed)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "error_rate": round(failures / calls, 3) if calls else 0.0,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+async def sleep_within(delay: float, deadline: float) -> bool:
+    """Sleep `delay` seconds unless that would pass `deadline` (loop time)."""
+    loop = asyncio.get_running_loop()
+    if loop.time() + delay >= deadline:
+        return False
+    await asyncio.sleep(delay)
+    return True
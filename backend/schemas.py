@@ -4,7 +4,7 @@ Pydantic Schemas
 Request/Response models for API validation.
 """
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 from typing import List, Optional
 
@@ -65,6 +65,8 @@ class ConversationResponse(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[int] = None
+    # Deadline for the LLM reply; capped by LLM_MAX_TIMEOUT_SECONDS
+    timeout_seconds: Optional[float] = Field(None, gt=0)
 
 
 class ChatMessageResponse(BaseModel):
@@ -72,6 +74,12 @@ class ChatMessageResponse(BaseModel):
     role: str
     content: str
     timestamp: datetime
+    finish_reason: Optional[str] = None
+    # Sanitized HTML of assistant messages, when server-side rendering is on
+    html: Optional[str] = None
+    # Assistant messages: tokens used by the LLM call
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -81,3 +89,20 @@ class ChatResponse(BaseModel):
     conversation_id: int
     user_message: ChatMessageResponse
     assistant_message: ChatMessageResponse
+
+
+# Export/Import Schemas
+class ImportResponse(BaseModel):
+    conversations: int
+    messages: int
+
+
+# Usage Schemas
+class UsageRollupResponse(BaseModel):
+    user_id: int
+    username: str
+    bucket_start: datetime
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    message_count: int
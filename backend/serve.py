@@ -0,0 +1,62 @@
+"""
+Production Launcher
+-------------------
+Runs `backend.main:app` across several uvicorn worker processes.
+
+    python -m backend.serve                  # one worker per CPU core
+    WEB_CONCURRENCY=4 python -m backend.serve
+
+Equivalent gunicorn command (gunicorn supervises, uvicorn serves):
+    gunicorn backend.main:app -k uvicorn_worker.UvicornWorker \\
+        -w "$WEB_CONCURRENCY" -b 0.0.0.0:8000
+
+Workers do not share memory. Point SHARED_STATE_URL at Redis so caches and
+limits stay consistent across workers and nodes. Metrics are merged through
+prometheus_client's files in PROMETHEUS_MULTIPROC_DIR (a temporary directory
+unless set; gunicorn deployments must set it and empty it before starting).
+"""
+
+import argparse
+import os
+import tempfile
+from backend.config import load_env
+
+load_env()
+
+APP = "backend.main:app"
+
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY if set, otherwise one worker per CPU core."""
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    return os.cpu_count() or 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the chatbot API with multiple workers.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    args = parser.parse_args()
+
+    from backend.shared_state import SHARED_STATE_URL
+    if args.workers > 1 and SHARED_STATE_URL.startswith("memory://"):
+        print("⚠️ SHARED_STATE_URL is memory://; each worker keeps its own caches and limits")
+
+    if args.workers > 1:
+        from backend.metrics import reset_metrics_dir
+        # Inherited by the workers, whose /metrics merges every worker's values
+        metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="chatbot-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+        reset_metrics_dir(metrics_dir)
+
+    import uvicorn
+    print(f"🚀 Starting {APP} with {args.workers} worker(s) on {args.host}:{args.port}")
+    # Workers need an import string, not the app object, so each process imports it
+    uvicorn.run(APP, host=args.host, port=args.port, workers=args.workers, proxy_headers=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Shared State Backends
+---------------------
+Key/value state (caches, counters, rate limits) that must stay consistent
+across worker processes and nodes.
+
+SHARED_STATE_URL selects the backend:
+    memory://              per-process dict (default; single worker only)
+    redis://host:6379/0    Redis 7+ or a compatible server (e.g. Valkey)
+    fakeredis://           in-process fake of the Redis client, for offline runs
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from backend.config import load_env
+
+load_env()
+
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "memory://")
+
+
+class SharedState:
+    """Interface for the shared key/value store. Values are strings."""
+
+    #: False when every process has its own copy (only safe with one worker)
+    is_shared = True
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """Store `value`; with `ttl` (seconds) the key expires on its own."""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add `amount` and return the new value.
+
+        `ttl` is applied only if the key has no expiry yet (in practice,
+        when it is created), giving fixed-window counters.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryState(SharedState):
+    """Dict-backed state local to one process."""
+
+    is_shared = False
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            current = self._live(key)
+            if current is None:
+                expires_at = None
+                value = amount
+            else:
+                expires_at = self._data[key][1]
+                value = int(current) + amount
+            if expires_at is None and ttl:
+                expires_at = time.monotonic() + ttl
+            self._data[key] = (str(value), expires_at)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisState(SharedState):
+    """State kept in Redis (or a Redis-compatible server such as Valkey)."""
+
+    def __init__(self, client):
+        # `client` follows the redis-py API with decode_responses=True
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.client.set(key, value, px=int(ttl * 1000))
+        else:
+            self.client.set(key, value)
+
+    def incr(self, key, amount=1, ttl=None):
+        if not ttl:
+            return self.client.incrby(key, amount)
+        # One MULTI/EXEC block: a client dying between the two commands
+        # can't leave a counter that never expires
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.incrby(key, amount)
+        pipeline.pexpire(key, int(ttl * 1000), nx=True)
+        value, _ = pipeline.execute()
+        return value
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class FakeRedis:
+    """Minimal in-process imitation of the redis-py client used by RedisState.
+
+    Exercises the Redis code path without a server.
+    """
+
+    def __init__(self):
+        self._state = InMemoryState()
+        # Held by every command, and across a pipeline's commands (MULTI/EXEC)
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            return self._state.get(key)
+
+    def set(self, key, value, px=None):
+        with self._lock:
+            self._state.set(key, str(value), ttl=px / 1000 if px else None)
+            return True
+
+    def incrby(self, key, amount):
+        with self._lock:
+            return self._state.incr(key, amount)
+
+    def pexpire(self, key, milliseconds, nx=False):
+        with self._lock, self._state._lock:
+            value = self._state._live(key)
+            if value is None or (nx and self._state._data[key][1] is not None):
+                return False
+            self._state._data[key] = (value, time.monotonic() + milliseconds / 1000)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._state.delete(key)
+            return 1
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    """Queues FakeRedis commands and runs them as one block, like MULTI/EXEC."""
+
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.client._lock:
+            results = [command(*args, **kwargs) for command, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+def create_shared_state(url: str = SHARED_STATE_URL) -> SharedState:
+    """Build the backend named by `url`."""
+    if url.startswith("memory://"):
+        return InMemoryState()
+    if url.startswith("fakeredis://"):
+        return RedisState(FakeRedis())
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return RedisState(redis.Redis.from_url(url, decode_responses=True))
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+_shared_state: Optional[SharedState] = None
+_init_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """Return the process-wide shared state backend, creating it on first call."""
+    global _shared_state
+    if _shared_state is None:
+        with _init_lock:
+            if _shared_state is None:
+                _shared_state = create_shared_state()
+    return _shared_state
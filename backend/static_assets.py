@@ -0,0 +1,87 @@
+"""
+Precompressed Static Assets
+---------------------------
+Serves the frontend shell from memory, compressed once at startup, with a
+strong ETag so repeat visits are answered with 304 Not Modified.
+"""
+
+import gzip
+import hashlib
+from typing import Dict, Optional
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip covers every browser
+    brotli = None
+
+# The HTML shell changes on deploy, so browsers revalidate it every time
+# (cheap with the ETag) instead of caching it blindly
+SHELL_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    encodings = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding.strip().lower()] = q
+    return encodings
+
+
+class PrecompressedAsset:
+    """A file held in memory as identity, gzip and (if available) brotli bodies."""
+
+    def __init__(self, path: str, media_type: str, cache_control: str = SHELL_CACHE_CONTROL):
+        with open(path, "rb") as f:
+            content = f.read()
+        self.media_type = media_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.bodies: Dict[Optional[str], bytes] = {
+            None: content,
+            "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(content, quality=11)
+        # Each body is a different representation, so each gets its own strong ETag
+        self.etags: Dict[Optional[str], str] = {
+            encoding: f'"{digest}-{encoding}"' if encoding else f'"{digest}"' for encoding in self.bodies
+        }
+
+    def choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        """Pick the smallest body the client accepts."""
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.bodies and accepted.get(coding, accepted.get("*", 0)) > 0:
+                return coding
+        return None
+
+    def response(self, request: Request) -> Response:
+        encoding = self.choose_encoding(request.headers.get("accept-encoding", ""))
+        etag = self.etags[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        # Matched against the variant being served: a cached gzip body is not
+        # current for a client that now gets brotli (weak comparison, RFC 9110)
+        if_none_match = request.headers.get("if-none-match", "")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in tags or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
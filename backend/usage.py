@@ -0,0 +1,286 @@
+"""
+Token Usage Accounting
+----------------------
+Every assistant message stores the prompt and completion tokens of the LLM
+call that produced it, and the same transaction appends them to
+`usage_ledger`, keyed by user: deleting a conversation removes its
+messages but not its usage. A background roller folds new ledger entries
+into `usage_hourly` and `usage_daily` (one row per user per UTC hour/day),
+so quota checks and the admin usage report read a handful of rollup rows
+instead of scanning the ledger.
+
+The roller remembers how far it got in `usage_rollup_state`. Every worker
+runs one; advancing the watermark is a compare-and-set in the same
+transaction as the increments, so concurrent rollers never count an entry
+twice.
+
+Daily quotas (USAGE_DAILY_TOKEN_QUOTA, 0 = unlimited) are checked before
+the LLM call against a shared-state counter per user and day. The counter
+is loaded from the daily rollup plus the entries not rolled up yet, grows
+with each call, and expires after USAGE_QUOTA_RECONCILE_SECONDS so it is
+reloaded (reconciled) from the database. With per-process state, usage in
+other workers shows up at the next reconcile.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+from backend.config import load_env
+from backend.database import SessionLocal
+from backend.metrics import registry
+from backend.models import UsageDaily, UsageHourly, UsageLedgerEntry, UsageRollupState
+from backend.shared_state import SharedState, get_shared_state
+
+load_env()
+
+USAGE_ROLLUP_SECONDS = float(os.getenv("USAGE_ROLLUP_SECONDS", "60"))
+# Ledger entries folded into the rollups per transaction
+USAGE_ROLLUP_BATCH_SIZE = int(os.getenv("USAGE_ROLLUP_BATCH_SIZE", "5000"))
+# Entries newer than this are left for the next pass: a transaction still
+# in flight may commit a lower id after a higher one has been rolled up
+USAGE_ROLLUP_SETTLE_SECONDS = 5
+USAGE_DAILY_TOKEN_QUOTA = int(os.getenv("USAGE_DAILY_TOKEN_QUOTA", "0"))
+USAGE_QUOTA_RECONCILE_SECONDS = float(os.getenv("USAGE_QUOTA_RECONCILE_SECONDS", "300"))
+
+rolled_messages = registry.counter(
+    "usage_rollup_messages_total",
+    "Assistant messages folded into the usage rollups",
+)
+quota_rejections = registry.counter(
+    "usage_quota_rejections_total",
+    "Chat turns refused because the user's daily token quota was used up",
+)
+
+
+def hour_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_to_rollup(db: Session, table, user_id: int, bucket: datetime, totals: list):
+    prompt_tokens, completion_tokens, messages = totals
+    updated = db.execute(
+        update(table)
+        .where(table.user_id == user_id, table.bucket_start == bucket)
+        .values(
+            prompt_tokens=table.prompt_tokens + prompt_tokens,
+            completion_tokens=table.completion_tokens + completion_tokens,
+            message_count=table.message_count + messages,
+        )
+    ).rowcount
+    if not updated:
+        db.execute(insert(table).values(
+            user_id=user_id, bucket_start=bucket, prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens, message_count=messages,
+        ))
+
+
+def record_usage(db: Session, user_id: int, prompt_tokens: int, completion_tokens: int,
+                 at: Optional[datetime] = None):
+    """Append an LLM call's tokens to the ledger (the caller commits, with the message)."""
+    db.execute(insert(UsageLedgerEntry).values(
+        user_id=user_id, timestamp=at or datetime.utcnow(),
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+    ))
+
+
+def roll_up(db: Session, batch_size: int = USAGE_ROLLUP_BATCH_SIZE,
+            now: Optional[datetime] = None) -> int:
+    """Fold the next batch of settled ledger entries into the rollups; returns entries counted."""
+    watermark = db.execute(select(UsageRollupState.last_ledger_id).where(UsageRollupState.id == 1)).scalar()
+    if watermark is None:
+        return 0
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=USAGE_ROLLUP_SETTLE_SECONDS)
+    rows = db.execute(
+        select(UsageLedgerEntry.id, UsageLedgerEntry.timestamp, UsageLedgerEntry.prompt_tokens,
+               UsageLedgerEntry.completion_tokens, UsageLedgerEntry.user_id)
+        .where(UsageLedgerEntry.id > watermark)
+        .order_by(UsageLedgerEntry.id)
+        .limit(batch_size)
+    ).all()
+
+    hourly: Dict[Tuple[int, datetime], list] = defaultdict(lambda: [0, 0, 0])
+    daily: Dict[Tuple[int, datetime], list] = defaultdict(lambda: [0, 0, 0])
+    last_id = watermark
+    for row in rows:
+        if row.timestamp > cutoff:
+            break
+        for totals in (hourly[row.user_id, hour_start(row.timestamp)], daily[row.user_id, day_start(row.timestamp)]):
+            totals[0] += row.prompt_tokens
+            totals[1] += row.completion_tokens
+            totals[2] += 1
+        last_id = row.id
+    if last_id == watermark:
+        db.rollback()
+        return 0
+
+    try:
+        # Claim the range first: a concurrent roller that got here earlier
+        # moved the watermark, and this pass is dropped
+        claimed = db.execute(
+            update(UsageRollupState)
+            .where(UsageRollupState.id == 1, UsageRollupState.last_ledger_id == watermark)
+            .values(last_ledger_id=last_id, updated_at=datetime.utcnow())
+        ).rowcount
+        if not claimed:
+            db.rollback()
+            return 0
+        for (user_id, bucket), totals in hourly.items():
+            _add_to_rollup(db, UsageHourly, user_id, bucket, totals)
+        for (user_id, bucket), totals in daily.items():
+            _add_to_rollup(db, UsageDaily, user_id, bucket, totals)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    counted = sum(totals[2] for totals in daily.values())
+    rolled_messages.inc(counted)
+    return counted
+
+
+def tokens_used_today(db: Session, user_id: int, now: Optional[datetime] = None) -> int:
+    """Tokens the user used since UTC midnight: the daily rollup plus what isn't rolled up yet.
+
+    One statement, so both parts come from the same snapshot even while
+    the roller commits.
+    """
+    today = day_start(now or datetime.utcnow())
+    watermark = select(UsageRollupState.last_ledger_id).where(UsageRollupState.id == 1).scalar_subquery()
+    rolled = (
+        select(UsageDaily.prompt_tokens + UsageDaily.completion_tokens)
+        .where(UsageDaily.user_id == user_id, UsageDaily.bucket_start == today)
+        .scalar_subquery()
+    )
+    pending = (
+        select(func.sum(UsageLedgerEntry.prompt_tokens + UsageLedgerEntry.completion_tokens))
+        .where(
+            UsageLedgerEntry.user_id == user_id,
+            UsageLedgerEntry.timestamp >= today,
+            UsageLedgerEntry.id > func.coalesce(watermark, 0),
+        )
+        .scalar_subquery()
+    )
+    return int(db.execute(select(func.coalesce(rolled, 0) + func.coalesce(pending, 0))).scalar() or 0)
+
+
+class QuotaExceededError(Exception):
+    """The user's daily token quota is used up."""
+
+    def __init__(self, used: int, limit: int, retry_after: float):
+        super().__init__(f"Daily token quota of {limit} used up ({used} tokens today)")
+        self.used = used
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class QuotaTracker:
+    """Per-user daily token counters in shared state, reconciled with the rollups."""
+
+    def __init__(self, daily_limit: int = USAGE_DAILY_TOKEN_QUOTA,
+                 reconcile_seconds: float = USAGE_QUOTA_RECONCILE_SECONDS,
+                 state: Optional[SharedState] = None):
+        self.daily_limit = daily_limit
+        self.reconcile_seconds = reconcile_seconds
+        self._state = state
+
+    @property
+    def enabled(self) -> bool:
+        return self.daily_limit > 0
+
+    @property
+    def state(self) -> SharedState:
+        if self._state is None:
+            self._state = get_shared_state()
+        return self._state
+
+    @staticmethod
+    def _key(user_id: int, now: datetime) -> str:
+        return f"usage:tokens:{now:%Y%m%d}:{user_id}"
+
+    def used(self, db: Session, user_id: int) -> int:
+        now = datetime.utcnow()
+        key = self._key(user_id, now)
+        value = self.state.get(key)
+        if value is not None:
+            return int(value)
+        used = tokens_used_today(db, user_id, now)
+        self.state.set(key, str(used), ttl=self.reconcile_seconds)
+        return used
+
+    def check(self, db: Session, user_id: int):
+        """Raise QuotaExceededError when the user has no tokens left today."""
+        if not self.enabled:
+            return
+        used = self.used(db, user_id)
+        if used >= self.daily_limit:
+            quota_rejections.inc()
+            now = datetime.utcnow()
+            reset_at = day_start(now) + timedelta(days=1)
+            raise QuotaExceededError(used, self.daily_limit, (reset_at - now).total_seconds())
+
+    def record(self, user_id: int, tokens: int):
+        """Count a finished call against today's quota."""
+        if not self.enabled or tokens <= 0:
+            return
+        key = self._key(user_id, datetime.utcnow())
+        # No counter yet: the next check loads it from the database, which
+        # already includes this call. The ttl covers a counter expiring in between.
+        if self.state.get(key) is not None:
+            self.state.incr(key, tokens, ttl=self.reconcile_seconds)
+
+
+class UsageRoller:
+    """Runs `roll_up` in a background thread until it catches up, every interval."""
+
+    def __init__(self, interval: float = USAGE_ROLLUP_SECONDS, batch_size: int = USAGE_ROLLUP_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_run: Optional[float] = None
+
+    def run_once(self) -> int:
+        counted = 0
+        db = SessionLocal()
+        try:
+            while not self._stop.is_set():
+                batch = roll_up(db, self.batch_size)
+                counted += batch
+                if batch < self.batch_size:
+                    break
+        finally:
+            db.close()
+        self.last_run = time.time()
+        return counted
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-rollup", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Usage rollup failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+
+quota_tracker = QuotaTracker()
+usage_roller = UsageRoller()
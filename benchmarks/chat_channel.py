@@ -0,0 +1,175 @@
+"""
+Chat Channel Benchmark: POST /chat vs /ws
+-----------------------------------------
+Runs the same chat turns from many concurrent clients (1,000 by default)
+once over POST /chat and once over one /ws connection per client, and
+reports throughput, turn latency and SQL statements per turn. The fake LLM
+answers, so the numbers are the app's own overhead.
+
+Both paths are driven in-process through the ASGI interface (httpx's
+ASGITransport for HTTP, a queue-based socket for /ws), so no ports or
+WebSocket client library are needed and network cost is left out.
+
+Usage (from the project root):
+    python benchmarks/chat_channel.py --clients 1000 --turns 3
+    BENCH_DATABASE_URL=postgresql://localhost/chatbot_bench python benchmarks/chat_channel.py
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from common import offline_env, seed
+
+
+class InProcessSocket:
+    """Minimal WebSocket client talking to an ASGI app directly."""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self.to_app: asyncio.Queue = asyncio.Queue()
+        self.from_app: asyncio.Queue = asyncio.Queue()
+        self.task = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self.task = asyncio.create_task(self.app(scope, self.to_app.get, self.from_app.put))
+        await self.to_app.put({"type": "websocket.connect"})
+        message = await self.from_app.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"Connection refused: {message}")
+
+    async def send(self, frame: dict):
+        await self.to_app.put({"type": "websocket.receive", "text": json.dumps(frame)})
+
+    async def receive(self) -> dict:
+        message = await self.from_app.get()
+        if message["type"] == "websocket.close":
+            raise RuntimeError(f"Closed by server: {message.get('code')}")
+        return json.loads(message["text"])
+
+    async def close(self):
+        await self.to_app.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+
+async def http_client(app, token: str, conversation_id: int, turns: int, latencies: list, errors: list):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for turn in range(turns):
+            start = time.perf_counter()
+            response = await client.post("/chat", headers=headers, json={
+                "message": f"HTTP turn {turn}", "conversation_id": conversation_id,
+            })
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status_code)
+
+
+async def ws_client(app, token: str, conversation_id: int, turns: int, latencies: list, errors: list):
+    socket = InProcessSocket(app, "/ws")
+    await socket.connect()
+    await socket.send({"type": "auth", "token": token})
+    if (await socket.receive())["type"] != "ready":
+        errors.append("auth")
+        await socket.close()
+        return
+    for turn in range(turns):
+        start = time.perf_counter()
+        await socket.send({"type": "chat", "id": turn, "message": f"WS turn {turn}",
+                           "conversation_id": conversation_id})
+        while True:
+            frame = await socket.receive()
+            if frame["type"] == "chunk":
+                await socket.send({"type": "ack", "id": frame["id"], "chunks": 1})
+            elif frame["type"] == "done":
+                latencies.append(time.perf_counter() - start)
+                break
+            elif frame["type"] == "error":
+                errors.append(frame["status"])
+                break
+    await socket.close()
+
+
+async def run_mode(client, app, clients, turns: int) -> dict:
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(app, token, conversation_id, turns, latencies, errors)
+        for token, conversation_id in clients
+    ))
+    return {"seconds": time.perf_counter() - start, "latencies": latencies, "errors": errors}
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Scratch database (default: temporary SQLite file)")
+    parser.add_argument("--clients", type=int, default=1000, help="Concurrent clients")
+    parser.add_argument("--users", type=int, default=100, help="Users the clients are spread over")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per client")
+    args = parser.parse_args()
+
+    offline_env(args.database_url)
+    user_ids = seed(users=args.users, conversations_per_user=args.clients // args.users + 1,
+                    messages_per_conversation=4)
+
+    from sqlalchemy import event, select
+    from backend.auth import create_user_token
+    from backend.database import SessionLocal, engine
+    from backend.main import app
+    from backend.models import Conversation, User
+
+    # Tokens are minted directly: logging 1,000 clients in would mostly time bcrypt
+    db = SessionLocal()
+    try:
+        conversations = {
+            user_id: list(db.scalars(select(Conversation.id).where(Conversation.user_id == user_id)))
+            for user_id in user_ids
+        }
+        tokens = {user_id: create_user_token(db, db.get(User, user_id)) for user_id in user_ids}
+    finally:
+        db.close()
+    # Each client has its own conversation, so turns don't contend on one row
+    clients = [
+        (tokens[user_ids[i % len(user_ids)]], conversations[user_ids[i % len(user_ids)]][i // len(user_ids)])
+        for i in range(args.clients)
+    ]
+
+    statements = {"count": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements["count"] += 1
+
+    print(f"{args.clients} clients x {args.turns} turns over {args.users} users\n")
+    print(f"{'path':<11} {'seconds':>8} {'turns/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'SQL/turn':>9} {'errors':>7}")
+    for label, client in (("POST /chat", http_client), ("/ws", ws_client)):
+        statements["count"] = 0
+        result = asyncio.run(run_mode(client, app, clients, args.turns))
+        done = len(result["latencies"])
+        print(
+            f"{label:<11} {result['seconds']:>8.2f} {done / result['seconds']:>9.1f} "
+            f"{percentile(result['latencies'], 0.5) * 1000:>8.1f} {percentile(result['latencies'], 0.99) * 1000:>8.1f} "
+            f"{statements['count'] / max(done, 1):>9.1f} {len(result['errors']):>7}"
+        )
+        if result["errors"]:
+            print(f"   errors: {sorted(set(map(str, result['errors'])))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark Helpers
+-----------------
+Shared setup for the scripts in this directory: an offline environment
+(fake LLM, throwaway SQLite database) and a seeded dataset.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+
+
+def offline_env(database_url: str = None) -> str:
+    """Point the app at a fake LLM and a scratch database.
+
+    Must run before anything from `backend` is imported. Returns the
+    database URL in use.
+    """
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="chatbot-bench-"), "bench.db")
+        database_url = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{path}")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    return database_url
+
+
+def seed(users: int = 1, conversations_per_user: int = 5, messages_per_conversation: int = 40,
+         content: str = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4):
+    """Create users `bench0..N` (password 'bench') with conversations and messages.
+
+    Returns the list of created user ids.
+    """
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from backend.auth import get_password_hash
+    from backend.database import SessionLocal, init_db
+    from backend.models import User, Conversation, ChatMessage
+
+    init_db()
+    db = SessionLocal()
+    try:
+        password_hash = get_password_hash("bench")
+        user_ids = []
+        start = datetime.utcnow() - timedelta(days=30)
+        for u in range(users):
+            user = User(username=f"bench{u}", email=f"bench{u}@example.com",
+                        hashed_password=password_hash, full_name=f"Bench User {u}")
+            db.add(user)
+            db.flush()
+            user_ids.append(user.id)
+            for c in range(conversations_per_user):
+                conversation = Conversation(user_id=user.id, title=f"Conversation {c}",
+                                            created_at=start, updated_at=start + timedelta(minutes=c))
+                db.add(conversation)
+                db.flush()
+                rows = [
+                    {
+                        "conversation_id": conversation.id,
+                        "role": "user" if m % 2 == 0 else "assistant",
+                        "content": content,
+                        "timestamp": start + timedelta(seconds=m),
+                    }
+                    for m in range(messages_per_conversation)
+                ]
+                if rows:
+                    db.execute(insert(ChatMessage), rows)
+        db.commit()
+        return user_ids
+    finally:
+        db.close()
+
+
+def login(client, username: str = "bench0", password: str = "bench") -> dict:
+    """Log in through the API and return Authorization headers."""
+    response = client.post("/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
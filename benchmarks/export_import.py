@@ -0,0 +1,95 @@
+"""
+History Export/Import Benchmark
+-------------------------------
+Seeds one user with a large history (1M messages by default), then times
+the NDJSON and zip exports and a bulk import of the NDJSON file, with the
+process's peak RSS after each step. A flat peak across the exports shows
+they stream rather than buffer.
+
+The export and import functions are called directly: the test client
+buffers whole request and response bodies, which would hide the server's
+own memory use.
+
+Usage (from the project root):
+    python benchmarks/export_import.py --conversations 1000 --messages 1000
+    BENCH_DATABASE_URL=postgresql://localhost/chatbot_bench python benchmarks/export_import.py
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from common import offline_env, seed
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def write_export(chunks, path: str) -> int:
+    size = 0
+    with open(path, "wb") as out:
+        for chunk in chunks:
+            out.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def report(label: str, seconds: float, rows: int, size: int = None):
+    size_text = f"{size / 1024 / 1024:>9.1f}" if size is not None else f"{'-':>9}"
+    print(f"{label:<14} {seconds:>8.2f} {rows / seconds:>12,.0f} {size_text} {peak_rss_mb():>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Scratch database (default: temporary SQLite file)")
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=1000, help="Messages per conversation")
+    args = parser.parse_args()
+
+    offline_env(args.database_url)
+    total = args.conversations * args.messages
+    print(f"Seeding {args.conversations} conversations x {args.messages} messages ...")
+    start = time.perf_counter()
+    user_id = seed(users=1, conversations_per_user=args.conversations, messages_per_conversation=args.messages)[0]
+    print(f"Seeded {total:,} messages in {time.perf_counter() - start:.1f}s\n")
+
+    from backend.database import SessionLocal
+    from backend.history_io import export_ndjson, export_zip, import_history
+
+    workdir = tempfile.mkdtemp(prefix="chatbot-export-")
+    ndjson_path = os.path.join(workdir, "export.ndjson")
+    zip_path = os.path.join(workdir, "export.zip")
+
+    print(f"{'step':<14} {'seconds':>8} {'messages/s':>12} {'size MB':>9} {'peak RSS MB':>12}")
+    print(f"{'(baseline)':<14} {'-':>8} {'-':>12} {'-':>9} {peak_rss_mb():>12.1f}")
+
+    start = time.perf_counter()
+    size = write_export(export_ndjson(user_id, "bench0"), ndjson_path)
+    report("export ndjson", time.perf_counter() - start, total, size)
+
+    start = time.perf_counter()
+    size = write_export(export_zip(user_id, "bench0"), zip_path)
+    report("export zip", time.perf_counter() - start, total, size)
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        with open(ndjson_path, "rb") as upload:
+            counts = import_history(db, user_id, upload)
+        report("import ndjson", time.perf_counter() - start, counts["messages"])
+    finally:
+        db.close()
+
+    if counts["messages"] != total:
+        print(f"❌ Imported {counts['messages']:,} messages, expected {total:,}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Payload Size and Latency Benchmark
+----------------------------------
+Compares the frontend shell and a message-history payload with and without
+compression, and a conditional (ETag) reload of the shell.
+
+Usage (from the project root):
+    python benchmarks/payload.py --messages 200 --repeat 200
+"""
+
+import argparse
+import statistics
+import time
+
+from common import offline_env, seed, login
+
+
+def timed(client, path, headers, repeat):
+    """Return (response of the last call, median latency in ms)."""
+    latencies = []
+    response = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return response, statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="Messages in the benchmarked conversation")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    offline_env()
+    seed(users=1, conversations_per_user=1, messages_per_conversation=args.messages)
+
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    with TestClient(app) as client:
+        auth = login(client)
+        conversation_id = client.get("/conversations", headers=auth).json()[0]["id"]
+
+        cases = [
+            ("/", "shell, identity", {"Accept-Encoding": "identity"}),
+            ("/", "shell, gzip", {"Accept-Encoding": "gzip"}),
+            ("/", "shell, br", {"Accept-Encoding": "br, gzip"}),
+        ]
+        etag = client.get("/").headers["etag"]
+        cases.append(("/", "shell, If-None-Match", {"If-None-Match": etag}))
+        messages_path = f"/conversations/{conversation_id}/messages"
+        cases.append((messages_path, f"{args.messages} messages, identity", {**auth, "Accept-Encoding": "identity"}))
+        cases.append((messages_path, f"{args.messages} messages, compressed", {**auth, "Accept-Encoding": "br, gzip"}))
+
+        print(f"{'case':<34} {'status':>6} {'encoding':>9} {'bytes':>9} {'p50 ms':>8}")
+        for path, label, headers in cases:
+            response, p50 = timed(client, path, headers, args.repeat)
+            # httpx decodes bodies; Content-Length is the size on the wire
+            wire_bytes = int(response.headers.get("content-length", 0))
+            encoding = response.headers.get("content-encoding", "-")
+            print(f"{label:<34} {response.status_code:>6} {encoding:>9} {wire_bytes:>9} {p50:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
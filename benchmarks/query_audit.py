@@ -0,0 +1,161 @@
+"""
+Query Plan Audit
+----------------
+Seeds a scratch database, drives every API route in backend/main.py,
+captures the SQL each one issues and runs EXPLAIN on it. Exits non-zero
+when a query sequentially scans a table larger than the row threshold.
+
+Usage (from the project root):
+    python benchmarks/query_audit.py                          # scratch SQLite
+    python benchmarks/query_audit.py --database-url postgresql://localhost/chatbot_audit
+
+Never point --database-url at a database with real data: it is seeded.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import OrderedDict
+
+from common import offline_env, seed, login
+
+AUDITED_PREFIXES = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+def explain_scans(conn, dialect: str, statement: str, parameters):
+    """Return [(table, estimated_rows)] for sequential scans in the plan."""
+    if dialect == "postgresql":
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scans = []
+        stack = [plan[0]["Plan"]]
+        while stack:
+            node = stack.pop()
+            if node.get("Node Type") == "Seq Scan":
+                scans.append((node["Relation Name"], node.get("Plan Rows", 0)))
+            stack.extend(node.get("Plans", []))
+        return scans
+
+    # SQLite: "SCAN <table>" is a full scan unless it walks an index
+    # ("SCAN CONSTANT ROW" is a SELECT without FROM)
+    scans = []
+    for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters):
+        detail = row[-1]
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if match and "USING" not in detail and not detail.startswith("SCAN CONSTANT ROW"):
+            table = match.group(1)
+            rows = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+            scans.append((table, rows))
+    return scans
+
+
+def exercise_routes(client, captured):
+    """Call every route once; returns the set of route paths exercised."""
+    auth = login(client)
+    exercised = set()
+
+    def call(method, path, route=None, **kwargs):
+        captured["route"] = f"{method} {route or path}"
+        response = client.request(method, path, **kwargs)
+        exercised.add((method, route or path))
+        captured["route"] = None
+        if response.status_code >= 400:
+            print(f"⚠️ {method} {path} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+    call("GET", "/")
+    call("GET", "/health")
+    call("POST", "/login", data={"username": "bench0", "password": "bench"})
+    call("POST", "/signup", json={"email": "audit@example.com", "username": "audit", "password": "audit"})
+    call("GET", "/me", headers=auth)
+    conversations = call("GET", "/conversations", headers=auth).json()
+    call("GET", "/chats", headers=auth)
+    conversation_id = conversations[0]["id"]
+    created = call("POST", "/conversations", headers=auth, json={"title": "Audit"}).json()
+    call("GET", f"/conversations/{conversation_id}/messages",
+         "/conversations/{conversation_id}/messages", headers=auth)
+    call("PATCH", f"/conversations/{conversation_id}/title",
+         "/conversations/{conversation_id}/title", headers=auth, params={"title": "Renamed"})
+    call("POST", "/chat", headers=auth, json={"message": "Start a new conversation"})
+    call("POST", "/chat", headers=auth, json={"message": "Continue", "conversation_id": conversation_id})
+    exported = call("GET", "/export", headers=auth)
+    call("POST", "/import", headers=auth, files={"file": ("export.ndjson", exported.content)})
+    call("GET", "/admin/usage", headers=auth)
+    call("DELETE", f"/conversations/{conversation_id}",
+         "/conversations/{conversation_id}", headers=auth)
+    call("DELETE", f"/conversations/{created['id']}", "/conversations/{conversation_id}", headers=auth)
+    call("POST", "/logout-all", headers=auth)
+    return exercised
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Scratch database (default: temporary SQLite file)")
+    parser.add_argument("--rows-threshold", type=int, default=1000,
+                        help="Fail on sequential scans of tables estimated above this many rows")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=20, help="Conversations per user")
+    parser.add_argument("--messages", type=int, default=50, help="Messages per conversation")
+    args = parser.parse_args()
+
+    database_url = offline_env(args.database_url)
+    # Admin routes and the quota check run their queries too
+    os.environ.setdefault("ADMIN_USERNAMES", "bench0")
+    os.environ.setdefault("USAGE_DAILY_TOKEN_QUOTA", "1000000000")
+    seed(args.users, args.conversations, args.messages)
+
+    from fastapi.routing import APIRoute
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from backend.database import engine
+    from backend.main import app
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    # (route, statement) -> parameters of the first call
+    captured = {"route": None, "statements": OrderedDict()}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        route = captured["route"]
+        if route and not executemany and statement.lstrip().upper().startswith(AUDITED_PREFIXES):
+            captured["statements"].setdefault((route, statement), parameters)
+
+    with TestClient(app) as client:
+        exercised = exercise_routes(client, captured)
+    event.remove(engine, "before_cursor_execute", capture)
+
+    api_routes = {
+        (method, route.path)
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+    for method, path in sorted(api_routes - exercised):
+        print(f"⚠️ Route not exercised by the audit: {method} {path}")
+
+    print(f"Auditing {len(captured['statements'])} statements against {database_url}\n")
+    failures = 0
+    with engine.connect() as conn:
+        for (route, statement), parameters in captured["statements"].items():
+            scans = explain_scans(conn, engine.dialect.name, statement, parameters)
+            large = [(table, rows) for table, rows in scans if rows > args.rows_threshold]
+            status = "❌" if large else "✅"
+            summary = ", ".join(f"seq scan {table} (~{rows} rows)" for table, rows in scans) or "index only"
+            print(f"{status} {route:<45} {summary}")
+            if large:
+                failures += 1
+                print("   " + " ".join(statement.split())[:300])
+
+    if failures:
+        print(f"\n❌ {failures} statement(s) scan tables above {args.rows_threshold} rows")
+        sys.exit(1)
+    print("\n✅ No large sequential scans")
+
+
+if __name__ == "__main__":
+    main()
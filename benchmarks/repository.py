@@ -0,0 +1,104 @@
+"""
+Data Access Overhead Benchmark
+------------------------------
+Per-call cost of the hot queries, before (ORM queries built inline, as the
+routes used to) and after (backend/repository.py: select() statements
+built once at import with named bind parameters, returning plain rows).
+Both run against the same seeded SQLite file, so the difference is
+Python-side: statement construction, cache-key generation and ORM
+hydration.
+
+Usage (from the project root):
+    python benchmarks/repository.py --calls 5000 --history 50
+"""
+
+import argparse
+import time
+
+from common import offline_env, seed
+
+
+def per_call_us(func, calls: int, db) -> float:
+    func()  # warm the statement caches
+    db.expunge_all()
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+        # Each request starts with an empty identity map
+        db.expunge_all()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--conversations", type=int, default=20, help="Conversations of the benchmark user")
+    parser.add_argument("--history", type=int, default=50, help="Messages loaded by the history query")
+    args = parser.parse_args()
+
+    offline_env()
+    user_id = seed(users=1, conversations_per_user=args.conversations, messages_per_conversation=args.history)[0]
+
+    from sqlalchemy import func
+    from backend import repository
+    from backend.database import SessionLocal
+    from backend.models import User, Conversation, ChatMessage
+
+    db = SessionLocal()
+    conversation_id = repository.conversation_ids(db, user_id)[0]
+
+    def message_dicts(messages):
+        return [
+            {"id": m.id, "role": m.role, "content": m.content, "timestamp": m.timestamp,
+             "finish_reason": m.finish_reason, "prompt_tokens": m.prompt_tokens,
+             "completion_tokens": m.completion_tokens}
+            for m in messages
+        ]
+
+    cases = [
+        (
+            "user by username",
+            lambda: db.query(User).filter(User.username == "bench0").first(),
+            lambda: repository.get_user_by_username(db, "bench0"),
+        ),
+        (
+            "owned conversation",
+            lambda: db.query(Conversation).filter(
+                Conversation.id == conversation_id, Conversation.user_id == user_id
+            ).first(),
+            lambda: repository.owns_conversation(db, conversation_id, user_id),
+        ),
+        (
+            f"recent history ({args.history})",
+            lambda: message_dicts(reversed(
+                db.query(ChatMessage).filter(ChatMessage.conversation_id == conversation_id)
+                .order_by(ChatMessage.timestamp.desc()).limit(args.history).all()
+            )),
+            lambda: repository.recent_messages(db, conversation_id, args.history),
+        ),
+        (
+            f"conversation list ({args.conversations})",
+            lambda: [
+                {"id": c.id, "title": c.title, "created_at": c.created_at,
+                 "updated_at": c.updated_at, "message_count": count}
+                for c, count in db.query(Conversation, func.count(ChatMessage.id).label("message_count"))
+                .outerjoin(ChatMessage).filter(Conversation.user_id == user_id)
+                .group_by(Conversation.id).order_by(Conversation.updated_at.desc()).all()
+            ],
+            lambda: repository.list_conversations(db, user_id),
+        ),
+    ]
+
+    print(f"{args.calls} calls each, one session, SQLite\n")
+    print(f"{'query':<26} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    try:
+        for label, before, after in cases:
+            before_us = per_call_us(before, args.calls, db)
+            after_us = per_call_us(after, args.calls, db)
+            print(f"{label:<26} {before_us:>10.1f} {after_us:>10.1f} {before_us / after_us:>7.2f}x")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
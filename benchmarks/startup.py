@@ -0,0 +1,70 @@
+"""
+Startup Time Benchmark
+----------------------
+Measures how long `import backend.main` takes using `python -X importtime`
+and fails when it exceeds a budget, so cold-start regressions are visible.
+
+Usage (from the project root):
+    python benchmarks/startup.py --budget-ms 800
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1000"))
+
+
+def measure(module: str = "backend.main"):
+    """Import `module` in a fresh interpreter; return (total_us, {module: cumulative_us})."""
+    env = dict(os.environ)
+    # The app must import without credentials or a reachable LLM
+    env.setdefault("LLM_PROVIDER", "fake")
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=project_root, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"❌ import {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative.get(module, 0), cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="Report the fastest of N runs")
+    parser.add_argument("--top", type=int, default=10, help="Show the N heaviest top-level imports")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    total_us, cumulative = min(runs, key=lambda run: run[0])
+    total_ms = total_us / 1000
+
+    top_level = {name: us for name, us in cumulative.items() if "." not in name and name != args.module}
+    print(f"Heaviest top-level packages imported by {args.module}:")
+    for name, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    print(f"\nimport {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("❌ Over budget")
+        sys.exit(1)
+    print("✅ Within budget")
+
+
+if __name__ == "__main__":
+    main()
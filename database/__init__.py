@@ -1,5 +0,0 @@
-"""
-Database Package
-----------------
-Contains database connection and models for the chatbot application.
-"""
@@ -1,42 +0,0 @@
-"""
-Database Models
----------------
-SQLAlchemy models for users and chat messages.
-"""
-
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
-from datetime import datetime
-from database.db_connection import Base
-
-
-class User(Base):
-    """User model for Amzur employees."""
-    
-    __tablename__ = "users"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String(255), unique=True, index=True, nullable=False)
-    username = Column(String(100), unique=True, index=True, nullable=False)
-    hashed_password = Column(String(255), nullable=False)
-    full_name = Column(String(255))
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    # Relationship to chat messages
-    messages = relationship("ChatMessage", back_populates="user", cascade="all, delete-orphan")
-
-
-class ChatMessage(Base):
-    """Chat message model to store conversation history."""
-    
-    __tablename__ = "chat_messages"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    role = Column(String(20), nullable=False)  # 'user' or 'assistant'
-    content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    
-    # Relationship to user
-    user = relationship("User", back_populates="messages")
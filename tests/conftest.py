@@ -0,0 +1,85 @@
+"""
+Test Setup
+----------
+Runs the backend offline: fake LLM, per-process shared state and a scratch
+SQLite database. The environment is set here, before anything from
+`backend` is imported, because the modules read their settings on import.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+import pytest
+
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+scratch_dir = tempfile.mkdtemp(prefix="chatbot-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch_dir, 'primary.db')}"
+os.environ["REPLICA_DATABASE_URLS"] = ""
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["SHARED_STATE_URL"] = "memory://"
+os.environ["AUTO_CREATE_SCHEMA"] = "true"
+os.environ["USAGE_ROLLUP_SECONDS"] = "0"
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+class Clock:
+    """Stand-in for the `time` module of the code under test; only moves when told to."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manual clock installed in every module that expires things."""
+    from backend import context_cache, google_auth, resilience, shared_state
+
+    fake = Clock()
+    for module in (context_cache, google_auth, resilience, shared_state):
+        monkeypatch.setattr(module, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+def sign_up(client) -> dict:
+    """Create a fresh user through the API and return their Authorization header."""
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    client.post("/signup", json={
+        "email": f"{username}@example.com", "username": username, "password": "secret",
+    }).raise_for_status()
+    response = client.post("/login", data={"username": username, "password": "secret"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth_headers(client) -> dict:
+    return sign_up(client)
+
+
+@pytest.fixture
+def other_headers(client) -> dict:
+    """A second user, for ownership checks."""
+    return sign_up(client)
@@ -0,0 +1,150 @@
+"""JWT verification: signing key rotation, revocation and the decoded-token cache."""
+
+import uuid
+from datetime import timedelta
+import pytest
+from jose import jwt
+from sqlalchemy import insert
+from backend import auth
+from backend.auth import (
+    ALGORITHM, TokenCache, TokenClaims, TokenVersionTable, create_access_token, decode_token,
+    get_token_version, revoke_user_tokens,
+)
+from backend.database import SessionLocal, init_db
+from backend.models import User, UserTokenVersion
+
+
+@pytest.fixture
+def db():
+    init_db()
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def user_id(db) -> int:
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    user_id = db.execute(insert(User).values(
+        username=username, email=f"{username}@example.com", hashed_password="x",
+    ).returning(User.id)).scalar()
+    db.commit()
+    return user_id
+
+
+@pytest.fixture
+def rotated_keys(monkeypatch):
+    """Two configured keys, the newer one active, and no "default" key."""
+    monkeypatch.setattr(auth, "SIGNING_KEYS", {"2026-10": "new-secret", "2026-04": "old-secret"})
+    monkeypatch.setattr(auth, "ACTIVE_KID", "2026-10")
+
+
+def token_for(user_id: int, version: int = 0, **overrides) -> str:
+    return create_access_token({"sub": "someone", "uid": user_id, "ver": version, **overrides},
+                               expires_delta=timedelta(minutes=5))
+
+
+def forge(claims: dict, secret: str, headers: dict = None) -> str:
+    claims = {"exp": 4102444800, **claims}  # year 2100
+    return jwt.encode(claims, secret, algorithm=ALGORITHM, headers=headers)
+
+
+def test_token_round_trip(user_id):
+    claims = decode_token(token_for(user_id))
+    assert claims == TokenClaims("someone", user_id, 0, claims.expires_at)
+
+
+def test_expired_token_is_rejected(user_id):
+    token = create_access_token({"sub": "someone", "uid": user_id, "ver": 0}, expires_delta=timedelta(seconds=-1))
+    assert decode_token(token) is None
+
+
+def test_new_tokens_use_the_active_key(rotated_keys, user_id):
+    token = token_for(user_id)
+    assert jwt.get_unverified_header(token)["kid"] == "2026-10"
+    assert decode_token(token) is not None
+
+
+def test_tokens_signed_with_a_listed_older_key_stay_valid(rotated_keys, user_id):
+    token = forge({"sub": "someone", "uid": user_id, "ver": 0}, "old-secret", {"kid": "2026-04"})
+    assert decode_token(token).user_id == user_id
+
+
+def test_tokens_of_a_dropped_key_are_rejected(rotated_keys, user_id, monkeypatch):
+    token = forge({"sub": "someone", "uid": user_id, "ver": 0}, "old-secret", {"kid": "2026-04"})
+    monkeypatch.setattr(auth, "SIGNING_KEYS", {"2026-10": "new-secret"})
+    assert decode_token(token) is None
+
+
+def test_kid_must_match_the_signing_key(rotated_keys, user_id):
+    # Signed with the old secret but claiming the new kid
+    assert decode_token(forge({"sub": "x", "uid": user_id, "ver": 0}, "old-secret", {"kid": "2026-10"})) is None
+    assert decode_token(forge({"sub": "x", "uid": user_id, "ver": 0}, "new-secret", {"kid": "unknown"})) is None
+
+
+def test_token_without_kid_needs_a_configured_default_key(rotated_keys, user_id, monkeypatch):
+    claims = {"sub": "admin", "uid": user_id, "ver": 99}
+    # Neither the public placeholder secret nor SECRET_KEY verify kid-less tokens
+    assert decode_token(forge(claims, "your-secret-key-change-in-production")) is None
+    assert decode_token(forge(claims, auth.SECRET_KEY)) is None
+
+    monkeypatch.setitem(auth.SIGNING_KEYS, "default", "legacy-secret")
+    assert decode_token(forge(claims, "legacy-secret")).user_id == user_id
+    assert decode_token(forge(claims, "your-secret-key-change-in-production")) is None
+
+
+def test_token_without_uid_is_rejected(user_id):
+    assert decode_token(create_access_token({"sub": "someone", "ver": 0})) is None
+    assert decode_token(create_access_token({"sub": "someone", "uid": str(user_id), "ver": 0})) is None
+
+
+def test_revocation_rejects_earlier_tokens(db, user_id):
+    token = token_for(user_id, get_token_version(db, user_id))
+    assert decode_token(token) is not None  # now in the token cache
+
+    assert revoke_user_tokens(db, user_id) == 1
+    assert decode_token(token) is None
+    assert decode_token(token_for(user_id, 1)) is not None
+
+    assert revoke_user_tokens(db, user_id) == 2
+    assert decode_token(token_for(user_id, 1)) is None
+
+
+def test_concurrent_revocations_both_count(db, user_id):
+    revoke_user_tokens(db, user_id)
+    other = SessionLocal()
+    try:
+        # `other` holds version 1 when the next revocation commits elsewhere;
+        # a read-modify-write from it would write 2 again
+        stale = other.get(UserTokenVersion, user_id)
+        assert stale.version == 1
+        assert revoke_user_tokens(db, user_id) == 2
+        assert revoke_user_tokens(other, user_id) == 3
+    finally:
+        other.close()
+    db.expire_all()
+    assert get_token_version(db, user_id) == 3
+
+
+def test_other_workers_see_revocations_after_refresh(db, user_id):
+    table = TokenVersionTable(refresh_seconds=0)
+    table.refresh_if_stale(db)
+    assert table.current(user_id) == 0
+    revoke_user_tokens(db, user_id)
+    table.refresh_if_stale(db)
+    assert table.current(user_id) == 1
+
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(max_size=2)
+    claims = TokenClaims("someone", 1, 0, 0.0)
+    for key in (b"a", b"b", b"c"):
+        cache.put(key, claims)
+    assert cache.get(b"a") is None
+    assert cache.get(b"b") == claims and cache.get(b"c") == claims
+
+
+def test_logout_all_revokes_the_session(client, auth_headers):
+    assert client.get("/me", headers=auth_headers).status_code == 200
+    assert client.post("/logout-all", headers=auth_headers).status_code == 200
+    assert client.get("/me", headers=auth_headers).status_code == 401
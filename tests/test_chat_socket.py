@@ -0,0 +1,51 @@
+"""The /ws chat channel, end to end through the app."""
+
+import uuid
+
+
+def authenticate(ws, headers: dict):
+    ws.send_json({"type": "auth", "token": headers["Authorization"].split(" ", 1)[1]})
+    assert ws.receive_json()["type"] == "ready"
+
+
+def chat(ws, message: str, conversation_id=None) -> dict:
+    """Send one turn and return its final frame ("done" or "error")."""
+    turn_id = uuid.uuid4().hex[:8]
+    ws.send_json({"type": "chat", "id": turn_id, "message": message, "conversation_id": conversation_id})
+    while True:
+        frame = ws.receive_json()
+        if frame.get("id") == turn_id and frame["type"] in ("done", "error"):
+            return frame
+
+
+def test_turns_continue_a_conversation(client, auth_headers):
+    with client.websocket_connect("/ws") as ws:
+        authenticate(ws, auth_headers)
+        first = chat(ws, "hello")
+        assert first["type"] == "done"
+        second = chat(ws, "again", first["conversation_id"])
+        assert second["type"] == "done"
+        assert second["assistant_message"]["content"].startswith("Echo (2 previous messages)")
+
+
+def test_turn_into_another_users_conversation_is_refused(client, auth_headers, other_headers):
+    with client.websocket_connect("/ws") as ws:
+        authenticate(ws, other_headers)
+        frame = chat(ws, "not yours", client.post("/conversations", headers=auth_headers, json={}).json()["id"])
+        assert frame["type"] == "error" and frame["status"] == 404
+
+
+def test_reissued_conversation_id_is_not_written_to(client, auth_headers, other_headers):
+    with client.websocket_connect("/ws") as ws:
+        authenticate(ws, auth_headers)
+        conversation_id = chat(ws, "mine")["conversation_id"]
+        client.delete(f"/conversations/{conversation_id}", headers=auth_headers).raise_for_status()
+
+        # SQLite hands the id of the deleted (newest) conversation to the next one
+        reissued = client.post("/conversations", headers=other_headers, json={}).json()["id"]
+        assert reissued == conversation_id
+
+        frame = chat(ws, "still mine?", conversation_id)
+        assert frame["type"] == "error" and frame["status"] == 404
+        messages = client.get(f"/conversations/{conversation_id}/messages", headers=other_headers).json()
+        assert messages == []
@@ -0,0 +1,160 @@
+"""Context cache: prefix registration, hits, misses, expiry and what a turn sends."""
+
+import pytest
+from backend.context_cache import (
+    EXPIRY_MARGIN_SECONDS, ContextCacheManager, FakeContextCacheProvider,
+)
+from backend.shared_state import InMemoryState
+
+
+def turns(count: int, first_id: int = 1):
+    return [
+        {"id": first_id + i, "role": "user" if i % 2 == 0 else "assistant", "content": f"message {first_id + i}"}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def manager(clock):
+    return ContextCacheManager(
+        FakeContextCacheProvider(), ttl_seconds=600, min_tokens=0, refresh_messages=4, state=InMemoryState()
+    )
+
+
+def test_lookup_misses_until_registered(manager):
+    assert manager.lookup(1) is None
+    entry = manager.register(1, "model", "system", turns(4))
+    assert manager.lookup(1) == entry
+    assert (manager.hits, manager.misses) == (1, 1)
+    assert entry.last_message_id == 4
+    assert entry.message_count == 4
+    assert manager.provider.contexts[entry.name]["messages"] == turns(4)
+
+
+def test_conversations_are_cached_separately(manager):
+    manager.register(1, "model", "system", turns(4))
+    assert manager.lookup(2) is None
+
+
+def test_entry_expires_before_the_provider_drops_it(manager, clock):
+    manager.register(1, "model", "system", turns(4))
+    clock.advance(600 - EXPIRY_MARGIN_SECONDS - 1)
+    assert manager.lookup(1) is not None
+    clock.advance(1)
+    assert manager.lookup(1) is None
+    # Re-registered once the provider has dropped it too
+    assert not manager.should_refresh(1, 4)
+    clock.advance(EXPIRY_MARGIN_SECONDS)
+    assert manager.should_refresh(1, 4)
+
+
+def test_small_prefix_is_not_registered(manager):
+    manager.min_tokens = 1000
+    assert manager.register(1, "model", "system", turns(4)) is None
+    assert manager.provider.created == 0
+    assert manager.lookup(1) is None
+    # The attempt still counts, so the next one waits for more messages
+    assert not manager.should_refresh(1, 7)
+    assert manager.should_refresh(1, 8)
+
+
+def test_should_refresh_counts_messages_after_the_prefix(manager):
+    assert manager.should_refresh(1, 4)
+    manager.register(1, "model", "system", turns(4))
+    assert not manager.should_refresh(1, 7)
+    assert manager.should_refresh(1, 8)
+
+
+def test_reregistering_replaces_the_previous_prefix(manager):
+    first = manager.register(1, "model", "system", turns(4))
+    second = manager.register(1, "model", "system", turns(8))
+    assert manager.lookup(1) == second
+    assert first.name not in manager.provider.contexts
+    assert manager.provider.deleted == 1
+
+
+def test_forget_drops_the_prefix(manager):
+    entry = manager.register(1, "model", "system", turns(4))
+    manager.forget(1)
+    assert manager.lookup(1) is None
+    assert entry.name not in manager.provider.contexts
+    assert manager.should_refresh(1, 4)
+
+
+def test_failed_provider_delete_is_ignored(manager):
+    def fail(name):
+        raise RuntimeError("provider unavailable")
+
+    manager.register(1, "model", "system", turns(4))
+    manager.provider.delete = fail
+    manager.forget(1)
+    assert manager.lookup(1) is None
+
+
+# Through the API: with a live prefix only the turns after it reach the LLM
+
+@pytest.fixture
+def client(monkeypatch, manager):
+    # The app with `manager` as its context cache
+    from fastapi.testclient import TestClient
+    from backend import llm_service
+    from backend.main import app
+
+    monkeypatch.setattr(llm_service, "_context_cache", manager)
+    monkeypatch.setattr(llm_service, "_context_cache_built", True)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_chat_sends_only_turns_after_the_cached_prefix(client, auth_headers, manager):
+    conversation_id = None
+
+    def chat(text: str) -> str:
+        nonlocal conversation_id
+        response = client.post("/chat", headers=auth_headers, json={"message": text, "conversation_id": conversation_id})
+        response.raise_for_status()
+        conversation_id = response.json()["conversation_id"]
+        return response.json()["assistant_message"]["content"]
+
+    assert chat("one").startswith("Echo (0 previous messages)")
+    assert chat("two").startswith("Echo (2 previous messages)")
+    # Four messages now: the prefix was registered after the reply
+    prefix = manager.lookup(conversation_id)
+    assert prefix is not None and prefix.message_count == 4
+    assert [m["content"] for m in manager.provider.contexts[prefix.name]["messages"]][:3] == ["one", "Echo (0 previous messages): one", "two"]
+
+    assert chat("three").startswith("Echo (0 previous messages)")
+    assert chat("four").startswith("Echo (2 previous messages)")
+    # The prefix grew to eight messages and the old one was deleted
+    grown = manager.lookup(conversation_id)
+    assert grown.message_count == 8 and grown.name != prefix.name
+    assert prefix.name not in manager.provider.contexts
+
+    assert chat("five").startswith("Echo (0 previous messages)")
+
+
+def test_chat_stops_using_a_prefix_whose_refresh_fell_behind(client, auth_headers, manager):
+    conversation_id = None
+
+    def chat(text: str) -> str:
+        nonlocal conversation_id
+        response = client.post("/chat", headers=auth_headers, json={"message": text, "conversation_id": conversation_id})
+        response.raise_for_status()
+        conversation_id = response.json()["conversation_id"]
+        return response.json()["assistant_message"]["content"]
+
+    chat("one")
+    chat("two")
+    prefix = manager.lookup(conversation_id)
+    assert prefix.message_count == 4
+
+    def unavailable(*args):
+        raise RuntimeError("provider unavailable")
+
+    manager.provider.create = unavailable
+    assert chat("three").startswith("Echo (0 previous messages)")
+    assert chat("four").startswith("Echo (2 previous messages)")   # refresh fails after this turn
+    assert chat("five").startswith("Echo (4 previous messages)")
+    # Six messages follow the prefix: all of the recent history is sent instead
+    assert chat("six").startswith("Echo (10 previous messages)")
+    assert manager.lookup(conversation_id) == prefix
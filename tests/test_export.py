@@ -0,0 +1,71 @@
+"""History export and import over HTTP, as a client that accepts compressed responses."""
+
+import io
+import json
+import os
+import zipfile
+import pytest
+
+
+@pytest.fixture
+def history(client, auth_headers):
+    # Incompressible text, so the zip stays above the compression threshold
+    for _ in range(2):
+        text = os.urandom(3000).hex()
+        client.post("/chat", headers=auth_headers, json={"message": text}).raise_for_status()
+
+
+def read_zip_export(client, headers) -> list:
+    response = client.get("/export", params={"format": "zip"}, headers={**headers, "Accept-Encoding": "gzip, br"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert "content-encoding" not in response.headers
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        (name,) = archive.namelist()
+        return [json.loads(line) for line in archive.read(name).decode().splitlines()]
+
+
+def test_zip_export_is_not_compressed_again(client, auth_headers, history):
+    records = read_zip_export(client, auth_headers)
+    assert sum(1 for record in records if record["type"] == "conversation") == 2
+
+
+def test_zip_export_round_trips_through_import(client, auth_headers, other_headers, history):
+    response = client.get("/export", params={"format": "zip"}, headers=auth_headers)
+    imported = client.post("/import", headers=other_headers, files={"file": ("history.zip", response.content)})
+    assert imported.status_code == 200
+    assert imported.json()["conversations"] == 2
+
+
+@pytest.fixture
+def limited_client(client):
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    from backend.request_limits import BodySizeLimitMiddleware
+
+    return TestClient(BodySizeLimitMiddleware(app, limits={"/import": 1000}))
+
+
+def test_import_declared_over_the_limit_is_refused(limited_client, auth_headers):
+    response = limited_client.post("/import", headers=auth_headers, files={"file": ("big.ndjson", b"x" * 2000)})
+    assert response.status_code == 413
+
+
+def test_chunked_import_is_cut_off_at_the_limit(limited_client, auth_headers):
+    def chunks():
+        yield b"--boundary\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.ndjson\"\r\n\r\n"
+        for _ in range(20):
+            yield b"x" * 100
+        yield b"\r\n--boundary--\r\n"
+
+    response = limited_client.post("/import", content=chunks(), headers={
+        **auth_headers, "Content-Type": "multipart/form-data; boundary=boundary",
+    })
+    assert response.status_code == 413
+
+
+def test_ndjson_export_is_compressed(client, auth_headers, history):
+    response = client.get("/export", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.text.splitlines()) > 2
@@ -0,0 +1,128 @@
+"""Google certificate cache against a stub certs endpoint."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from backend.google_auth import (
+    DEFAULT_MAX_AGE_SECONDS, FORCED_REFRESH_INTERVAL_SECONDS, REFRESH_AT_FRACTION, RETRY_SECONDS,
+    GoogleCertCache, parse_max_age,
+)
+
+
+class CertsEndpoint:
+    """What the stub server answers; tests change it between fetches."""
+
+    def __init__(self):
+        self.certs = {"key1": "cert1"}
+        self.cache_control = "public, max-age=300, must-revalidate"
+        self.status = 200
+        self.requests = 0
+
+
+@pytest.fixture
+def endpoint():
+    endpoint = CertsEndpoint()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            endpoint.requests += 1
+            body = json.dumps(endpoint.certs).encode()
+            self.send_response(endpoint.status)
+            self.send_header("Content-Type", "application/json")
+            if endpoint.cache_control:
+                self.send_header("Cache-Control", endpoint.cache_control)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    endpoint.url = f"http://127.0.0.1:{server.server_port}/oauth2/v1/certs"
+    yield endpoint
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(endpoint, clock):
+    cache = GoogleCertCache(endpoint.url)
+    yield cache
+    cache.close()
+
+
+def test_parse_max_age():
+    assert parse_max_age("public, max-age=19826, must-revalidate, no-transform") == 19826
+    assert parse_max_age("no-cache") is None
+    assert parse_max_age("") is None
+
+
+def test_certs_are_reused_for_max_age(cache, endpoint, clock):
+    assert cache.get() == {"key1": "cert1"}
+    clock.advance(299)
+    assert cache.get() == {"key1": "cert1"}
+    assert endpoint.requests == 1
+
+    endpoint.certs = {"key2": "cert2"}
+    clock.advance(1)
+    assert cache.get() == {"key2": "cert2"}
+    assert endpoint.requests == 2
+
+
+def test_background_refresh_is_scheduled_before_expiry(cache, endpoint, clock):
+    cache.get()
+    assert cache._timer.interval == pytest.approx(300 * REFRESH_AT_FRACTION)
+
+    # The timer firing fetches the new certs and the new max-age
+    endpoint.certs = {"key2": "cert2"}
+    endpoint.cache_control = "max-age=60"
+    clock.advance(300 * REFRESH_AT_FRACTION)
+    cache._timer.function()
+    assert endpoint.requests == 2
+    assert cache._timer.interval == pytest.approx(60 * REFRESH_AT_FRACTION)
+
+    # ...so requests never wait for a fetch
+    assert cache.get() == {"key2": "cert2"}
+    clock.advance(59)
+    assert cache.get() == {"key2": "cert2"}
+    assert endpoint.requests == 2
+
+
+def test_failed_background_refresh_keeps_current_certs(cache, endpoint, clock):
+    cache.get()
+    endpoint.status = 500
+    cache._timer.function()
+    assert cache._timer.interval == RETRY_SECONDS
+    assert cache.get() == {"key1": "cert1"}
+
+
+def test_missing_max_age_uses_default(cache, endpoint, clock):
+    endpoint.cache_control = None
+    cache.get()
+    clock.advance(DEFAULT_MAX_AGE_SECONDS - 1)
+    cache.get()
+    assert endpoint.requests == 1
+    clock.advance(1)
+    cache.get()
+    assert endpoint.requests == 2
+
+
+def test_unknown_key_forces_a_rate_limited_refresh(cache, endpoint, clock):
+    cache.get()
+    assert cache.refresh_for_unknown_key("key1") == {"key1": "cert1"}
+    assert endpoint.requests == 1
+
+    endpoint.certs = {"key1": "cert1", "key2": "cert2"}
+    assert "key2" in cache.refresh_for_unknown_key("key2")
+    assert endpoint.requests == 2
+
+    # Tokens with made-up key ids can't make us hammer the endpoint
+    cache.refresh_for_unknown_key("bogus")
+    assert endpoint.requests == 2
+    clock.advance(FORCED_REFRESH_INTERVAL_SECONDS)
+    cache.refresh_for_unknown_key("bogus")
+    assert endpoint.requests == 3
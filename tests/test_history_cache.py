@@ -0,0 +1,137 @@
+"""The hot history cache: ring bounds, LRU/memory limits and invalidation across workers."""
+
+from datetime import datetime
+import pytest
+from backend.history_cache import HistoryCache, message_size
+from backend.shared_state import FakeRedis, InMemoryState, RedisState
+
+ALICE, BOB = 1, 2
+
+
+def message(message_id: int, content: str = "hello") -> dict:
+    return {"id": message_id, "role": "user", "content": content, "timestamp": datetime(2026, 10, 19)}
+
+
+def ids(messages) -> list:
+    return [m["id"] for m in messages]
+
+
+@pytest.fixture
+def cache():
+    return HistoryCache(ring_size=3, state=InMemoryState())
+
+
+@pytest.fixture
+def workers():
+    """Two processes' caches sharing one Redis."""
+    state = RedisState(FakeRedis())
+    return HistoryCache(ring_size=3, state=state), HistoryCache(ring_size=3, state=state)
+
+
+def test_appends_are_written_through(cache):
+    cache.start(10, ALICE)
+    for message_id in (1, 2):
+        cache.append(10, message(message_id))
+    assert ids(cache.recent(10, ALICE)) == [1, 2]
+    assert ids(cache.messages_after(10, ALICE, 1)) == [2]
+    assert cache.hits == 2
+
+
+def test_other_users_miss(cache):
+    cache.start(10, ALICE)
+    assert cache.recent(10, BOB) is None
+    assert cache.messages_after(10, BOB, 0) is None
+
+
+def test_ring_keeps_only_the_newest_messages(cache):
+    cache.start(10, ALICE)
+    for message_id in range(1, 6):
+        cache.append(10, message(message_id))
+    # The ring no longer holds the whole conversation
+    assert cache.recent(10, ALICE) is None
+    assert ids(cache.recent(10, ALICE, limit=3)) == [3, 4, 5]
+    assert cache.recent(10, ALICE, limit=4) is None
+    # Message 3 may not directly follow message 2; only ids from 3 on are known
+    assert cache.messages_after(10, ALICE, 2) is None
+    assert ids(cache.messages_after(10, ALICE, 3)) == [4, 5]
+
+
+def test_fill_of_a_short_conversation_is_whole(cache):
+    cache.fill(10, ALICE, [message(1), message(2)], cache.version(10))
+    assert ids(cache.recent(10, ALICE)) == [1, 2]
+    cache.fill(11, ALICE, [message(3), message(4), message(5)], cache.version(11))
+    assert cache.recent(11, ALICE) is None  # may have older messages
+
+
+def test_invalidate_forgets_the_conversation(cache):
+    cache.start(10, ALICE)
+    cache.append(10, message(1))
+    cache.invalidate(10)
+    assert cache.recent(10, ALICE) is None
+    assert cache.size == 0
+    cache.append(10, message(2))  # not cached again until the next fill
+    assert cache.recent(10, ALICE) is None
+
+
+def test_delete_in_one_worker_invalidates_the_other(workers):
+    first, second = workers
+    for cache in workers:
+        cache.fill(10, ALICE, [message(1)], cache.version(10))
+    second.invalidate(10)
+    assert first.recent(10, ALICE) is None
+
+
+def test_append_in_one_worker_invalidates_the_other(workers):
+    first, second = workers
+    for cache in workers:
+        cache.fill(10, ALICE, [message(1)], cache.version(10))
+    second.append(10, message(2))
+    assert ids(second.recent(10, ALICE)) == [1, 2]
+    assert first.recent(10, ALICE) is None
+
+
+def test_append_after_another_workers_write_drops_the_gap(workers):
+    first, second = workers
+    first.fill(10, ALICE, [message(1)], first.version(10))
+    second.append(10, message(2))
+    first.append(10, message(3))  # first never saw message 2
+    assert first.recent(10, ALICE) is None
+
+
+def test_fill_read_before_a_concurrent_write_is_not_trusted(workers):
+    first, second = workers
+    version = first.version(10)
+    second.append(10, message(2))  # lands between the version read and the query
+    first.fill(10, ALICE, [message(1)], version)
+    assert first.recent(10, ALICE) is None
+
+
+def test_least_recently_used_conversation_is_evicted():
+    cache = HistoryCache(ring_size=3, max_conversations=2, state=InMemoryState())
+    cache.start(10, ALICE)
+    cache.start(11, ALICE)
+    cache.recent(10, ALICE)  # 11 is now the least recently used
+    cache.start(12, ALICE)
+    assert cache.recent(11, ALICE) is None
+    assert cache.recent(10, ALICE) == [] and cache.recent(12, ALICE) == []
+
+
+def test_memory_limit_evicts_and_keeps_the_size_exact():
+    one = message_size(message(1, "x" * 100))
+    cache = HistoryCache(ring_size=3, max_bytes=3 * one, state=InMemoryState())
+    for conversation_id in (10, 11):
+        cache.start(conversation_id, ALICE)
+        cache.append(conversation_id, message(conversation_id, "x" * 100))
+    assert cache.size == 2 * one
+
+    # Rendered html counts too: 10 grows past the limit, so the oldest (10 itself) goes
+    rendered = {**message(10, "x" * 100), "html": "<p>" + "x" * 500 + "</p>"}
+    cache.replace(10, [rendered])
+    assert cache.recent(10, ALICE) is None
+    assert cache.size == one <= cache.max_bytes
+
+    for message_id in range(20, 26):
+        cache.append(11, message(message_id, "x" * 100))
+    assert cache.size == 3 * one  # the ring of 3 replaced the older messages
+    cache.invalidate(11)
+    assert cache.size == 0
@@ -0,0 +1,144 @@
+"""LLM scheduler admission: stride fairness, reserved interactive slots and cancellation."""
+
+import asyncio
+from collections import Counter
+import pytest
+from backend.llm_scheduler import BACKGROUND, BATCH, INTERACTIVE, LLMScheduler, parse_weights
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    """Let every runnable task reach its next await."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_parse_weights():
+    assert parse_weights("interactive:8, batch:0.5") == {INTERACTIVE: 8.0, BACKGROUND: 1.0, BATCH: 0.5}
+    with pytest.raises(ValueError):
+        parse_weights("urgent:3")
+    with pytest.raises(ValueError):
+        parse_weights("batch:0")
+
+
+def test_backlogged_classes_share_slots_by_weight():
+    async def main():
+        scheduler = LLMScheduler(
+            max_concurrency=1, weights={INTERACTIVE: 1, BACKGROUND: 2, BATCH: 1},
+            interactive_reserved=0, preempt_queue_depth=100,
+        )
+        granted = []
+
+        async def call(priority):
+            async with scheduler.slot(priority):
+                granted.append(priority)
+
+        await scheduler.acquire(INTERACTIVE)  # keeps everyone queued until released
+        tasks = [asyncio.create_task(call(p)) for p in [BACKGROUND] * 12 + [BATCH] * 12]
+        await settle()
+        assert scheduler.snapshot()["queued"] == {INTERACTIVE: 0, BACKGROUND: 12, BATCH: 12}
+        scheduler.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return granted
+
+    granted = run(main())
+    # While both are backlogged, background gets two grants for each batch one
+    assert Counter(granted[:12]) == {BACKGROUND: 8, BATCH: 4}
+    assert Counter(granted) == {BACKGROUND: 12, BATCH: 12}
+
+
+def test_background_never_takes_the_reserved_slots():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=4, interactive_reserved=1, preempt_queue_depth=1)
+        for _ in range(3):
+            await scheduler.acquire(BACKGROUND)
+        waiting = asyncio.create_task(scheduler.acquire(BACKGROUND))
+        await settle()
+        assert not waiting.done()
+        await asyncio.wait_for(scheduler.acquire(INTERACTIVE), timeout=1)
+        snapshot = scheduler.snapshot()
+        waiting.cancel()
+        return snapshot
+
+    snapshot = run(main())
+    assert snapshot["active"] == {INTERACTIVE: 1, BACKGROUND: 3, BATCH: 0}
+    assert snapshot["queued"][BACKGROUND] == 1
+
+
+def test_queued_interactive_calls_go_before_background():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=2, interactive_reserved=0, preempt_queue_depth=1)
+        await scheduler.acquire(INTERACTIVE)
+        await scheduler.acquire(INTERACTIVE)
+        background = asyncio.create_task(scheduler.acquire(BACKGROUND))
+        interactive = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        await settle()
+        scheduler.release(INTERACTIVE)
+        await settle()
+        order = (interactive.done(), background.done())
+        scheduler.release(INTERACTIVE)
+        await settle()
+        return order, background.done()
+
+    (interactive_first, background_first), background_later = run(main())
+    assert interactive_first and not background_first
+    assert background_later
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        await scheduler.acquire(INTERACTIVE)
+        cancelled = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        waiting = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        await settle()
+        cancelled.cancel()
+        await settle()
+        assert scheduler.snapshot()["queued"][INTERACTIVE] == 1
+        scheduler.release(INTERACTIVE)
+        await settle()
+        return waiting.done(), scheduler.snapshot()
+
+    granted, snapshot = run(main())
+    assert granted
+    assert snapshot["active"][INTERACTIVE] == 1 and snapshot["queued"][INTERACTIVE] == 0
+
+
+def test_cancellation_right_after_the_grant_releases_the_slot():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        await scheduler.acquire(INTERACTIVE)
+        granted = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        waiting = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        await settle()
+        # The slot goes to `granted`, which is cancelled before it gets to run
+        scheduler.release(INTERACTIVE)
+        granted.cancel()
+        await settle()
+        return granted.cancelled(), waiting.done(), scheduler.snapshot()
+
+    cancelled, waiting_granted, snapshot = run(main())
+    assert cancelled and waiting_granted
+    assert snapshot["active"][INTERACTIVE] == 1
+
+
+def test_cancelling_a_call_in_its_slot_frees_the_slot():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+
+        async def call():
+            async with scheduler.slot(BACKGROUND):
+                await asyncio.sleep(3600)
+
+        task = asyncio.create_task(call())
+        await settle()
+        assert scheduler.snapshot()["active"][BACKGROUND] == 1
+        task.cancel()
+        await settle()
+        await asyncio.wait_for(scheduler.acquire(BACKGROUND), timeout=1)
+        return scheduler.snapshot()
+
+    assert run(main())["active"] == {INTERACTIVE: 0, BACKGROUND: 1, BATCH: 0}
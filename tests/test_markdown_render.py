@@ -0,0 +1,71 @@
+"""Server-side markdown rendering: math passthrough and sanitizing."""
+
+from html.parser import HTMLParser
+import pytest
+
+pytest.importorskip("markdown")
+pytest.importorskip("bleach")
+
+from backend.markdown_render import ALLOWED_ATTRIBUTES, ALLOWED_TAGS, MarkdownRenderer  # noqa: E402
+
+
+class Elements(HTMLParser):
+    """Collects (tag, attributes) for every start tag."""
+
+    def __init__(self, text: str):
+        super().__init__()
+        self.found = []
+        self.feed(text)
+
+    def handle_starttag(self, tag, attrs):
+        self.found.append((tag, dict(attrs)))
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    return MarkdownRenderer()
+
+
+def assert_sanitized(rendered: str):
+    for tag, attrs in Elements(rendered).found:
+        assert tag in ALLOWED_TAGS
+        assert set(attrs) <= set(ALLOWED_ATTRIBUTES.get(tag, [])), (tag, attrs)
+
+
+def test_math_is_passed_through(renderer):
+    rendered = renderer.render("Euler: $e^{i\\pi} + 1 = 0$ and $$a_1 * b_2 < c$$")
+    assert "$e^{i\\pi} + 1 = 0$" in rendered
+    assert "$$a_1 * b_2 &lt; c$$" in rendered
+    assert "<em>" not in rendered
+
+
+def test_math_in_code_is_left_alone(renderer):
+    assert renderer.render("`$x$`") == "<p><code>$x$</code></p>"
+
+
+@pytest.mark.parametrize("text", [
+    '[click]($" onmouseover="alert(1)$)',
+    "[click]($' onmouseover='alert(1)$)",
+    '[click](https://example.com "$" onclick="alert(1)$")',
+    '[click](\\(" onmouseover="alert(1)\\))',
+    '![x]($" onerror="alert(1)$)',
+    '![x](https://example.com/x.png "$" onerror="alert(1)$")',
+    '$<img src=x onerror=alert(1)>$',
+    '$$<script>alert(1)</script>$$',
+])
+def test_math_cannot_inject_markup(renderer, text):
+    rendered = renderer.render(text)
+    assert_sanitized(rendered)
+    assert "<script" not in rendered and "<img" not in rendered
+
+
+def test_math_in_a_link_target_stays_inside_the_attribute(renderer):
+    (tag, attrs), = Elements(renderer.render('[click]($" onmouseover="alert(1)$)')).found[1:]
+    assert tag == "a"
+    assert attrs == {"href": '$" onmouseover="alert(1)$'}
+
+
+def test_disallowed_markup_is_stripped(renderer):
+    rendered = renderer.render('<script>alert(1)</script>[x](javascript:alert(1)) <b onclick="x">y</b>')
+    assert_sanitized(rendered)
+    assert "javascript:" not in rendered
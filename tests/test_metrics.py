@@ -0,0 +1,71 @@
+"""Prometheus exposition, in one process and merged across worker processes."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from backend.metrics import MetricsRegistry, reset_metrics_dir
+
+WORKER = """
+import sys
+from backend.metrics import registry
+requests = registry.counter("test_requests_total", "Requests", {"outcome": ["ok", "error"]})
+connections = registry.gauge("test_connections", "Open connections")
+requests.inc(int(sys.argv[1]), outcome="ok")
+connections.inc(int(sys.argv[1]))
+if sys.argv[2] == "exit":
+    registry.close()
+"""
+
+
+def test_declared_series_are_listed_before_any_update():
+    registry = MetricsRegistry(directory="")
+    registry.counter("test_calls_total", "Calls", {"outcome": ["ok", "error"]})
+    text = registry.render().decode()
+    assert 'test_calls_total{outcome="ok"} 0.0' in text
+    assert 'test_calls_total{outcome="error"} 0.0' in text
+    assert "# TYPE test_calls_total counter" in text
+
+
+def test_undeclared_label_values_are_rejected():
+    registry = MetricsRegistry(directory="")
+    calls = registry.counter("test_calls_total", "Calls", {"outcome": ["ok"]})
+    with pytest.raises(ValueError):
+        calls.inc(outcome="mystery")
+    with pytest.raises(ValueError):
+        registry.gauge("test_depth", "Depth").set(1, outcome="ok")
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(directory="")
+    registry.counter("test_paths_total", "Paths", {"path": ['say "hi"\\n']})
+    assert 'test_paths_total{path="say \\"hi\\"\\\\n"} 0.0' in registry.render().decode()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(directory="")
+    wait = registry.histogram("test_wait_seconds", "Wait", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5):
+        wait.observe(value)
+    text = registry.render().decode()
+    assert 'test_wait_seconds_bucket{le="0.1"} 1.0' in text
+    assert 'test_wait_seconds_bucket{le="1.0"} 2.0' in text
+    assert 'test_wait_seconds_bucket{le="+Inf"} 3.0' in text
+    assert "test_wait_seconds_count 3.0" in text
+
+
+def test_workers_are_merged_and_exited_gauges_dropped(tmp_path):
+    directory = str(tmp_path / "metrics")
+    reset_metrics_dir(directory)
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}
+    # One worker still running (it keeps its gauge), one that shut down
+    for count, ending in ((2, "running"), (3, "exit")):
+        subprocess.run([sys.executable, "-c", WORKER, str(count), ending], env=env, check=True,
+                       cwd=Path(__file__).parent.parent)
+
+    text = MetricsRegistry(directory=directory).render().decode()
+    # Counts of exited workers are kept, so totals never go backwards
+    assert 'test_requests_total{outcome="ok"} 5.0' in text
+    assert 'test_requests_total{outcome="error"} 0.0' in text
+    assert "test_connections 2.0" in text
@@ -0,0 +1,54 @@
+"""Profiling sessions: request limits and publishing results to shared state."""
+
+import asyncio
+import json
+import threading
+import pytest
+from backend.profiling import Profiler
+from backend.shared_state import FakeRedis, RedisState
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler(state=RedisState(FakeRedis()))
+    yield profiler
+    profiler.close()
+
+
+def profile_requests(profiler: Profiler, count: int):
+    async def handler():
+        return "ok"
+
+    async def main():
+        for _ in range(count):
+            await profiler.profile_call("GET", "/things", handler)
+
+    asyncio.run(main())
+
+
+def test_reaching_the_request_limit_publishes_off_the_event_loop(profiler, monkeypatch):
+    session = profiler.start(max_requests=2, seconds=60)
+    publishing_threads = []
+    publish = profiler._publish_results
+
+    def record_thread(session):
+        publishing_threads.append(threading.get_ident())
+        publish(session)
+
+    monkeypatch.setattr(profiler, "_publish_results", record_thread)
+    profile_requests(profiler, 1)
+    assert profiler.session is session
+    profile_requests(profiler, 1)
+
+    assert profiler.session is None and session.stop_reason == "limit reached"
+    assert publishing_threads and threading.get_ident() not in publishing_threads
+    published = json.loads(profiler.state.get(profiler._results_key(session.id, session.worker)))
+    assert published == session.results()
+    assert profiler.results().summary()["requests_seen"] == 2
+
+
+def test_requests_outside_a_session_are_not_recorded(profiler):
+    profile_requests(profiler, 3)
+    session = profiler.start(max_requests=5, seconds=60)
+    profile_requests(profiler, 1)
+    assert session.requests_seen == 1
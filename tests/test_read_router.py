@@ -0,0 +1,115 @@
+"""Read routing between a primary and a replica, as two SQLite files."""
+
+import uuid
+import pytest
+from sqlalchemy import insert, select
+from backend import database
+from backend.database import ReadRouter, Replica, SessionLocal, init_db, is_replica
+from backend.migrations import upgrade
+from backend.models import User
+from backend.shared_state import InMemoryState
+
+
+@pytest.fixture
+def router(monkeypatch, clock, tmp_path):
+    init_db()
+    replica = Replica(f"sqlite:///{tmp_path / 'replica.db'}")
+    upgrade(replica.engine)
+    router = ReadRouter([replica], sticky_seconds=10, max_lag=5, state=InMemoryState())
+    router.check_replicas()
+    # Commits on primary sessions pin their user through the module-level router
+    monkeypatch.setattr(database, "read_router", router)
+    yield router
+    replica.engine.dispose()
+
+
+def write_user(user_id: int, rollback: bool = False) -> str:
+    """Insert a user in a primary session acting for `user_id`; returns the username."""
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    db.info["user_id"] = user_id
+    try:
+        db.execute(insert(User).values(
+            username=username, email=f"{username}@example.com", hashed_password="x",
+        ))
+        if rollback:
+            db.rollback()
+        else:
+            db.commit()
+    finally:
+        db.close()
+    return username
+
+
+def read_username(router: ReadRouter, user_id: int, username: str):
+    db = router.session_for_read(user_id)
+    try:
+        found = db.execute(select(User.username).where(User.username == username)).scalar()
+        return found, is_replica(db)
+    finally:
+        db.close()
+
+
+def test_reads_go_to_a_healthy_replica(router):
+    assert router.replicas[0].healthy
+    db = router.session_for_read(1)
+    assert is_replica(db)
+    db.close()
+
+
+def test_writer_reads_own_write_from_primary(router):
+    username = write_user(1)
+    # The replica (a separate file) never sees the row; the writer still does
+    assert read_username(router, 1, username) == (username, False)
+    assert read_username(router, 2, username) == (None, True)
+
+
+def test_sticky_window_expires(router, clock):
+    username = write_user(1)
+    clock.advance(9)
+    assert read_username(router, 1, username) == (username, False)
+    clock.advance(1)
+    assert read_username(router, 1, username) == (None, True)
+
+
+def test_rolled_back_write_does_not_pin(router):
+    username = write_user(1, rollback=True)
+    assert read_username(router, 1, username) == (None, True)
+
+
+def test_anonymous_reads_use_the_replica(router):
+    username = write_user(1)
+    assert read_username(router, None, username) == (None, True)
+
+
+def test_lagging_replica_is_taken_out_of_rotation(router, monkeypatch):
+    monkeypatch.setattr(database, "measure_lag", lambda engine: 6.0)
+    router.check_replicas()
+    assert not router.replicas[0].healthy
+    assert read_username(router, 2, write_user(1))[1] is False
+
+    monkeypatch.setattr(database, "measure_lag", lambda engine: 1.0)
+    router.check_replicas()
+    assert router.replicas[0].healthy
+
+
+def test_failing_replica_is_taken_out_of_rotation(router, monkeypatch):
+    def fail(engine):
+        raise RuntimeError("connection refused")
+
+    monkeypatch.setattr(database, "measure_lag", fail)
+    router.check_replicas()
+    assert router.snapshot() == [
+        {"name": router.replicas[0].name, "healthy": False, "lag_seconds": None, "error": "connection refused"}
+    ]
+    db = router.session_for_read(2)
+    assert not is_replica(db)
+    db.close()
+
+
+def test_without_replicas_everything_reads_from_primary(monkeypatch):
+    router = ReadRouter([], state=InMemoryState())
+    monkeypatch.setattr(database, "read_router", router)
+    username = write_user(1)
+    assert read_username(router, 1, username) == (username, False)
+    assert router.state.get(router._write_key(1)) is None
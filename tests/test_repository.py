@@ -0,0 +1,125 @@
+"""The data access functions of backend/repository.py, on a scratch database per test."""
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from backend import repository
+from backend.migrations import upgrade
+from backend.models import ChatMessage, MessageRender, UsageDaily
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'repository.db'}")
+    upgrade(engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def alice(db):
+    return repository.create_user(db, "alice@example.com", "alice", "hashed", full_name="Alice")
+
+
+@pytest.fixture
+def bob(db):
+    return repository.create_user(db, "bob@example.com", "bob", "hashed")
+
+
+def test_create_user_returns_the_profile(db, alice):
+    assert (alice.username, alice.email, alice.full_name) == ("alice", "alice@example.com", "Alice")
+    assert repository.get_user_profile(db, alice.id) == {
+        "id": alice.id, "username": "alice", "email": "alice@example.com", "full_name": "Alice",
+    }
+    assert repository.get_user_profile(db, alice.id + 100) is None
+
+
+def test_users_are_found_by_username_or_email(db, alice, bob):
+    assert repository.get_user_by_login(db, "alice").id == alice.id
+    assert repository.get_user_by_login(db, "bob@example.com") == (bob.id, "bob", "hashed")
+    assert repository.get_user_by_login(db, "carol") is None
+    assert repository.get_user_by_username(db, "bob") == (bob.id, "bob")
+    assert repository.get_user_by_email(db, "alice@example.com") == (alice.id, "alice")
+    assert repository.get_user_by_email(db, "alice") is None
+
+
+def test_conversations_are_listed_newest_first_with_counts(db, alice, bob):
+    first = repository.create_conversation(db, alice.id, "First")
+    second = repository.create_conversation(db, alice.id)
+    repository.create_conversation(db, bob.id, "Bob's")
+    assert second["title"] == "New Chat" and second["message_count"] == 0
+
+    repository.add_message(db, first["id"], "user", "hi")
+    repository.add_message(db, first["id"], "assistant", "hello")
+    assert repository.touch_conversation(db, first["id"], alice.id)
+
+    listed = repository.list_conversations(db, alice.id)
+    assert [(c["id"], c["message_count"]) for c in listed] == [(first["id"], 2), (second["id"], 0)]
+    assert sorted(repository.conversation_ids(db, alice.id)) == sorted([first["id"], second["id"]])
+
+
+def test_writes_check_ownership_when_given_a_user(db, alice, bob):
+    conversation = repository.create_conversation(db, alice.id)
+    assert repository.owns_conversation(db, conversation["id"], alice.id)
+    assert not repository.owns_conversation(db, conversation["id"], bob.id)
+
+    assert not repository.rename_conversation(db, conversation["id"], "Stolen", bob.id)
+    assert not repository.touch_conversation(db, conversation["id"], bob.id)
+    assert repository.rename_conversation(db, conversation["id"], "Renamed", alice.id)
+    assert repository.list_conversations(db, alice.id)[0]["title"] == "Renamed"
+    # Without a user the caller has already checked ownership
+    assert repository.rename_conversation(db, conversation["id"], "Again")
+    assert not repository.rename_conversation(db, conversation["id"] + 100, "Missing")
+
+
+def test_delete_removes_messages_and_renders(db, alice, bob):
+    conversation = repository.create_conversation(db, alice.id)
+    message = repository.add_message(db, conversation["id"], "assistant", "**hi**")
+    db.execute(insert(MessageRender).values(
+        message_id=message["id"], renderer_version="1", content_hash="x", html="<p><strong>hi</strong></p>",
+    ))
+    kept = repository.create_conversation(db, alice.id)
+    repository.add_message(db, kept["id"], "user", "stay")
+
+    assert not repository.delete_conversation(db, conversation["id"], bob.id)
+    assert repository.delete_conversation(db, conversation["id"], alice.id)
+    assert repository.conversation_ids(db, alice.id) == [kept["id"]]
+    assert db.scalars(select(ChatMessage.content)).all() == ["stay"]
+    assert db.scalars(select(MessageRender.message_id)).all() == []
+
+
+def test_messages_come_back_oldest_first(db, alice):
+    conversation_id = repository.create_conversation(db, alice.id)["id"]
+    added = [
+        repository.add_message(db, conversation_id, role, f"message {i}", finish_reason="stop" if i % 2 else None,
+                               prompt_tokens=i, completion_tokens=2 * i)
+        for i, role in enumerate(["user", "assistant"] * 3)
+    ]
+    assert repository.count_messages(db, conversation_id) == 6
+    assert repository.conversation_messages(db, conversation_id) == added
+    assert repository.recent_messages(db, conversation_id, 2) == added[-2:]
+    assert repository.recent_messages(db, conversation_id, 10) == added
+    assert repository.conversation_turns(db, conversation_id)[0] == {
+        "id": added[0]["id"], "role": "user", "content": "message 0",
+    }
+    assert repository.recent_messages(db, conversation_id + 100, 5) == []
+
+
+def test_usage_report_filters_and_orders(db, alice, bob):
+    day = datetime(2026, 10, 19)
+    for user, offset, tokens in ((alice, 0, 10), (bob, 0, 20), (alice, 1, 30), (alice, 3, 40)):
+        db.execute(insert(UsageDaily).values(
+            user_id=user.id, bucket_start=day - timedelta(days=offset),
+            prompt_tokens=tokens, completion_tokens=1, message_count=1,
+        ))
+
+    report = repository.usage_report(db, UsageDaily, since=day - timedelta(days=2))
+    assert [(r["username"], r["bucket_start"], r["total_tokens"]) for r in report] == [
+        ("alice", day, 11), ("bob", day, 21), ("alice", day - timedelta(days=1), 31),
+    ]
+    only_alice = repository.usage_report(db, UsageDaily, since=day - timedelta(days=7), until=day, user_id=alice.id)
+    assert [r["prompt_tokens"] for r in only_alice] == [30, 40]
+    assert len(repository.usage_report(db, UsageDaily, since=day - timedelta(days=7), limit=2)) == 2
@@ -0,0 +1,188 @@
+"""LLM error classification, retries within the deadline and the circuit breaker."""
+
+import asyncio
+import pytest
+from backend import llm_service
+from backend.resilience import (
+    CircuitBreaker, CircuitOpenError, LLMError, LLMInvalidRequestError, LLMRateLimitError, LLMServerError,
+    LLMTimeoutError, RetryPolicy, classify_error,
+)
+
+
+class ResourceExhausted(Exception):
+    """Named like the google.api_core exception for HTTP 429."""
+
+
+class InvalidArgument(Exception):
+    """Named like the google.api_core exception for HTTP 400."""
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (ResourceExhausted("quota"), LLMRateLimitError),
+    (InvalidArgument("bad"), LLMInvalidRequestError),
+    (StatusError(503), LLMServerError),
+    (StatusError(504), LLMTimeoutError),
+    (RuntimeError("upstream said 429 Too Many Requests"), LLMRateLimitError),
+    (RuntimeError("Deadline Exceeded"), LLMTimeoutError),
+    (RuntimeError("something else"), LLMError),
+])
+def test_errors_are_classified(exc, expected):
+    assert type(classify_error(exc)) is expected
+
+
+def test_classified_errors_pass_through():
+    error = LLMServerError("already classified")
+    assert classify_error(error) is error
+
+
+def test_retry_delays_stay_between_base_and_cap():
+    policy = RetryPolicy(attempts=5, base=0.5, cap=4.0)
+    delay = None
+    for _ in range(200):
+        previous = delay
+        delay = policy.next_delay(previous)
+        assert 0.5 <= delay <= min(4.0, max(0.5, (previous or 0.5) * 3))
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(window_seconds=30, min_calls=4, error_rate=0.5, open_seconds=10)
+
+
+def fail(breaker: CircuitBreaker, times: int = 1):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure(LLMServerError("down"))
+
+
+def test_breaker_opens_once_enough_calls_fail(breaker):
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CircuitBreaker.CLOSED  # 3 calls, below min_calls
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == 10
+
+
+def test_failures_outside_the_window_are_forgotten(breaker, clock):
+    fail(breaker, 3)
+    clock.advance(31)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["window_calls"] == 1
+
+
+def test_invalid_requests_do_not_open_the_breaker(breaker):
+    for _ in range(10):
+        breaker.before_call()
+        breaker.record_failure(LLMInvalidRequestError("bad prompt"))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(breaker, clock):
+    fail(breaker, 4)
+    clock.advance(10)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # the probe is still in flight
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_breaker(breaker, clock):
+    fail(breaker, 4)
+    clock.advance(10)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == 10
+
+
+def test_cancelled_probe_frees_the_half_open_slot(breaker, clock):
+    fail(breaker, 4)
+    clock.advance(10)
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+class FlakyLLM:
+    """Raises the given errors on successive calls, then streams "ok"."""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def astream_response(self, message, conversation_history, cached_content, usage):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        yield "ok"
+
+
+@pytest.fixture
+def retries(clock, monkeypatch):
+    """Three attempts without backoff and a fresh breaker."""
+    monkeypatch.setattr(llm_service, "retry_policy", RetryPolicy(attempts=3, base=0, cap=0))
+    monkeypatch.setattr(llm_service, "circuit_breaker", CircuitBreaker(min_calls=100))
+    return llm_service.retry_policy
+
+
+def generate(llm, timeout: float = 5.0) -> llm_service.LLMResult:
+    async def connected():
+        return False
+
+    return asyncio.run(llm_service.generate_with_deadline(llm, "hi", [], None, timeout, connected))
+
+
+def test_retryable_errors_are_retried(retries):
+    llm = FlakyLLM(ResourceExhausted("quota"), StatusError(503))
+    result = generate(llm)
+    assert result.text == "ok" and result.finish_reason == "stop"
+    assert llm.calls == 3
+
+
+def test_retries_stop_after_the_last_attempt(retries):
+    llm = FlakyLLM(*(ResourceExhausted("quota") for _ in range(3)))
+    with pytest.raises(LLMRateLimitError):
+        generate(llm)
+    assert llm.calls == retries.attempts
+
+
+def test_non_retryable_errors_fail_at_once(retries):
+    llm = FlakyLLM(InvalidArgument("bad prompt"))
+    with pytest.raises(LLMInvalidRequestError):
+        generate(llm)
+    assert llm.calls == 1
+
+
+def test_backoff_past_the_deadline_is_not_attempted(retries, monkeypatch):
+    monkeypatch.setattr(llm_service, "retry_policy", RetryPolicy(attempts=3, base=10, cap=10))
+    llm = FlakyLLM(StatusError(503))
+    with pytest.raises(LLMServerError):
+        generate(llm, timeout=5.0)
+    assert llm.calls == 1
+
+
+def test_open_breaker_skips_the_call(retries, monkeypatch):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+    monkeypatch.setattr(llm_service, "circuit_breaker", breaker)
+    first = FlakyLLM(*(StatusError(503) for _ in range(3)))
+    with pytest.raises(CircuitOpenError):
+        generate(first)  # the first failure opens the breaker, so the retry fails fast
+    assert first.calls == 1
+    llm = FlakyLLM()
+    with pytest.raises(CircuitOpenError):
+        generate(llm)
+    assert llm.calls == 0
@@ -0,0 +1,115 @@
+"""TTL and counter semantics shared by every SharedState backend."""
+
+import threading
+import pytest
+from backend.shared_state import FakeRedis, InMemoryState, RedisState, create_shared_state
+
+
+@pytest.fixture(params=["memory", "fakeredis"])
+def state(request, clock):
+    if request.param == "memory":
+        return InMemoryState()
+    return RedisState(FakeRedis())
+
+
+def test_get_missing_key(state):
+    assert state.get("missing") is None
+
+
+def test_set_without_ttl_never_expires(state, clock):
+    state.set("key", "value")
+    clock.advance(10 ** 6)
+    assert state.get("key") == "value"
+
+
+def test_set_with_ttl_expires(state, clock):
+    state.set("key", "value", ttl=10)
+    clock.advance(9.9)
+    assert state.get("key") == "value"
+    clock.advance(0.1)
+    assert state.get("key") is None
+
+
+def test_set_replaces_ttl(state, clock):
+    state.set("key", "old", ttl=5)
+    state.set("key", "new")
+    clock.advance(10)
+    assert state.get("key") == "new"
+
+
+def test_delete(state):
+    state.set("key", "value")
+    state.delete("key")
+    state.delete("key")
+    assert state.get("key") is None
+
+
+def test_incr_creates_and_counts(state):
+    assert state.incr("counter") == 1
+    assert state.incr("counter", 5) == 6
+    assert state.get("counter") == "6"
+
+
+def test_incr_ttl_is_a_fixed_window(state, clock):
+    # The ttl starts with the key; later increments don't extend it
+    state.incr("counter", ttl=10)
+    clock.advance(6)
+    assert state.incr("counter", ttl=10) == 2
+    clock.advance(4)
+    assert state.get("counter") is None
+    assert state.incr("counter", ttl=10) == 1
+
+
+def test_incr_ttl_applies_to_a_key_without_expiry(state, clock):
+    state.set("counter", "3")
+    assert state.incr("counter", ttl=10) == 4
+    clock.advance(10)
+    assert state.get("counter") is None
+
+
+def test_incr_keeps_an_existing_expiry(state, clock):
+    state.set("counter", "3", ttl=5)
+    assert state.incr("counter", ttl=60) == 4
+    clock.advance(5)
+    assert state.get("counter") is None
+
+
+def test_incr_without_ttl_keeps_expiry(state, clock):
+    state.incr("counter", ttl=10)
+    state.incr("counter")
+    clock.advance(10)
+    assert state.get("counter") is None
+
+
+def test_concurrent_incr_loses_nothing(state):
+    def work():
+        for _ in range(500):
+            state.incr("counter", ttl=60)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state.get("counter") == "4000"
+
+
+def test_fake_redis_pipeline_runs_queued_commands(clock):
+    client = FakeRedis()
+    pipeline = client.pipeline(transaction=True)
+    pipeline.incrby("counter", 2)
+    pipeline.pexpire("counter", 1000, nx=True)
+    pipeline.pexpire("counter", 60000, nx=True)
+    assert client.get("counter") is None  # nothing runs before execute()
+    assert pipeline.execute() == [2, True, False]
+    clock.advance(1)
+    assert client.get("counter") is None
+
+
+def test_create_shared_state():
+    assert isinstance(create_shared_state("memory://"), InMemoryState)
+    assert isinstance(create_shared_state("fakeredis://"), RedisState)
+    assert create_shared_state("memory://").is_shared is False
+    assert create_shared_state("fakeredis://").is_shared is True
+    with pytest.raises(ValueError):
+        create_shared_state("memcached://localhost")
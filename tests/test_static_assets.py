@@ -0,0 +1,35 @@
+"""The precompressed frontend shell: one ETag per encoding, revalidated per variant."""
+
+
+def get_shell(client, accept_encoding: str, if_none_match: str = None):
+    headers = {"Accept-Encoding": accept_encoding}
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+    return client.get("/", headers=headers)
+
+
+def test_each_encoding_has_its_own_etag(client):
+    plain = get_shell(client, "identity")
+    gzipped = get_shell(client, "gzip")
+    assert "content-encoding" not in plain.headers
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert plain.headers["etag"] != gzipped.headers["etag"]
+    assert gzipped.headers["etag"].endswith('-gzip"')
+    assert plain.text == gzipped.text
+
+
+def test_matching_etag_is_not_modified(client):
+    etag = get_shell(client, "gzip").headers["etag"]
+    response = get_shell(client, "gzip", etag)
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert get_shell(client, "gzip", f"W/{etag}").status_code == 304
+
+
+def test_etag_of_another_encoding_gets_the_full_body(client):
+    # A cached gzip body is no use to a client that no longer accepts gzip
+    gzip_etag = get_shell(client, "gzip").headers["etag"]
+    response = get_shell(client, "identity", gzip_etag)
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.text.lstrip().lower().startswith("<!doctype html")
@@ -0,0 +1,214 @@
+"""Usage ledger rollups and daily quotas, on a scratch database per test."""
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from backend import usage
+from backend.migrations import upgrade
+from backend.models import UsageDaily, UsageHourly, UsageRollupState, User
+from backend.shared_state import InMemoryState
+from backend.usage import (
+    USAGE_ROLLUP_SETTLE_SECONDS, QuotaExceededError, QuotaTracker, UsageRoller, record_usage, roll_up,
+    tokens_used_today,
+)
+
+NOW = datetime(2026, 10, 19, 12, 30)
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'usage.db'}")
+    upgrade(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(usage, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def db(sessions):
+    db = sessions()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def users(db):
+    ids = [
+        db.execute(insert(User).values(
+            username=f"user{i}", email=f"user{i}@example.com", hashed_password="x"
+        ).returning(User.id)).scalar()
+        for i in range(2)
+    ]
+    db.commit()
+    return ids
+
+
+def record(db, user_id: int, prompt: int, completion: int, at: datetime):
+    record_usage(db, user_id, prompt, completion, at=at)
+    db.commit()
+
+
+def rollups(db, table) -> dict:
+    return {
+        (row.user_id, row.bucket_start): (row.prompt_tokens, row.completion_tokens, row.message_count)
+        for row in db.scalars(select(table))
+    }
+
+
+def watermark(db) -> int:
+    return db.execute(select(UsageRollupState.last_ledger_id)).scalar()
+
+
+def test_roll_up_buckets_by_user_hour_and_day(db, users):
+    alice, bob = users
+    record(db, alice, 10, 1, NOW.replace(hour=9, minute=5))
+    record(db, alice, 20, 2, NOW.replace(hour=9, minute=55))
+    record(db, alice, 30, 3, NOW.replace(hour=10))
+    record(db, bob, 40, 4, NOW.replace(hour=9))
+
+    assert roll_up(db, now=NOW) == 4
+    day = NOW.replace(hour=0, minute=0)
+    assert rollups(db, UsageHourly) == {
+        (alice, NOW.replace(hour=9, minute=0)): (30, 3, 2),
+        (alice, NOW.replace(hour=10, minute=0)): (30, 3, 1),
+        (bob, NOW.replace(hour=9, minute=0)): (40, 4, 1),
+    }
+    assert rollups(db, UsageDaily) == {(alice, day): (60, 6, 3), (bob, day): (40, 4, 1)}
+
+
+def test_entries_are_counted_once(db, users):
+    alice = users[0]
+    record(db, alice, 10, 1, NOW - timedelta(hours=1))
+    assert roll_up(db, now=NOW) == 1
+    assert roll_up(db, now=NOW) == 0
+
+    record(db, alice, 5, 5, NOW - timedelta(minutes=1))
+    assert roll_up(db, now=NOW) == 1
+    assert rollups(db, UsageDaily) == {(alice, NOW.replace(hour=0, minute=0)): (15, 6, 2)}
+    assert watermark(db) == 2
+
+
+def test_unsettled_entries_wait_for_the_next_pass(db, users):
+    alice = users[0]
+    record(db, alice, 10, 0, NOW - timedelta(minutes=1))
+    record(db, alice, 20, 0, NOW - timedelta(seconds=USAGE_ROLLUP_SETTLE_SECONDS - 1))
+    record(db, alice, 30, 0, NOW - timedelta(minutes=2))  # lower timestamp, higher id
+    # Stops at the first unsettled entry, so the watermark never skips one
+    assert roll_up(db, now=NOW) == 1
+    assert watermark(db) == 1
+    assert roll_up(db, now=NOW + timedelta(seconds=USAGE_ROLLUP_SETTLE_SECONDS)) == 2
+    assert rollups(db, UsageDaily)[alice, NOW.replace(hour=0, minute=0)] == (60, 0, 3)
+
+
+def test_batches_advance_the_watermark(db, users):
+    for minute in range(5):
+        record(db, users[0], 1, 1, NOW - timedelta(hours=1, minutes=minute))
+    assert roll_up(db, batch_size=2, now=NOW) == 2
+    assert watermark(db) == 2
+    assert roll_up(db, batch_size=2, now=NOW) == 2
+    assert roll_up(db, batch_size=2, now=NOW) == 1
+    assert rollups(db, UsageDaily)[users[0], NOW.replace(hour=0, minute=0)] == (5, 5, 5)
+
+
+class _Interleaved:
+    """A session that runs `between` right after its first statement (the watermark read)."""
+
+    def __init__(self, db, between):
+        self._db = db
+        self._between = between
+
+    def execute(self, *args, **kwargs):
+        if self._between is None:
+            return self._db.execute(*args, **kwargs)
+        result = self._db.execute(*args, **kwargs).freeze()
+        between, self._between = self._between, None
+        between()
+        return result()
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def test_concurrent_rollers_do_not_double_count(sessions, db, users):
+    record(db, users[0], 10, 1, NOW - timedelta(hours=1))
+    record(db, users[0], 20, 2, NOW - timedelta(hours=1))
+    other = sessions()
+    try:
+        counted_first = []
+        late = _Interleaved(db, lambda: counted_first.append(roll_up(other, now=NOW)))
+        # Both read watermark 0; the other roller claims the range first
+        assert roll_up(late, now=NOW) == 0
+        assert counted_first == [2]
+    finally:
+        other.close()
+    assert rollups(db, UsageDaily)[users[0], NOW.replace(hour=0, minute=0)] == (30, 3, 2)
+
+
+def test_tokens_used_today_adds_pending_entries_to_the_rollup(db, users):
+    alice, bob = users
+    record(db, alice, 100, 100, NOW - timedelta(days=1))  # yesterday
+    record(db, alice, 10, 1, NOW - timedelta(hours=2))
+    record(db, bob, 50, 50, NOW - timedelta(hours=2))
+    roll_up(db, now=NOW)
+    record(db, alice, 20, 2, NOW - timedelta(minutes=1))
+    assert tokens_used_today(db, alice, now=NOW) == 33
+    roll_up(db, now=NOW)
+    assert tokens_used_today(db, alice, now=NOW) == 33
+    assert tokens_used_today(db, bob, now=NOW) == 100
+
+
+def test_roller_catches_up_in_batches(db, users):
+    for minute in range(5):
+        record(db, users[0], 1, 0, datetime.utcnow() - timedelta(minutes=minute + 1))
+    roller = UsageRoller(interval=0, batch_size=2)
+    assert roller.run_once() == 5
+    assert roller.run_once() == 0
+    assert roller.last_run is not None
+
+
+@pytest.fixture
+def tracker(clock):
+    return QuotaTracker(daily_limit=100, reconcile_seconds=300, state=InMemoryState())
+
+
+def test_quota_allows_usage_below_the_limit(tracker, db, users):
+    record(db, users[0], 60, 39, datetime.utcnow())
+    tracker.check(db, users[0])
+    assert tracker.used(db, users[0]) == 99
+
+
+def test_quota_rejects_once_used_up(tracker, db, users):
+    tracker.check(db, users[0])  # loads the counter (0)
+    tracker.record(users[0], 100)
+    with pytest.raises(QuotaExceededError) as error:
+        tracker.check(db, users[0])
+    assert error.value.used == 100 and error.value.limit == 100
+    assert 0 < error.value.retry_after <= 24 * 3600
+    tracker.check(db, users[1])
+
+
+def test_quota_counter_is_reconciled_with_the_database(tracker, db, users, clock):
+    tracker.check(db, users[0])
+    # Usage recorded by another worker only shows after the counter expires
+    record(db, users[0], 100, 0, datetime.utcnow())
+    tracker.check(db, users[0])
+    clock.advance(300)
+    with pytest.raises(QuotaExceededError):
+        tracker.check(db, users[0])
+
+
+def test_quota_record_without_a_counter_is_left_to_the_database(tracker, db, users):
+    # The next check loads the total from the ledger, which includes this call
+    tracker.record(users[0], 50)
+    record(db, users[0], 50, 0, datetime.utcnow())
+    assert tracker.used(db, users[0]) == 50
+
+
+def test_disabled_quota_never_rejects(db, users):
+    tracker = QuotaTracker(daily_limit=0, state=InMemoryState())
+    record(db, users[0], 10 ** 9, 0, datetime.utcnow())
+    tracker.check(db, users[0])
+    tracker.record(users[0], 10 ** 9)
+    assert tracker.state.get(tracker._key(users[0], datetime.utcnow())) is None